@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Admission control for OpenAI requests
+Token buckets matching the model's requests-per-minute and tokens-per-minute limits,
+with a bounded queue served round-robin across users
+"""
+
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a request arrives while the admission queue is at its limit"""
+
+
+class TokenBucket:
+    """Budget that refills continuously at per_minute, up to capacity (default: a minute's worth)"""
+
+    def __init__(self, per_minute: float, now: float, capacity: float = None):
+        self.capacity = per_minute if capacity is None else capacity
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (after refill)"""
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class _Waiter:
+    __slots__ = ("tokens", "future")
+
+    def __init__(self, tokens: int, future):
+        self.tokens = tokens
+        self.future = future
+
+
+class AdmissionController:
+    """Lets OpenAI requests through only when both RPM and TPM budgets allow.
+
+    Requests that do not fit wait in per-user FIFO queues that are served
+    round-robin, so one chatty user cannot starve the others; once
+    max_queue requests are waiting new ones are rejected with QueueFullError.
+    """
+
+    def __init__(self, rpm: int, tpm: int, max_queue: int = 200):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_queue = max_queue
+        self._requests = None
+        self._tokens = None
+        self._queues = {}  # user_id -> deque of _Waiter
+        self._ring = deque()  # users with waiting requests, in serving order
+        self._timer = None
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    async def acquire(self, user_id, tokens: int, on_queued=None):
+        """Wait until a request of about tokens tokens may be sent for user_id.
+
+        on_queued, if given, is awaited with the 1-based queue position when
+        the request has to wait. Cancelling the caller leaves the queue.
+        """
+        loop = asyncio.get_running_loop()
+        self._start_buckets(loop.time())
+        tokens = min(tokens, self.tpm)  # an oversized request would otherwise wait forever
+
+        if not self._ring and self._try_consume(tokens, loop.time()):
+            self.admitted += 1
+            return
+
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(f"{self.queued} requests already waiting")
+
+        waiter = _Waiter(tokens, loop.create_future())
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+            self._ring.append(user_id)
+        queue.append(waiter)
+        self.queued += 1
+        position = self.queued
+        self._schedule()
+
+        if on_queued is not None and not waiter.future.done():
+            try:
+                await on_queued(position)
+            except Exception as e:
+                logger.warning(f"Failed to notify user {user_id} about queue position: {e}")
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if not waiter.future.done() or waiter.future.cancelled():
+                self._remove(user_id, waiter)
+            raise
+
+    def try_acquire(self, tokens: int, reserve: float = 0.0) -> bool:
+        """Admit a low-priority request only if it fits right now; it never waits or queues.
+
+        Nothing is admitted while users are waiting, and reserve (a share of
+        each budget) is left untouched for the requests users are waiting on.
+        """
+        now = asyncio.get_running_loop().time()
+        self._start_buckets(now)
+        if self._ring or not self._try_consume(tokens, now, reserve):
+            return False
+        self.admitted += 1
+        return True
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        return {"queued": self.queued, "admitted": self.admitted, "rejected": self.rejected}
+
+    def _start_buckets(self, now: float):
+        if self._requests is None:
+            self._requests = TokenBucket(self.rpm, now)
+            self._tokens = TokenBucket(self.tpm, now)
+
+    def _try_consume(self, tokens: int, now: float, reserve: float = 0.0) -> bool:
+        self._requests.refill(now)
+        self._tokens.refill(now)
+        if (self._requests.level >= 1 + reserve * self._requests.capacity
+                and self._tokens.level >= tokens + reserve * self._tokens.capacity):
+            self._requests.level -= 1
+            self._tokens.level -= tokens
+            return True
+        return False
+
+    def _schedule(self):
+        """Admit queued requests in round-robin order while the budget allows"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        loop = asyncio.get_running_loop()
+        while self._ring:
+            user_id = self._ring[0]
+            queue = self._queues[user_id]
+            waiter = queue[0]
+            if waiter.future.done():
+                # Caller was cancelled; _remove() finds nothing left to do
+                queue.popleft()
+                self.queued -= 1
+            elif self._try_consume(waiter.tokens, loop.time()):
+                queue.popleft()
+                self.queued -= 1
+                self.admitted += 1
+                waiter.future.set_result(None)
+            else:
+                delay = max(self._requests.wait_time(1), self._tokens.wait_time(waiter.tokens))
+                self._timer = loop.call_later(delay, self._schedule)
+                return
+            self._ring.popleft()
+            if queue:
+                self._ring.append(user_id)
+            else:
+                del self._queues[user_id]
+
+    def _remove(self, user_id, waiter: _Waiter):
+        queue = self._queues.get(user_id)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self.queued -= 1
+        if not queue:
+            del self._queues[user_id]
+            self._ring.remove(user_id)
+        self._schedule()
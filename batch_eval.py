@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Batch evaluation for the Financial Advisor Bot
+Runs multi-turn conversations from a JSONL file through the bot's get_ai_response pipeline concurrently and writes
+answers with per-turn latency and token usage to JSONL, resuming after a crash where it left off
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+import bot as bot_module
+from bot import FinancialAdvisorBot
+from load_test import percentile
+from tracing import Tracer
+
+
+def read_items(path: str) -> list:
+    """Conversations from a JSONL file.
+
+    Each line is {"id": ..., "turns": ["question", "follow-up", ...]} or
+    {"id": ..., "question": "..."}; other keys (expected answer, tags) are
+    copied to the result. Lines without an id are identified by line number.
+    """
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            turns = item.pop("turns", None) or [item.pop("question", None)]
+            if not all(isinstance(turn, str) and turn for turn in turns):
+                raise ValueError(f"{path}:{number}: expected a non-empty 'turns' list or 'question'")
+            item["id"] = str(item.get("id", number))
+            items.append((item, turns))
+    return items
+
+
+def completed_ids(path: str) -> set:
+    """Ids already answered successfully in an earlier run's output; a torn last line is ignored"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def end_last_line(path: str):
+    """Terminate a record torn by a crash so the next result starts on its own line"""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+def turn_usage(trace, question: str, answer: str, seconds: float) -> dict:
+    """Result of one turn from the spans get_ai_response recorded"""
+    spans = {name: attributes for name, _, _, attributes in trace.spans}
+    errors = [attributes["error"] for attributes in spans.values() if "error" in attributes]
+    result = {"question": question, "answer": answer, "latency_s": round(seconds, 3)}
+    if trace.attributes.get("cache_hit"):
+        result["cache_hit"] = True
+    elif errors or "openai" not in spans:
+        # get_ai_response answers failures with an apology instead of raising
+        result["error"] = errors[0] if errors else "not sent"
+    else:
+        openai_span = spans["openai"]
+        result["model"] = openai_span["model"]  # the model that answered, also when a hedge won
+        result["prompt_tokens"] = openai_span["prompt_tokens"]
+        result["completion_tokens"] = openai_span["completion_tokens"]
+    return result
+
+
+class BatchEvaluator:
+    """Answers conversations with a FinancialAdvisorBot, concurrency items at a time.
+
+    Every conversation gets its own user id, so turns build on each other
+    exactly as in Telegram. Results are appended to the output as items
+    finish; items whose last record is not "ok" run again on the next run.
+    """
+
+    def __init__(self, bot: FinancialAdvisorBot, output: str, concurrency: int = 8):
+        self.bot = bot
+        self.output = output
+        self.concurrency = concurrency
+        self.tracer = Tracer(sample_rate=0.0)  # spans are read back, not logged
+        self.results = []
+        self._file = None
+
+    async def run(self, items: list, skip: set = frozenset()) -> list:
+        """Evaluate items not in skip; return their result records"""
+        pending = [(user_id, item, turns) for user_id, (item, turns) in enumerate(items, 1) if item["id"] not in skip]
+        queue = asyncio.Queue()
+        for entry in pending:
+            queue.put_nowait(entry)
+        with open(self.output, "a", encoding="utf-8") as self._file:
+            await asyncio.gather(*(self._work(queue, len(pending)) for _ in range(min(self.concurrency, len(pending)))))
+        return self.results
+
+    async def _work(self, queue: asyncio.Queue, total: int):
+        while not queue.empty():
+            user_id, item, turns = queue.get_nowait()
+            record = await self.evaluate(user_id, item, turns)
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self.results.append(record)
+            mark = "✅" if record["status"] == "ok" else "❌"
+            print(f"{mark} {len(self.results)}/{total} {record['id']} ({record['latency_s']:.1f}s)", file=sys.stderr)
+
+    async def evaluate(self, user_id: int, item: dict, turns: list) -> dict:
+        """Run one conversation turn by turn"""
+        results = []
+        for question in turns:
+            trace = self.tracer.start("batch", user_id=user_id)
+            started = time.perf_counter()
+            with self.tracer.activate(trace):
+                answer = await self.bot.get_ai_response(question, user_id)
+            results.append(turn_usage(trace, question, answer, time.perf_counter() - started))
+            if "error" in results[-1]:
+                break  # later turns would build on an apology
+        self.bot.user_conversations.clear(user_id)
+        return {
+            **item,
+            "status": "error" if "error" in results[-1] else "ok",
+            "turns": results,
+            "latency_s": round(sum(turn["latency_s"] for turn in results), 3),
+            "prompt_tokens": sum(turn.get("prompt_tokens", 0) for turn in results),
+            "completion_tokens": sum(turn.get("completion_tokens", 0) for turn in results),
+            "model": bot_module.OPENAI_MODEL,
+            "fallback_turns": sum(turn.get("model", bot_module.OPENAI_MODEL) != bot_module.OPENAI_MODEL for turn in results),
+            "prompt_version": self.bot.prompt_version,
+        }
+
+
+async def run_batch(args) -> dict:
+    """Evaluate args.input into args.output with the bot as configured in the bot module; return a summary"""
+    items = read_items(args.input)
+    skip = completed_ids(args.output) if not args.restart else set()
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    end_last_line(args.output)
+
+    bot = FinancialAdvisorBot()
+    evaluator = BatchEvaluator(bot, args.output, concurrency=args.concurrency)
+    started = time.perf_counter()
+    await bot.llm.open(warm_connections=min(args.concurrency, bot_module.OPENAI_WARM_CONNECTIONS))
+    try:
+        results = await evaluator.run(items, skip)
+    finally:
+        await bot.post_shutdown(None)
+    elapsed = time.perf_counter() - started
+
+    latencies = [turn["latency_s"] for record in results for turn in record["turns"] if "error" not in turn]
+    return {
+        "items": len(items),
+        "skipped": len(skip & {item["id"] for item, _ in items}),
+        "ok": sum(record["status"] == "ok" for record in results),
+        "failed": sum(record["status"] != "ok" for record in results),
+        "elapsed_s": round(elapsed, 3),
+        "turn_latency_s": {f"p{q}": round(percentile(latencies, q / 100), 3) for q in (50, 95)},
+        "prompt_tokens": sum(record["prompt_tokens"] for record in results),
+        "completion_tokens": sum(record["completion_tokens"] for record in results),
+        "prompt_version": bot.prompt_version,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("input", help="JSONL file of conversations")
+    parser.add_argument("output", help="JSONL results; existing successful items are skipped")
+    parser.add_argument("--concurrency", type=int, default=8, help="conversations evaluated at once")
+    parser.add_argument("--restart", action="store_true", help="discard earlier results instead of resuming")
+    parser.add_argument("--prompt-file", default=None, help="use this system prompt instead of FINANCIAL_ADVISOR_PROMPT")
+    parser.add_argument("--model", default=None, help="OPENAI_MODEL for the answers")
+    parser.add_argument("--cache", action="store_true", help="allow first-turn answers from the response cache")
+    parser.add_argument("--hedge", action="store_true",
+                        help="keep hedging slow answers with OPENAI_FALLBACK_MODEL; each turn records the model that answered")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's INFO logging")
+    return parser
+
+
+def configure_bot(args):
+    """Evaluate with an in-memory history and, unless asked, without the response cache or hedging.
+
+    Without hedging every answer comes from the model under evaluation
+    instead of a mix with the fallback model.
+    """
+    bot_module.CONVERSATION_DB = ""
+    bot_module.STREAM_REPLIES = False
+    if not args.hedge:
+        bot_module.OPENAI_FALLBACK_MODEL = ""
+    if not args.cache:
+        bot_module.RESPONSE_CACHE_SIZE = 0
+    if args.model:
+        bot_module.OPENAI_MODEL = args.model
+    if args.prompt_file:
+        with open(args.prompt_file, encoding="utf-8") as f:
+            bot_module.FINANCIAL_ADVISOR_PROMPT = f.read().strip()
+
+
+def main():
+    """Run the batch and print a summary"""
+    args = build_parser().parse_args()
+    configure_bot(args)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+    summary = asyncio.run(run_batch(args))
+    print(json.dumps(summary, ensure_ascii=False))
+    if summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
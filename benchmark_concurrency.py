@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for the Financial Advisor Bot
+Measures handle_message throughput and time to first visible text with 1, 10 and 100
+simulated users against a fake slow OpenAI backend
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock
+
+import bot as bot_module
+from admission import AdmissionController
+from bot import FinancialAdvisorBot
+from load_test import percentile
+
+
+def make_backend(latency: float, tokens: int):
+    """Fake OpenAI backend: waits latency for the first token, then streams the rest"""
+    async def chunks():
+        await asyncio.sleep(latency)
+        for _ in range(tokens):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta={"content": "слово "})])
+            await asyncio.sleep(0.01)
+
+    async def backend(stream=False, **kwargs):
+        if stream:
+            return chunks()
+        await asyncio.sleep(latency + tokens * 0.01)
+        message = SimpleNamespace(content="слово " * tokens)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    return backend
+
+
+def make_update(user_id: int, first_text: list, started: list):
+    """Minimal stand-in for a Telegram text update that records when text becomes visible"""
+    def record(*args, **kwargs):
+        if len(first_text) < len(started):
+            first_text.append(time.perf_counter() - started[-1])
+
+    async def reply_text(*args, **kwargs):
+        if not bot_module.STREAM_REPLIES:
+            record()
+        return sent
+
+    sent = Mock()
+    sent.edit_text = AsyncMock(side_effect=record)
+    update = Mock()
+    update.effective_user.id = user_id
+    update.effective_chat.id = user_id
+    update.message.chat_id = user_id
+    update.message.text = "С чего начать?"
+    update.message.reply_text = reply_text
+    return update
+
+
+async def run_users(bot: FinancialAdvisorBot, users: int, messages_per_user: int):
+    """Drive handle_message for all users concurrently; return elapsed seconds and first-text latencies"""
+    context = Mock()
+    context.bot.send_chat_action = AsyncMock()
+    latencies = []
+
+    async def user_session(user_id):
+        first_text, started = [], []
+        update = make_update(user_id, first_text, started)
+        for _ in range(messages_per_user):
+            started.append(time.perf_counter())
+            await bot.handle_message(update, context)
+        latencies.extend(first_text)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(user_id) for user_id in range(users)))
+    return time.perf_counter() - started, latencies
+
+
+def main():
+    """Run the benchmark and print a summary table"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.5, help="fake OpenAI latency to first token, seconds")
+    parser.add_argument("--tokens", type=int, default=50, help="tokens per answer, streamed every 10 ms")
+    parser.add_argument("--messages", type=int, default=3, help="messages sent by each user")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--no-stream", action="store_true", help="send whole answers instead of streaming")
+    args = parser.parse_args()
+
+    bot_module.STREAM_REPLIES = not args.no_stream
+    bot_module.STREAM_EDIT_INTERVAL = 0.2
+    bot_module.COALESCE_WINDOW = 0  # each simulated message waits for its answer
+    bot_module.CONVERSATION_DB = ""  # every run starts from empty histories
+    mode = "whole answers" if args.no_stream else "streaming"
+    print(f"🚀 handle_message throughput ({mode}), fake backend latency {args.latency}s + {args.tokens} tokens")
+    print(f"{'users':>6} {'messages':>9} {'elapsed, s':>11} {'msg/s':>8} {'first text p50':>15} {'p95':>7}")
+    for users in args.users:
+        bot = FinancialAdvisorBot()
+        bot.openai_available = True
+        bot.response_cache = None  # every simulated user asks the same question
+        bot.admission = AdmissionController(rpm=10**6, tpm=10**9)  # the fake backend has no rate limits
+        bot.llm.backend = make_backend(args.latency, args.tokens)
+        elapsed, latencies = asyncio.run(run_users(bot, users, args.messages))
+        total = users * args.messages
+        p50 = statistics.median(latencies)
+        p95 = percentile(latencies, 0.95)
+        print(f"{users:>6} {total:>9} {elapsed:>11.2f} {total / elapsed:>8.1f} {p50:>14.2f}s {p95:>6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Conversation memory benchmark for the Financial Advisor Bot
+Compares bytes per user of plain message-dict histories against the compact ConversationStore representation
+"""
+
+import argparse
+import gc
+import random
+import tracemalloc
+
+from conversation_store import ConversationStore
+
+SYSTEM_PROMPT = "Ты — русскоязычный финансовый помощник для иммигрантов в США. " * 40
+QUESTIONS = (
+    "Как правильно планировать пенсионные накопления в США?",
+    "Нужна ли мне страховка жизни, если у меня двое детей?",
+    "Как накопить на колледж для ребёнка?",
+    "Что такое 401(k) и стоит ли в него вкладывать?",
+)
+SENTENCES = (
+    "Краткий обзор: у вас стабильный доход и семья, поэтому первым шагом стоит защитить доход.",
+    "Страхование жизни term покрывает период, пока дети не станут самостоятельными.",
+    "Далее — пенсионные счета 401(k) и IRA с налоговыми льготами, затем план 529 на образование.",
+    "Резервный фонд на 3–6 месяцев расходов лучше держать на высокодоходном сберегательном счёте.",
+    "Если работодатель добавляет взносы в 401(k), вносите как минимум столько, чтобы получить их полностью.",
+    "Roth IRA подходит, если вы ожидаете более высокую налоговую ставку на пенсии.",
+    "Страховка по нетрудоспособности защищает доход, если вы не сможете работать из-за болезни.",
+    "Завещание и доверительный фонд помогают передать капитал детям без долгого судебного процесса.",
+)
+
+
+class FixedCounter:
+    """Token counter stub: counting cost is not what this benchmark measures"""
+
+    def count_message(self, message: dict) -> int:
+        return len(message["content"]) // 2
+
+
+def make_turns(user_id: int, turns: int, answer_sentences: int, rng: random.Random) -> list:
+    """Distinct messages of one user as (role, UTF-8 content).
+
+    Decoding inside the measurement allocates the text the way messages
+    arriving from Telegram and OpenAI would.
+    """
+    messages = []
+    for turn in range(turns):
+        question = f"{rng.choice(QUESTIONS)} (клиент {user_id}, вопрос {turn})"
+        answer = " ".join(rng.choice(SENTENCES) for _ in range(answer_sentences))
+        messages.append(("user", question.encode("utf-8")))
+        messages.append(("assistant", f"Ответ {turn} для клиента {user_id}. {answer}".encode("utf-8")))
+    return messages
+
+
+def measure(build, users: int, turns: int, answer_sentences: int, seed: int) -> float:
+    """Bytes allocated per user by build(histories) holding every user's history"""
+    rng = random.Random(seed)
+    histories = [make_turns(user_id, turns, answer_sentences, rng) for user_id in range(users)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    keep = build(histories)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del keep
+    return used / users
+
+
+def build_dicts(histories: list):
+    """Plain layout: per user a list of message dicts headed by its own system prompt dict"""
+    conversations = {}
+    for user_id, history in enumerate(histories):
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        messages.extend({"role": role, "content": content.decode("utf-8")} for role, content in history)
+        conversations[user_id] = messages
+    return conversations
+
+
+def build_store(compress_after):
+    def build(histories: list):
+        store = ConversationStore(SYSTEM_PROMPT, FixedCounter(), token_budget=10**9, max_users=10**9,
+                                  max_bytes=2**62, compress_after=compress_after)
+        for user_id, history in enumerate(histories):
+            for role, content in history:
+                store.append(user_id, role, content.decode("utf-8"))
+        return store
+    return build
+
+
+def main():
+    """Run the benchmark and print bytes per user for each layout"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--turns", type=int, default=6, help="question/answer pairs per user")
+    parser.add_argument("--answer-sentences", type=int, default=12, help="sentences per answer (~90 characters each)")
+    parser.add_argument("--compress-after", type=int, default=4, help="newest messages kept uncompressed")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"🧠 {args.users} users × {args.turns} turns, {args.answer_sentences} sentences per answer")
+    layouts = (
+        ("message dicts", build_dicts),
+        ("compact store", build_store(None)),
+        (f"compact, compress >{args.compress_after}", build_store(args.compress_after)),
+    )
+    baseline = None
+    for name, build in layouts:
+        per_user = measure(build, args.users, args.turns, args.answer_sentences, args.seed)
+        baseline = baseline or per_user
+        print(f"{name:<28} {per_user:>10.0f} bytes/user ({per_user / baseline:.0%})")
+    print("Synthetic answers reuse a few sentences, so they compress better than real ones")
+
+
+if __name__ == "__main__":
+    main()
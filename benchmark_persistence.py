@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Persistence benchmark for the Financial Advisor Bot
+Compares conversation appends/sec with write-behind batching against one SQLite commit per append
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from conversation_backend import SQLiteBackend, WriteBehindBackend
+from conversation_store import ConversationStore
+from token_counter import TokenCounter
+
+MESSAGE = "Как правильно планировать пенсионные накопления в США? " * 4
+
+
+def remove_database(path: str):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def bench_commit_per_append(path: str, appends: int, users: int) -> float:
+    """Baseline: every append is its own transaction, as a naive synchronous store would do"""
+    backend = SQLiteBackend(path)
+    started = time.perf_counter()
+    for i in range(appends):
+        backend.write([("append", i % users, "user", MESSAGE, time.time())])
+    elapsed = time.perf_counter() - started
+    backend.close()
+    return elapsed
+
+
+async def bench_write_behind(path: str, appends: int, users: int):
+    """Appends through ConversationStore; returns hot-path seconds and seconds until durable"""
+    backend = WriteBehindBackend(SQLiteBackend(path))
+    store = ConversationStore("SYSTEM", TokenCounter("gpt-4"), token_budget=3000, backend=backend)
+    started = time.perf_counter()
+    for i in range(appends):
+        store.append(i % users, "user", MESSAGE)
+        if i % 100 == 0:
+            await asyncio.sleep(0)  # let the flusher run as it would between updates
+    hot_path = time.perf_counter() - started
+    await backend.close()
+    return hot_path, time.perf_counter() - started, backend.batches
+
+
+def main():
+    """Run the benchmark and print appends/sec"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--appends", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    handle, path = tempfile.mkstemp(suffix=".db")
+    os.close(handle)
+    try:
+        print(f"💾 {args.appends} appends across {args.users} users")
+        baseline = bench_commit_per_append(path, args.appends, args.users)
+        print(f"{'commit per append':<28} {args.appends / baseline:>10.0f} appends/s")
+        remove_database(path)
+
+        hot_path, durable, batches = asyncio.run(bench_write_behind(path, args.appends, args.users))
+        print(f"{'write-behind, hot path':<28} {args.appends / hot_path:>10.0f} appends/s")
+        print(f"{'write-behind, durable':<28} {args.appends / durable:>10.0f} appends/s ({batches} batches)")
+    finally:
+        remove_database(path)
+
+
+if __name__ == "__main__":
+    main()
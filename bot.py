@@ -6,13 +6,36 @@ Russian-speaking financial advisor for established immigrants in the USA
 
 import os
 import logging
+import signal
+from functools import partial
 import openai
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.constants import ParseMode
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, filters, ContextTypes
 from dotenv import load_dotenv
-import threading
+import asyncio
 import time
 
+from admission import AdmissionController, QueueFullError
+from circuit_breaker import CLOSED, STATE_VALUES, CircuitBreaker
+from conversation_backend import SQLiteBackend, WriteBehindBackend
+from conversation_store import ConversationStore
+from conversation_summarizer import ConversationSummarizer
+from follow_ups import FollowUpPrefetcher, extract_suggestions
+from llm_client import HedgedLLM, LLMClient
+from message_coalescer import MessageCoalescer
+from metrics import BotMetrics
+from response_cache import ResponseCache, prompt_version
+from sampling_profiler import SamplingProfiler
+from send_scheduler import CONTINUATION, FIRST, PRIORITY_NAMES, SendScheduler, split_message
+from sharding import ShardDispatcher
+from streaming_reply import StreamingReply
+from telegram_html import markdown_to_html
+from token_counter import TokenCounter, history_token_budget
+from tracing import Tracer, annotate, span
+from user_locks import UserLocks
+from web_server import WebServer
+
 # Load environment variables
 load_dotenv()
 
@@ -29,9 +52,97 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "8155289579:AAHG2OujfC2mnxcga4dp2GD
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "your-openai-api-key-here")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")  # or "gpt-3.5-turbo" for cost efficiency
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 50))  # global cap on in-flight requests
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 60))  # seconds per completion
+OPENAI_MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", 1000))  # reply length limit
+OPENAI_WARM_CONNECTIONS = int(os.getenv("OPENAI_WARM_CONNECTIONS", 4))  # keep-alive connections opened at startup
+OPENAI_KEEPALIVE = float(os.getenv("OPENAI_KEEPALIVE", 60))  # seconds an idle pooled connection stays open
+
+# Latency SLO: hedge slow requests with a faster model (empty OPENAI_FALLBACK_MODEL disables hedging)
+OPENAI_FALLBACK_MODEL = os.getenv("OPENAI_FALLBACK_MODEL", "gpt-3.5-turbo")
+OPENAI_HEDGE_AFTER = float(os.getenv("OPENAI_HEDGE_AFTER", 20))  # seconds without a whole answer
+OPENAI_HEDGE_FIRST_TOKEN_AFTER = float(os.getenv("OPENAI_HEDGE_FIRST_TOKEN_AFTER", 8))  # seconds without a token when streaming
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 0))  # 0 = per-model default
+
+# Circuit breaker: while OpenAI keeps failing, answer at once with a short reference answer instead of waiting for timeouts
+OPENAI_BREAKER_FAILURE_RATIO = float(os.getenv("OPENAI_BREAKER_FAILURE_RATIO", 0.5))  # share of failed or slow calls
+OPENAI_BREAKER_MIN_CALLS = int(os.getenv("OPENAI_BREAKER_MIN_CALLS", 10))  # calls in the window before it may open
+OPENAI_BREAKER_WINDOW = float(os.getenv("OPENAI_BREAKER_WINDOW", 30))  # seconds of outcomes considered
+OPENAI_BREAKER_SLOW_AFTER = float(os.getenv("OPENAI_BREAKER_SLOW_AFTER", 30))  # seconds to answer (or first token)
+OPENAI_BREAKER_OPEN_FOR = float(os.getenv("OPENAI_BREAKER_OPEN_FOR", 30))  # seconds before a trial request
+
+# OpenAI rate limits of the account for OPENAI_MODEL; requests beyond them wait in a fair queue
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", 500))  # requests per minute
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", 30000))  # tokens per minute
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 200))  # waiting requests before shedding load
+
+# Streaming replies: edit a placeholder message as tokens arrive
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() == "true"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", 1.0))  # min seconds between edits of one message
+
+# Telegram flood limits: sends and edits queue up to stay within them
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))  # messages per second across all chats
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))  # messages per second in one chat
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", 3))  # messages one chat may get at once
+
+# Updates of different users are handled concurrently (up to this many at once), each user's strictly in order
+TELEGRAM_CONCURRENT_UPDATES = int(os.getenv("TELEGRAM_CONCURRENT_UPDATES", 256))
+
+# Messages sent in a quick burst are merged into one turn (COALESCE_WINDOW=0 answers each separately)
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", 1.0))  # seconds of quiet that end a burst
+COALESCE_MAX_DELAY = float(os.getenv("COALESCE_MAX_DELAY", 3.0))  # longest wait after the first message
+
+# Follow-up suggestions: the [Button] labels that end answers become an inline keyboard
+FOLLOW_UP_BUTTONS = int(os.getenv("FOLLOW_UP_BUTTONS", 3))  # buttons per answer; 0 leaves them as text
+PREFETCH_FOLLOW_UPS = os.getenv("PREFETCH_FOLLOW_UPS", "false").lower() == "true"  # answer them in the background
+PREFETCH_MAX_IN_FLIGHT = int(os.getenv("PREFETCH_MAX_IN_FLIGHT", 4))  # background answers generated at once
+PREFETCH_RESERVE = float(os.getenv("PREFETCH_RESERVE", 0.5))  # share of RPM/TPM budget kept for users' own requests
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", 600))  # seconds a background answer stays usable
+
+# Conversation memory limits
+CONVERSATION_MAX_USERS = int(os.getenv("CONVERSATION_MAX_USERS", 10000))
+CONVERSATION_MAX_BYTES = int(os.getenv("CONVERSATION_MAX_BYTES", 64 * 1024 * 1024))
+CONVERSATION_IDLE_TTL = float(os.getenv("CONVERSATION_IDLE_TTL", 24 * 3600))  # seconds without messages
+CONVERSATION_COMPRESS_AFTER = int(os.getenv("CONVERSATION_COMPRESS_AFTER", 4))  # newest messages kept uncompressed; -1 disables
+
+# Persistent conversation storage (empty CONVERSATION_DB keeps history in memory only)
+CONVERSATION_DB = os.getenv("CONVERSATION_DB", "conversations.db")
+CONVERSATION_FLUSH_INTERVAL = float(os.getenv("CONVERSATION_FLUSH_INTERVAL", 0.5))  # seconds between batched writes
+
+# Rolling summaries: older turns of long conversations are condensed into a client profile (empty SUMMARY_MODEL disables)
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-3.5-turbo")
+# Tokens outside the kept messages that trigger a summary; 0 = a third of the history budget
+SUMMARY_AFTER_TOKENS = int(os.getenv("SUMMARY_AFTER_TOKENS", 0))
+SUMMARY_KEEP_MESSAGES = int(os.getenv("SUMMARY_KEEP_MESSAGES", 6))  # newest messages kept word for word
+
+# First-turn response cache (RESPONSE_CACHE_SIZE=0 disables it)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1000))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 24 * 3600))  # seconds
+RESPONSE_CACHE_REGENERATE = float(os.getenv("RESPONSE_CACHE_REGENERATE", 0.1))  # chance to ask the model anyway
 
 # Web server configuration for cloud deployment
 PORT = int(os.getenv("PORT", 8080))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # enables GET /debug/profile?seconds=N with "Authorization: Bearer <token>"
+
+# Tracing: one JSON log line per answered message with the time spent in each stage
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))  # share of traces logged
+TRACE_SLOW_AFTER = float(os.getenv("TRACE_SLOW_AFTER", 10))  # seconds; slower traces are always logged
+
+# Update delivery: "webhook" (needs a public WEBHOOK_URL) or "polling" for local development
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # e.g. https://your-app.up.railway.app
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # checked against X-Telegram-Bot-Api-Secret-Token
+BOT_MODE = os.getenv("BOT_MODE", "webhook" if WEBHOOK_URL else "polling")
+
+# Horizontal scaling: with SHARD_WORKERS set this process only dispatches updates to the workers
+# (bots started with BOT_MODE=worker, sharing CONVERSATION_DB), each user always to the same one
+SHARD_WORKERS = [url.strip().rstrip("/") for url in os.getenv("SHARD_WORKERS", "").split(",") if url.strip()]
+SHARD_HEALTH_INTERVAL = float(os.getenv("SHARD_HEALTH_INTERVAL", 2.0))  # seconds between worker /ready checks
+# Longest a moved user's updates wait for the previous worker to finish their turn (it normally says so sooner)
+SHARD_HANDOVER_TIMEOUT = float(os.getenv("SHARD_HANDOVER_TIMEOUT", 90.0))
+# Set on each worker: the workers share one OpenAI account and one bot token, so with BOT_MODE=worker
+# OPENAI_RPM, OPENAI_TPM and TELEGRAM_GLOBAL_RATE are split evenly between this many workers
+SHARD_WORKER_COUNT = int(os.getenv("SHARD_WORKER_COUNT", 1))
 
 # Financial Advisor System Prompt
 FINANCIAL_ADVISOR_PROMPT = """[РОЛЬ]  
@@ -82,11 +193,151 @@ FINANCIAL_ADVISOR_PROMPT = """[РОЛЬ]
 — Объяснение «почему это важно».  
 — В конце 2–3 кнопки для выбора следующего направления."""
 
+# Condenses older turns into the client profile kept after the system prompt
+SUMMARY_PROMPT = """Ты ведёшь заметки финансового консультанта. Обнови профиль клиента по предыдущему профилю и новой части диалога.
+Сохрани всё, что важно для дальнейших советов: доход, семья и дети, срок жизни в США, работа, цели и приоритеты,
+уже имеющиеся страховки и накопления, обсуждённые темы и данные рекомендации, открытые вопросы.
+Пиши кратко, списком фактов, не более 150 слов, без приветствий и выводов."""
+PROFILE_HEADER = "[ПРОФИЛЬ КЛИЕНТА] Кратко о предыдущей части консультации:"
+
+# Served while the OpenAI circuit is open: short reference answers for the three pillars, matched by word stems
+DEGRADED_NOTICE = (
+    "⚠️ AI-консультант сейчас недоступен, поэтому вот краткая справка по теме. "
+    "Повторите вопрос через несколько минут, чтобы получить персональный ответ.\n\n"
+)
+DEGRADED_TOPICS = (
+    (
+        ("страх", "защит", "жизн", "здоров", "инвалид", "нетрудоспособ", "уход", "болез", "семь"),
+        "**Финансовая защита семьи** — это фундамент плана. Обычно начинают с резервного фонда на 3–6 месяцев "
+        "расходов, затем страхуют жизнь (term life) на срок, пока дети не станут самостоятельными, и доход "
+        "на случай нетрудоспособности (disability). Позже стоит подумать о долгосрочном уходе (long-term care).",
+    ),
+    (
+        ("пенси", "401", "ira", "накоп", "сбереж", "колледж", "образован", "529", "инвест"),
+        "**Накопления** строятся после защиты семьи. Если работодатель добавляет взносы в 401(k), вносите как "
+        "минимум столько, чтобы получить их полностью. Дальше — Roth или Traditional IRA с налоговыми льготами, "
+        "а на образование детей — план 529.",
+    ),
+    (
+        ("наслед", "капитал", "завещ", "траст", "trust", "аннуитет", "передач", "передат", "сохран"),
+        "**Сохранение и передача капитала**: завещание и доверительный фонд (trust) помогают передать активы "
+        "детям без долгого судебного процесса, а аннуитеты дают пожизненный доход. Проверьте также "
+        "бенефициаров на всех счетах и полисах.",
+    ),
+)
+DEGRADED_FALLBACK = "Извините, AI-консультант временно недоступен. Пожалуйста, повторите вопрос через несколько минут."
+
+# Shown while a request waits for OpenAI rate-limit budget
+QUEUED_TEXT = "⏳ Сейчас много обращений. Вы {position}-й в очереди, ответ скоро будет…"
+
+# Callback data of follow-up buttons; the index points at the button whose label is the question
+FOLLOW_UP_PREFIX = "follow_up:"
+
 class FinancialAdvisorBot:
     """Simple Financial Advisor Bot with OpenAI ChatGPT integration"""
     
     def __init__(self):
-        self.user_conversations = {}  # Store conversation history for AI
+        # Store conversation history for AI, trimmed to the model's token budget
+        self.token_counter = TokenCounter(OPENAI_MODEL)
+        system_tokens = self.token_counter.count(FINANCIAL_ADVISOR_PROMPT)
+        backend = None
+        if CONVERSATION_DB:
+            backend = WriteBehindBackend(SQLiteBackend(CONVERSATION_DB), flush_interval=CONVERSATION_FLUSH_INTERVAL)
+            logger.info(f"💾 Conversation history persisted to {CONVERSATION_DB}")
+        self.user_conversations = ConversationStore(
+            FINANCIAL_ADVISOR_PROMPT,
+            token_counter=self.token_counter,
+            token_budget=history_token_budget(OPENAI_MODEL, system_tokens, OPENAI_MAX_TOKENS, HISTORY_TOKEN_BUDGET),
+            max_users=CONVERSATION_MAX_USERS,
+            max_bytes=CONVERSATION_MAX_BYTES,
+            idle_ttl=CONVERSATION_IDLE_TTL,
+            backend=backend,
+            compress_after=CONVERSATION_COMPRESS_AFTER if CONVERSATION_COMPRESS_AFTER >= 0 else None,
+            # Shard workers share CONVERSATION_DB, and a user may have been answered by another worker meanwhile
+            validate_versions=BOT_MODE == "worker",
+        )
+        self.summarizer = None
+        if SUMMARY_MODEL:
+            self.summarizer = ConversationSummarizer(
+                self.user_conversations,
+                self.summarize_conversation,
+                threshold_tokens=SUMMARY_AFTER_TOKENS or self.user_conversations.token_budget // 3,
+                keep_messages=SUMMARY_KEEP_MESSAGES,
+                on_result=lambda outcome: self.metrics.summaries.labels(outcome).inc(),
+            )
+        self.response_cache = None
+        if RESPONSE_CACHE_SIZE > 0:
+            self.response_cache = ResponseCache(
+                max_entries=RESPONSE_CACHE_SIZE,
+                ttl=RESPONSE_CACHE_TTL,
+                regenerate_probability=RESPONSE_CACHE_REGENERATE,
+            )
+        self.prompt_version = prompt_version(FINANCIAL_ADVISOR_PROMPT)
+        
+        # Health, readiness, stats, metrics and webhook endpoints share the event loop with the bot
+        self.metrics = BotMetrics()
+        self.tracer = Tracer(sample_rate=TRACE_SAMPLE_RATE, slow_after=TRACE_SLOW_AFTER)
+        self.web_server = WebServer(PORT, stats=self.stats, metrics=self.metrics.render, checks=self.readiness,
+                                    health=lambda: {"openai_circuit": self.breaker.state},
+                                    profiler=SamplingProfiler(), admin_token=ADMIN_TOKEN or None,
+                                    busy=self.is_busy)
+        self.web_server.on_update = self.tracer.received
+        self.application = None
+        self.bot_user = None  # set once the Telegram connection is initialized
+        self.llm = LLMClient(
+            model=OPENAI_MODEL,
+            max_concurrency=OPENAI_MAX_CONCURRENCY,
+            timeout=OPENAI_TIMEOUT,
+            max_tokens=OPENAI_MAX_TOKENS,
+            keepalive_timeout=OPENAI_KEEPALIVE,
+        )
+        self.metrics.openai_in_flight.callback = lambda: self.llm.in_flight
+        
+        # Completions go through the hedging policy when a fallback model is configured
+        self.completions = self.llm
+        if OPENAI_FALLBACK_MODEL and OPENAI_FALLBACK_MODEL != OPENAI_MODEL:
+            self.completions = HedgedLLM(
+                self.llm,
+                fallback_model=OPENAI_FALLBACK_MODEL,
+                hedge_after=OPENAI_HEDGE_AFTER,
+                first_token_after=OPENAI_HEDGE_FIRST_TOKEN_AFTER,
+                on_result=self.record_hedge,
+            )
+        self.breaker = CircuitBreaker(
+            failure_ratio=OPENAI_BREAKER_FAILURE_RATIO,
+            min_calls=OPENAI_BREAKER_MIN_CALLS,
+            window=OPENAI_BREAKER_WINDOW,
+            slow_after=OPENAI_BREAKER_SLOW_AFTER,
+            open_for=OPENAI_BREAKER_OPEN_FOR,
+        )
+        self.metrics.openai_circuit.callback = lambda: STATE_VALUES[self.breaker.state]
+        share = max(SHARD_WORKER_COUNT, 1) if BOT_MODE == "worker" else 1  # this process's part of the account limits
+        self.admission = AdmissionController(max(OPENAI_RPM // share, 1), max(OPENAI_TPM // share, 1),
+                                             max_queue=ADMISSION_MAX_QUEUE)
+        self.metrics.admission_queue.callback = lambda: self.admission.queued
+        self.outbound = SendScheduler(
+            rate=TELEGRAM_GLOBAL_RATE / share,
+            chat_rate=TELEGRAM_CHAT_RATE,
+            chat_burst=TELEGRAM_CHAT_BURST,
+            on_delay=lambda priority, seconds: self.metrics.outbound_delay.labels(PRIORITY_NAMES[priority]).observe(seconds),
+        )
+        self.metrics.outbound_queue.callback = lambda: self.outbound.queued
+        self.prefetcher = None
+        if PREFETCH_FOLLOW_UPS and FOLLOW_UP_BUTTONS > 0:
+            self.prefetcher = FollowUpPrefetcher(
+                self.prefetch_answer,
+                max_in_flight=PREFETCH_MAX_IN_FLIGHT,
+                ttl=PREFETCH_TTL,
+                max_users=CONVERSATION_MAX_USERS,
+                on_outcome=lambda outcome: self.metrics.prefetches.labels(outcome).inc(),
+            )
+        self.user_locks = UserLocks()  # one turn per user at a time; updates are processed concurrently
+        self.coalescer = MessageCoalescer(
+            self.answer_burst,
+            window=COALESCE_WINDOW,
+            max_delay=COALESCE_MAX_DELAY,
+            on_coalesced=self.metrics.coalesced_messages.inc,
+        )
         
         # Initialize OpenAI
         if OPENAI_API_KEY and OPENAI_API_KEY != "your-openai-api-key-here":
@@ -97,55 +348,199 @@ class FinancialAdvisorBot:
             self.openai_available = False
             logger.warning("⚠️ OpenAI API key not configured")
     
-    async def get_ai_response(self, user_message: str, user_id: int) -> str:
-        """Get AI response from OpenAI using the financial advisor system prompt"""
+    async def get_ai_response(self, user_message: str, user_id: int, on_partial=None, on_queued=None) -> str:
+        """Get AI response from OpenAI using the financial advisor system prompt
+
+        When on_partial is given the completion is streamed and the coroutine
+        is awaited with the accumulated text after every token. on_queued is
+        awaited with the queue position if rate limits make the request wait.
+        """
         if not self.openai_available:
             return "Извините, AI сервис временно недоступен. Пожалуйста, попробуйте позже."
         
         try:
-            # Get or create conversation history for this user
-            if user_id not in self.user_conversations:
-                self.user_conversations[user_id] = [
-                    {"role": "system", "content": FINANCIAL_ADVISOR_PROMPT}
-                ]
+            # Conversation so far (read from storage after a restart) plus the new user message
+            await self.user_conversations.load(user_id)
+            messages = self.user_conversations.messages(user_id)
+            messages.append({"role": "user", "content": user_message})
             
-            # Add user message to conversation
-            self.user_conversations[user_id].append({"role": "user", "content": user_message})
+            # A tapped follow-up button may have been answered in the background already
+            if self.prefetcher is not None:
+                prefetched = await self.prefetcher.take(user_id, user_message)
+                annotate(prefetch_hit=prefetched is not None)
+                if prefetched is not None:
+                    self.user_conversations.append(user_id, "user", user_message)
+                    self.user_conversations.append(user_id, "assistant", prefetched)
+                    if on_partial is not None:
+                        await on_partial(prefetched)
+                    if self.summarizer is not None:
+                        self.summarizer.maybe_summarize(user_id)
+                    return prefetched
             
-            # Get AI response
-            response = openai.ChatCompletion.create(
-                model=OPENAI_MODEL,
-                messages=self.user_conversations[user_id],
-                max_tokens=1000,
-                temperature=0.7
-            )
+            # First turns have identical context for everyone, so their answers can be reused
+            cache_key = None
+            if self.response_cache is not None and len(messages) == 2:
+                cache_key = ResponseCache.key(user_message, OPENAI_MODEL, self.prompt_version)
+                cached_response = self.response_cache.get(cache_key)
+                annotate(cache_hit=cached_response is not None)
+                if cached_response is not None:
+                    self.user_conversations.append(user_id, "user", user_message)
+                    self.user_conversations.append(user_id, "assistant", cached_response)
+                    return cached_response
+            
+            # While OpenAI keeps failing, answer at once instead of queueing for a timeout
+            if not self.breaker.allow():
+                return self.degraded_answer(user_message)
             
-            ai_response = response.choices[0].message.content
+            # Wait for room under the account's RPM/TPM limits; OpenAI counts max_tokens too
+            prompt_tokens = self.user_conversations.tokens(user_id) + self.token_counter.count_message(messages[-1])
+            queued_at = time.perf_counter()
+            try:
+                with span("admission", prompt_tokens=prompt_tokens):
+                    await self.admission.acquire(user_id, prompt_tokens + self.llm.max_tokens, on_queued=on_queued)
+            except BaseException:
+                self.breaker.release()
+                raise
+            self.metrics.admission_wait.observe(time.perf_counter() - queued_at)
             
-            # Add AI response to conversation history
-            self.user_conversations[user_id].append({"role": "assistant", "content": ai_response})
+            # Get AI response without blocking the event loop
+            outcome = "error"
+            started = time.perf_counter()
+            first_token_at = None
+            with span("openai", model=OPENAI_MODEL, stream=on_partial is not None, prompt_tokens=prompt_tokens) as attributes:
+                # A hedged request may be answered by the fallback model instead
+                def answered_by(model: str):
+                    attributes["model"] = model
+                
+                try:
+                    if on_partial is None:
+                        ai_response = await self.completions.complete(messages, on_model=answered_by)
+                    else:
+                        ai_response = ""
+                        async for token in self.completions.stream(messages, on_model=answered_by):
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                                attributes["first_token_ms"] = round((first_token_at - started) * 1000, 1)
+                            ai_response += token
+                            await on_partial(ai_response)
+                    outcome = "ok"
+                except asyncio.TimeoutError:
+                    outcome = "timeout"
+                    self.breaker.record(False)
+                    raise
+                except (asyncio.CancelledError, openai.error.InvalidRequestError):
+                    # Not a sign of an outage: the user went away or this request itself is invalid
+                    self.breaker.release()
+                    raise
+                except Exception:
+                    self.breaker.record(False)
+                    raise
+                finally:
+                    self.metrics.openai_latency.labels(attributes["model"], outcome).observe(time.perf_counter() - started)
+                # A streamed answer is judged by its first token; the rest takes as long as the answer is long
+                self.breaker.record(True, (first_token_at or time.perf_counter()) - started)
+                completion_tokens = self.token_counter.count(ai_response)
+                attributes["completion_tokens"] = completion_tokens
+            
+            self.metrics.tokens.labels("prompt").observe(prompt_tokens)
+            self.metrics.tokens.labels("completion").observe(completion_tokens)
             
-            # Keep conversation history manageable (last 10 messages)
-            if len(self.user_conversations[user_id]) > 10:
-                # Keep system prompt and last 9 messages
-                self.user_conversations[user_id] = (
-                    [self.user_conversations[user_id][0]] + 
-                    self.user_conversations[user_id][-9:]
-                )
+            # Record the completed exchange (trimmed by the store)
+            self.user_conversations.append(user_id, "user", user_message)
+            self.user_conversations.append(user_id, "assistant", ai_response)
+            # The key names OPENAI_MODEL, so a fallback answer must not be served as its answer
+            if cache_key is not None and attributes["model"] == OPENAI_MODEL:
+                self.response_cache.put(cache_key, ai_response)
+            if self.summarizer is not None:
+                # Runs in the background; the next turns pick up the shorter history
+                self.summarizer.maybe_summarize(user_id)
             
             return ai_response
             
+        except QueueFullError:
+            self.metrics.errors.labels("QueueFullError").inc()
+            logger.warning(f"Admission queue full, shedding request of user {user_id}")
+            return "Извините, сейчас слишком много обращений. Пожалуйста, повторите вопрос через пару минут."
+        except asyncio.TimeoutError:
+            self.metrics.errors.labels("TimeoutError").inc()
+            logger.error(f"OpenAI request timed out after {self.llm.timeout}s for user {user_id}")
+            return "Извините, ответ занимает слишком много времени. Пожалуйста, попробуйте еще раз."
         except Exception as e:
+            self.metrics.errors.labels(type(e).__name__).inc()
             logger.error(f"Error getting AI response: {e}")
             return "Извините, произошла ошибка при получении ответа. Пожалуйста, попробуйте еще раз."
     
+    def record_hedge(self, path: str, seconds: float):
+        """Observe which path of a hedged request won and note it on the current trace"""
+        self.metrics.hedge_wins.labels(path).observe(seconds)
+        annotate(openai_path=path)
+    
+    def degraded_answer(self, user_message: str) -> str:
+        """Reference answer for the pillar the message is about, or a try-later message"""
+        text = user_message.lower()
+        hits = [sum(stem in text for stem in stems) for stems, _ in DEGRADED_TOPICS]
+        best = max(range(len(hits)), key=hits.__getitem__)
+        kind = "topic" if hits[best] else "try_later"
+        self.metrics.degraded_answers.labels(kind).inc()
+        annotate(degraded=kind)
+        return DEGRADED_NOTICE + DEGRADED_TOPICS[best][1] if hits[best] else DEGRADED_FALLBACK
+    
+    async def prefetch_answer(self, user_id: int, question: str):
+        """Answer a suggested follow-up in the background; None when the circuit or the spare budget says no.
+
+        Called right after the answer that suggested it, so the history is
+        the one the follow-up would be asked in.
+        """
+        messages = self.user_conversations.messages(user_id)
+        messages.append({"role": "user", "content": question})
+        if self.breaker.state != CLOSED:
+            return None
+        prompt_tokens = self.user_conversations.tokens(user_id) + self.token_counter.count_message(messages[-1])
+        if not self.admission.try_acquire(prompt_tokens + self.llm.max_tokens, reserve=PREFETCH_RESERVE):
+            return None
+        return await self.llm.complete(messages)
+    
+    def follow_up_keyboard(self, ai_response: str):
+        """Split the [Button] suggestions off an answer; return (text, suggestions, inline keyboard or None)"""
+        if FOLLOW_UP_BUTTONS <= 0:
+            return ai_response, [], None
+        text, suggestions = extract_suggestions(ai_response, FOLLOW_UP_BUTTONS)
+        if not suggestions:
+            return ai_response, [], None
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton(label, callback_data=f"{FOLLOW_UP_PREFIX}{i}")] for i, label in enumerate(suggestions)
+        ])
+        return text, suggestions, keyboard
+    
+    def suggest_follow_ups(self, user_id: int, suggestions: list):
+        """Start answering the suggested follow-ups once the answer suggesting them is delivered"""
+        if self.prefetcher is not None and suggestions:
+            self.prefetcher.prefetch(user_id, suggestions)
+    
+    async def summarize_conversation(self, user_id: int, profile, messages: list) -> str:
+        """Fold messages into the user's client profile with SUMMARY_MODEL"""
+        transcript = "\n\n".join(
+            f"{'Клиент' if message['role'] == 'user' else 'Консультант'}: {message['content']}" for message in messages
+        )
+        request = [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Предыдущий профиль:\n{profile or 'нет'}\n\nНовая часть диалога:\n{transcript}"},
+        ]
+        # Summaries count against the same rate limits as answers
+        tokens = sum(self.token_counter.count_message(message) for message in request)
+        await self.admission.acquire(user_id, tokens + self.llm.max_tokens)
+        summary = await self.llm.complete(request, model=SUMMARY_MODEL)
+        return f"{PROFILE_HEADER}\n{summary.strip()}"
+    
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
         user_id = update.effective_user.id
         
-        # Clear any previous conversation for this user
-        if user_id in self.user_conversations:
-            del self.user_conversations[user_id]
+        # Clear any previous conversation for this user, after a turn still being answered
+        async with self.user_locks.hold(user_id):
+            self.user_conversations.clear(user_id)
+            if self.prefetcher is not None:
+                self.prefetcher.discard(user_id)
         
         greeting_text = (
             "🤖 **Добро пожаловать в Финансовый Помощник для Иммигрантов!**\n\n"
@@ -154,25 +549,155 @@ class FinancialAdvisorBot:
             "Просто напишите мне ваш вопрос или опишите ситуацию, и я помогу составить персональный финансовый план."
         )
         
-        await update.message.reply_text(greeting_text, parse_mode='Markdown')
+        await self.reply(update, greeting_text, markdown=True)
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle all text messages from users"""
         user_id = update.effective_user.id
         user_message = update.message.text
+        trace = self.tracer.start("message", update_id=update.update_id, user_id=user_id)
+        
+        if COALESCE_WINDOW > 0:
+            # Answered in the background once the user's burst of messages is complete
+            self.coalescer.submit(user_id, user_message, (update, context, trace))
+            return
+        
+        with self.tracer.activate(trace):
+            await self.answer(update, context, user_message)
+    
+    async def handle_follow_up(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Answer a tapped follow-up button as if the user had typed its label"""
+        query = update.callback_query
+        with self.metrics.telegram_send_latency.labels("answerCallbackQuery").time():
+            await query.answer()
+        try:
+            index = int(query.data[len(FOLLOW_UP_PREFIX):])
+            user_message = query.message.reply_markup.inline_keyboard[index][0].text
+        except (AttributeError, IndexError, ValueError):
+            return  # the message is too old for Telegram to send its keyboard back
+        trace = self.tracer.start("follow_up", update_id=update.update_id, user_id=update.effective_user.id)
+        with self.tracer.activate(trace):
+            await self.answer(update, context, user_message)
+    
+    async def answer_burst(self, user_id: int, user_message: str, payload: tuple):
+        """Answer one coalesced turn; replies go to the latest message of the burst"""
+        update, context, trace = payload
+        trace.add_span("coalesce", trace.handled, time.perf_counter())
+        try:
+            with self.tracer.activate(trace):
+                await self.answer(update, context, user_message)
+        except Exception as e:
+            self.metrics.errors.labels(type(e).__name__).inc()
+            logger.error(f"Error answering user {user_id}: {e}", exc_info=e)
+    
+    async def answer(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_message: str):
+        """Get an AI answer to user_message and deliver it.
+        
+        Turns of one user run one at a time in arrival order, so each sees
+        the history left by the previous one.
+        """
+        user_id = update.effective_user.id
+        
+        self.metrics.messages_in_flight.inc()
+        try:
+            with self.metrics.message_latency.time():
+                async with self.user_locks.hold(user_id):
+                    if STREAM_REPLIES:
+                        await self.stream_reply(update, user_message, user_id)
+                    else:
+                        await self.send_reply(update, context, user_message, user_id)
+        finally:
+            self.metrics.messages_in_flight.dec()
+    
+    async def send_reply(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_message: str, user_id: int):
+        """Answer with a single message once the whole completion is ready"""
+        started = time.perf_counter()
         
         # Show typing indicator
-        await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="typing")
+        with span("send_chat_action"), self.metrics.telegram_send_latency.labels("sendChatAction").time():
+            await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="typing")
         
         # Get AI response
-        ai_response = await self.get_ai_response(user_message, user_id)
+        async def notify_queued(position: int):
+            await self.reply(update, QUEUED_TEXT.format(position=position))
+        
+        ai_response = await self.get_ai_response(user_message, user_id, on_queued=notify_queued)
         
-        # Send the AI response back to the user
-        await update.message.reply_text(
-            f"🤖 **AI Помощник:**\n\n{ai_response}",
-            parse_mode='Markdown'
+        # Send the AI response back to the user, in several messages if it is too long
+        text, suggestions, keyboard = self.follow_up_keyboard(ai_response)
+        chunks = split_message(f"🤖 **AI Помощник:**\n\n{text}")
+        with span("reply_text", messages=len(chunks)):
+            await self.reply(update, chunks[0], markdown=True, reply_markup=keyboard if len(chunks) == 1 else None)
+            self.metrics.first_text_latency.observe(time.perf_counter() - started)
+            for i, chunk in enumerate(chunks[1:], 2):
+                await self.reply(update, chunk, markdown=True, priority=CONTINUATION,
+                                 reply_markup=keyboard if i == len(chunks) else None)
+        self.suggest_follow_ups(user_id, suggestions)
+    
+    async def stream_reply(self, update: Update, user_message: str, user_id: int):
+        """Answer with a placeholder message that is edited as the completion streams in"""
+        reply = StreamingReply(
+            update.message or update.effective_message,
+            header="🤖 AI Помощник:\n\n",
+            placeholder="✍️ Печатаю ответ…",
+            edit_interval=STREAM_EDIT_INTERVAL,
+            send_latency=self.metrics.telegram_send_latency,
+            scheduler=self.outbound,
+            render=markdown_to_html,
+        )
+        with span("placeholder"):
+            await reply.start()
+        
+        async def notify_queued(position: int):
+            await reply.show_status(QUEUED_TEXT.format(position=position))
+        
+        ai_response = await self.get_ai_response(
+            user_message, user_id, on_partial=reply.update, on_queued=notify_queued
+        )
+        text, suggestions, keyboard = self.follow_up_keyboard(ai_response)
+        with span("finish"):
+            await reply.finish(f"🤖 **AI Помощник:**\n\n{text}", reply_markup=keyboard)
+        self.suggest_follow_ups(user_id, suggestions)
+        annotate(edits=reply.edits)
+        first_text = reply.time_to_first_text
+        if first_text is None:
+            # Nothing was shown through edits, e.g. only continuation messages got through
+            logger.warning(f"⏱️ User {user_id}: answer delivered without a recorded first text")
+            return
+        annotate(first_text_ms=round(first_text * 1000, 1))
+        
+        # Time to first visible text is the latency the user actually feels
+        self.metrics.first_text_latency.observe(first_text)
+        logger.info(
+            f"⏱️ User {user_id}: first text in {first_text:.2f}s, "
+            f"full answer in {time.monotonic() - reply.started:.2f}s, {reply.edits} edits"
         )
     
+    async def reply(self, update: Update, text: str, parse_mode: str = None, priority: int = FIRST, reply_markup=None,
+                    markdown: bool = False):
+        """Send text to the user through the outbound scheduler, split if longer than Telegram allows.
+        
+        reply_markup goes on the last message. Button taps have no message of
+        their own, so the reply goes to the message with the buttons. With
+        markdown, text is Markdown as the model writes it and every part is
+        sent as Telegram HTML, which cannot fail to parse.
+        """
+        message = update.message or update.effective_message
+        if markdown:
+            parse_mode = ParseMode.HTML
+        
+        async def send(chunk: str, markup=None):
+            with self.metrics.telegram_send_latency.labels("sendMessage").time():
+                return await message.reply_text(chunk, parse_mode=parse_mode, reply_markup=markup)
+        
+        chunks = split_message(text)
+        if markdown:
+            chunks = [markdown_to_html(chunk) for chunk in chunks]
+        for i, chunk in enumerate(chunks, 1):
+            markup = reply_markup if i == len(chunks) else None
+            await self.outbound.send(update.effective_chat.id, partial(send, chunk, markup), priority)
+            priority = CONTINUATION
+    
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
         help_text = """
@@ -200,51 +725,165 @@ class FinancialAdvisorBot:
 
 Просто начните с /start и пишите ваши вопросы!
         """
-        await update.message.reply_text(help_text, parse_mode='Markdown')
+        await self.reply(update, help_text, markdown=True)
     
-    def start_web_server(self):
-        """Start a simple web server for cloud deployment health checks"""
-        try:
-            import http.server
-            import socketserver
-            
-            class HealthCheckHandler(http.server.SimpleHTTPRequestHandler):
-                def do_GET(self):
-                    if self.path == '/health':
-                        self.send_response(200)
-                        self.send_header('Content-type', 'text/plain')
-                        self.end_headers()
-                        self.wfile.write(b'Bot is running!')
-                    else:
-                        self.send_response(200)
-                        self.send_header('Content-type', 'text/html')
-                        self.end_headers()
-                        self.wfile.write(b'<h1>Financial Advisor Bot is Running!</h1>')
-            
-            with socketserver.TCPServer(("", PORT), HealthCheckHandler) as httpd:
-                logger.info(f"Web server started on port {PORT}")
-                httpd.serve_forever()
-        except Exception as e:
-            logger.error(f"Web server error: {e}")
+    def stats(self) -> dict:
+        """Runtime counters served on /stats"""
+        stats = {"conversations": self.user_conversations.stats()}
+        if self.summarizer is not None:
+            stats["summaries"] = self.summarizer.stats()
+        if self.response_cache is not None:
+            stats["response_cache"] = self.response_cache.stats()
+        stats["admission"] = self.admission.stats()
+        stats["openai_circuit"] = self.breaker.stats()
+        if isinstance(self.completions, HedgedLLM):
+            stats["hedging"] = {"hedged": self.completions.hedged, "wins": dict(self.completions.wins)}
+        if self.prefetcher is not None:
+            stats["prefetch"] = self.prefetcher.stats()
+        stats["coalescing"] = {"pending_users": self.coalescer.pending(), "saved_calls": self.coalescer.saved_calls}
+        stats["outbound"] = self.outbound.stats()
+        stats["user_locks"] = self.user_locks.stats()
+        return stats
     
-    def run(self):
-        """Start the bot"""
-        # Create application
-        application = Application.builder().token(TELEGRAM_TOKEN).build()
+    async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE):
+        """Count and log errors raised by handlers, e.g. failed Telegram sends"""
+        self.metrics.errors.labels(type(context.error).__name__).inc()
+        logger.error(f"Error while handling an update: {context.error}", exc_info=context.error)
+    
+    def is_busy(self, user_id) -> bool:
+        """Whether user_id still has a turn, summary or unflushed history write in progress here.
         
-        # Add handlers
+        The shard dispatcher waits for this to turn false before another
+        worker gets the user's updates, so turns never overlap across workers.
+        """
+        backend = self.user_conversations.backend
+        return (
+            user_id in self.user_locks
+            or user_id in self.coalescer
+            or (self.summarizer is not None and user_id in self.summarizer)
+            or (backend is not None and backend.has_pending(user_id))
+        )
+    
+    def readiness(self) -> dict:
+        """Components that must be initialized before /ready passes"""
+        return {
+            "openai_pool": self.llm.pooled,
+            "handlers": self.application is not None and bool(self.application.handlers),
+            "telegram": self.bot_user is not None,
+        }
+    
+    async def post_init(self, application: Application):
+        """Open and warm the OpenAI connection pool, then report ready.
+        
+        Runs after application.initialize() has reached Telegram (getMe).
+        """
+        self.bot_user = application.bot.bot
+        await self.llm.open(warm_connections=OPENAI_WARM_CONNECTIONS if self.openai_available else 0)
+        self.web_server.ready = True
+        logger.info(f"✅ @{self.bot_user.username} is ready")
+    
+    async def post_stop(self, application: Application):
+        """Answer turns still waiting in the coalescer while the bot can still send"""
+        await self.coalescer.join()
+    
+    async def post_shutdown(self, application: Application):
+        """Stop the web server, close the OpenAI pool and flush queued conversation writes before the process exits"""
+        await self.web_server.stop()
+        if self.prefetcher is not None:
+            await self.prefetcher.close()
+        await self.llm.close()
+        if self.summarizer is not None:
+            await self.summarizer.close()
+        if self.user_conversations.backend is not None:
+            await self.user_conversations.backend.close()
+            logger.info("💾 Conversation history flushed")
+    
+    def add_handlers(self, application: Application):
+        """Register command, message and error handlers"""
+        self.application = application
         application.add_handler(CommandHandler("start", self.start_command))
         application.add_handler(CommandHandler("help", self.help_command))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        application.add_handler(CallbackQueryHandler(self.handle_follow_up, pattern=f"^{FOLLOW_UP_PREFIX}"))
+        application.add_error_handler(self.error_handler)
+    
+    def run(self):
+        """Start the bot"""
+        logger.info(f"Starting Financial Advisor Bot with OpenAI ChatGPT integration on port {PORT} ({BOT_MODE})...")
+        run_service(self)
+
+
+async def run_webhook(service, application: Application, set_webhook: bool = True):
+    """Receive updates on the service's web server until SIGINT/SIGTERM.
+
+    In worker mode (set_webhook=False) the updates come from the shard
+    dispatcher instead of Telegram, so the webhook is left alone.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    service.web_server.add_webhook(WEBHOOK_PATH, application, secret_token=WEBHOOK_SECRET or None)
+    await service.web_server.start()
+    async with application:
+        await application.start()
+        await service.post_init(application)
+        if set_webhook:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                allowed_updates=Update.ALL_TYPES,
+                secret_token=WEBHOOK_SECRET or None,
+            )
+            logger.info(f"🔗 Receiving updates via webhook at {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+        else:
+            logger.info(f"🔗 Receiving updates from the dispatcher on port {PORT}{WEBHOOK_PATH}")
         
-        # Start web server in a separate thread for cloud deployment
-        web_server_thread = threading.Thread(target=self.start_web_server, daemon=True)
-        web_server_thread.start()
+        await stop.wait()
         
-        # Start the bot
-        logger.info(f"Starting Financial Advisor Bot with OpenAI ChatGPT integration on port {PORT}...")
+        service.web_server.ready = False
+        await application.stop()
+        await service.post_stop(application)
+    await service.post_shutdown(application)
+
+
+def run_service(service):
+    """Run the bot or the shard dispatcher in BOT_MODE until stopped.
+
+    service provides add_handlers(), web_server and the post_init,
+    post_stop and post_shutdown lifecycle hooks.
+    """
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(TELEGRAM_CONCURRENT_UPDATES)
+        .post_stop(service.post_stop)
+        .post_shutdown(service.post_shutdown)
+    )
+    if BOT_MODE in ("webhook", "worker"):
+        builder = builder.updater(None)
+    else:
+        builder = builder.post_init(service.post_init)
+    application = builder.build()
+    service.add_handlers(application)
+    
+    if BOT_MODE in ("webhook", "worker"):
+        asyncio.run(run_webhook(service, application, set_webhook=BOT_MODE == "webhook"))
+    else:
+        # Liveness is served from the start; readiness follows once post_init has run.
+        # run_polling uses the same event loop.
+        asyncio.get_event_loop().run_until_complete(service.web_server.start())
         application.run_polling(allowed_updates=Update.ALL_TYPES)
 
+
 if __name__ == "__main__":
-    bot = FinancialAdvisorBot()
-    bot.run()
+    if SHARD_WORKERS:
+        # Dispatcher: forwards each user's updates to one of the worker processes
+        logger.info(f"Starting shard dispatcher for {len(SHARD_WORKERS)} workers on port {PORT} ({BOT_MODE})...")
+        run_service(ShardDispatcher(
+            SHARD_WORKERS, PORT, path=WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None,
+            health_interval=SHARD_HEALTH_INTERVAL, handover_timeout=SHARD_HANDOVER_TIMEOUT,
+        ))
+    else:
+        bot = FinancialAdvisorBot()
+        bot.run()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Circuit breaker for the Financial Advisor Bot
+Stops sending requests to OpenAI during an outage so users get an instant degraded answer instead of a timeout
+"""
+
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}  # exported as a gauge
+
+
+class CircuitBreaker:
+    """Closed -> open -> half-open state machine over recent call outcomes.
+
+    Closed: calls pass; once at least min_calls calls finished in the last
+    window seconds and failure_ratio of them failed or took longer than
+    slow_after seconds, the breaker opens. Open: allow() refuses calls for
+    open_for seconds. Half-open: up to probes trial calls pass; a success
+    closes the breaker, a failure opens it again.
+
+    Every allowed call must end with record() or, if it produced no
+    outcome (e.g. it was cancelled), release().
+    """
+
+    def __init__(self, failure_ratio: float = 0.5, min_calls: int = 10, window: float = 30.0,
+                 slow_after: float = None, open_for: float = 30.0, probes: int = 1, clock=time.monotonic):
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window = window
+        self.slow_after = slow_after
+        self.open_for = open_for
+        self.probes = probes
+        self.clock = clock
+        self.state = CLOSED
+        self._outcomes = deque()  # (finished at, failed) in the last window, while closed
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def allow(self) -> bool:
+        """Whether a call may go to the backend now"""
+        if self.state == OPEN:
+            if self.clock() - self._opened_at < self.open_for:
+                self.rejected += 1
+                return False
+            self._change(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probing >= self.probes:
+                self.rejected += 1
+                return False
+            self._probing += 1
+        return True
+
+    def record(self, ok: bool, seconds: float = 0.0):
+        """Outcome of an allowed call; slow successes count as failures"""
+        failed = not ok or (self.slow_after is not None and seconds > self.slow_after)
+        if self.state == HALF_OPEN:
+            self._probing = max(0, self._probing - 1)
+            if failed:
+                self._open()
+            else:
+                self._change(CLOSED)
+            return
+        if self.state == OPEN:
+            return  # a call started before the breaker opened
+        now = self.clock()
+        self._outcomes.append((now, failed))
+        self._failures += failed
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._failures -= self._outcomes.popleft()[1]
+        if len(self._outcomes) >= self.min_calls and self._failures >= self.failure_ratio * len(self._outcomes):
+            self._open()
+
+    def release(self):
+        """An allowed call ended without an outcome"""
+        if self.state == HALF_OPEN:
+            self._probing = max(0, self._probing - 1)
+
+    def stats(self) -> dict:
+        """State and counters for monitoring"""
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": self._failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+    def _open(self):
+        self._opened_at = self.clock()
+        self.opened += 1
+        self._change(OPEN)
+
+    def _change(self, state: str):
+        if state == self.state:
+            return
+        logger.warning(f"⚡ OpenAI circuit {self.state} -> {state}")
+        self.state = state
+        self._probing = 0
+        if state != HALF_OPEN:
+            self._outcomes.clear()
+            self._failures = 0
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Persistent conversation backends for the Financial Advisor Bot
+SQLite (WAL mode) storage behind a write-behind queue that batches appends into transactions
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteBackend:
+    """Conversation history in a local SQLite database.
+
+    Blocking; meant to be driven from a single worker thread by WriteBehindBackend.
+    Any object with the same load/version/write/close methods can replace it.
+    """
+
+    def __init__(self, path: str, keep_messages: int = 100):
+        self.path = path
+        self.keep_messages = keep_messages  # rows kept per user on disk
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user_id INTEGER NOT NULL,"
+            " role TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS messages_user ON messages (user_id, id)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            " user_id INTEGER PRIMARY KEY,"
+            " content TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def load(self, user_id: int, limit: int):
+        """Return (version, rows): the newest limit (role, content) pairs of user_id, oldest first,
+        preceded by ("profile", content) if a profile was stored, and the version they are"""
+        with self.connection:
+            self.connection.execute("BEGIN")  # one snapshot for rows and version
+            rows = self.connection.execute(
+                "SELECT role, content FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, limit),
+            ).fetchall()
+            profile = self.connection.execute(
+                "SELECT content FROM profiles WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            version = self.version(user_id)
+        rows.reverse()
+        if profile is not None:
+            rows.insert(0, ("profile", profile[0]))
+        return version, rows
+
+    def version(self, user_id: int) -> int:
+        """Id of user_id's newest stored message, 0 if none; it changes with every append or clear by any process"""
+        row = self.connection.execute("SELECT MAX(id) FROM messages WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] or 0
+
+    def write(self, operations: list) -> dict:
+        """Apply ("append", user_id, role, content, created_at), ("clear", user_id) and
+        ("profile", user_id, content, keep_messages, created_at) operations in order,
+        in one transaction; return {user_id: (version before, version after)} of the users written"""
+        touched = set()
+        versions = {}
+        with self.connection:
+            self.connection.execute("BEGIN")
+            for operation in operations:
+                if operation[1] not in versions:
+                    versions[operation[1]] = self.version(operation[1])
+                if operation[0] == "append":
+                    self.connection.execute(
+                        "INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                        operation[1:],
+                    )
+                    touched.add(operation[1])
+                elif operation[0] == "profile":
+                    # The profile replaces every stored message but the newest keep_messages
+                    _, user_id, content, keep_messages, created_at = operation
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO profiles (user_id, content, updated_at) VALUES (?, ?, ?)",
+                        (user_id, content, created_at),
+                    )
+                    self.connection.execute(
+                        "DELETE FROM messages WHERE user_id = ? AND id NOT IN ("
+                        " SELECT id FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?)",
+                        (user_id, user_id, keep_messages),
+                    )
+                else:
+                    self.connection.execute("DELETE FROM messages WHERE user_id = ?", (operation[1],))
+                    self.connection.execute("DELETE FROM profiles WHERE user_id = ?", (operation[1],))
+            for user_id in touched:
+                self.connection.execute(
+                    "DELETE FROM messages WHERE user_id = ? AND id <= ("
+                    " SELECT id FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (user_id, user_id, self.keep_messages),
+                )
+            for user_id, before in versions.items():
+                versions[user_id] = (before, self.version(user_id))
+        return versions
+
+    def close(self):
+        self.connection.close()
+
+
+class WriteBehindBackend:
+    """Async facade that queues writes in memory and flushes them in batches.
+
+    append() and clear() only enqueue, so callers never wait on disk; a
+    background task commits the queue every flush_interval seconds or as soon
+    as max_batch operations are pending. on_written is called with
+    (user_id, version before, version after) for every user a flush wrote.
+    """
+
+    def __init__(self, backend, flush_interval: float = 0.5, max_batch: int = 500, on_written=None):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.on_written = on_written
+        self._queue = []
+        self._pending_users = {}  # user_id -> queued operation count
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-db")
+        self._flusher = None
+        self._wakeup = None
+        self._flush_lock = None
+        self.written = 0
+        self.batches = 0
+
+    def append(self, user_id: int, role: str, content: str):
+        """Queue a message for storage"""
+        self._enqueue(("append", user_id, role, content, time.time()))
+
+    def clear(self, user_id: int):
+        """Queue deletion of user_id's history"""
+        self._enqueue(("clear", user_id))
+
+    def set_profile(self, user_id: int, content: str, keep_messages: int):
+        """Queue storing user_id's profile in place of all but the newest keep_messages messages"""
+        self._enqueue(("profile", user_id, content, keep_messages, time.time()))
+
+    def has_pending(self, user_id: int) -> bool:
+        """Whether writes for user_id are still waiting to be flushed"""
+        return user_id in self._pending_users
+
+    async def load(self, user_id: int, limit: int):
+        """Read user_id's stored history and its version off the event loop"""
+        if self.has_pending(user_id):
+            await self.flush()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.backend.load, user_id, limit)
+
+    async def version(self, user_id: int) -> int:
+        """Current version of user_id's stored history, after our own queued writes for user_id"""
+        if self.has_pending(user_id):
+            await self.flush()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.backend.version, user_id)
+
+    async def flush(self):
+        """Commit everything queued so far"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._queue:
+                return
+            batch, self._queue = self._queue, []
+            loop = asyncio.get_running_loop()
+            try:
+                versions = await loop.run_in_executor(self._executor, self.backend.write, batch)
+            except Exception as e:
+                # Keep the batch so the next flush retries it
+                logger.error(f"Failed to write {len(batch)} conversation updates: {e}")
+                self._queue = batch + self._queue
+                return
+            for operation in batch:
+                remaining = self._pending_users[operation[1]] - 1
+                if remaining:
+                    self._pending_users[operation[1]] = remaining
+                else:
+                    del self._pending_users[operation[1]]
+            self.written += len(batch)
+            self.batches += 1
+            if self.on_written is not None:
+                for user_id, (before, after) in versions.items():
+                    self.on_written(user_id, before, after)
+
+    async def close(self):
+        """Flush outstanding writes and release the database"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.backend.close)
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        return {"pending": len(self._queue), "written": self.written, "batches": self.batches}
+
+    def _enqueue(self, operation: tuple):
+        self._queue.append(operation)
+        self._pending_users[operation[1]] = self._pending_users.get(operation[1], 0) + 1
+        if self._flusher is None:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return  # no event loop yet: the first write from async code starts the flusher
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.ensure_future(self._flush_forever())
+        if len(self._queue) >= self.max_batch:
+            self._wakeup.set()
+
+    async def _flush_forever(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Bounded conversation store for the Financial Advisor Bot
+Per-user chat history trimmed to a token budget, with an optional summary of older turns,
+LRU + idle-TTL eviction, hard caps on users and bytes, and an optional persistent backend behind the cache
+"""
+
+import logging
+import sys
+import time
+import zlib
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ROLE = "profile"  # how backends return the stored profile among (role, content) rows
+ROLES = {role: sys.intern(role) for role in ("system", "user", "assistant")}
+
+
+class StoredMessage:
+    """One history message in compact form.
+
+    Roles are interned, so all messages share a handful of role strings, and
+    content may be kept zlib-compressed; OpenAI message dicts are only built
+    by to_dict() when a request is made.
+    """
+
+    __slots__ = ("role", "_content", "tokens")
+
+    def __init__(self, role: str, content: str, tokens: int):
+        self.role = ROLES.get(role) or sys.intern(role)
+        self._content = content  # str, or UTF-8 bytes compressed by compress()
+        self.tokens = tokens
+
+    @property
+    def content(self) -> str:
+        if isinstance(self._content, bytes):
+            return zlib.decompress(self._content).decode("utf-8")
+        return self._content
+
+    @property
+    def compressed(self) -> bool:
+        return isinstance(self._content, bytes)
+
+    def compress(self) -> int:
+        """Compress the content if that saves memory; return the bytes saved"""
+        if self.compressed:
+            return 0
+        packed = zlib.compress(self._content.encode("utf-8"))
+        saved = sys.getsizeof(self._content) - sys.getsizeof(packed)
+        if saved <= 0:
+            return 0
+        self._content = packed
+        return saved
+
+    def size(self) -> int:
+        """Approximate RAM held by this message"""
+        return sys.getsizeof(self) + sys.getsizeof(self._content)
+
+    def to_dict(self) -> dict:
+        return {"role": self.role, "content": self.content}
+
+    def matches(self, message: dict) -> bool:
+        return self.role == message["role"] and self.content == message["content"]
+
+
+class Conversation:
+    """One user's history (without the system prompt) and its bookkeeping"""
+
+    __slots__ = ("entries", "profile", "tokens", "bytes", "last_access", "version")
+
+    def __init__(self, now: float):
+        self.entries = []  # StoredMessage oldest first; short enough that popping the front is cheap
+        self.profile = None  # StoredMessage summarizing turns no longer in entries
+        self.tokens = 0
+        self.bytes = 0
+        self.last_access = now
+        self.version = None  # backend version this cache matches; None if unknown
+
+
+class ConversationStore:
+    """LRU map of user_id -> Conversation bounded by user count, bytes and idle time"""
+
+    def __init__(self, system_prompt: str, token_counter, token_budget: int, max_users: int = 10000,
+                 max_bytes: int = 64 * 1024 * 1024, idle_ttl: float = 24 * 3600, backend=None,
+                 load_limit: int = 50, compress_after: int = None, compress_min_length: int = 256,
+                 validate_versions: bool = False, clock=time.monotonic):
+        self.system_prompt = {"role": "system", "content": system_prompt}  # one dict shared by every request
+        self.token_counter = token_counter
+        self.system_tokens = token_counter.count_message(self.system_prompt)
+        self.token_budget = token_budget  # for history, excluding the system prompt
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.backend = backend  # e.g. WriteBehindBackend; None keeps history in RAM only
+        self.load_limit = load_limit  # newest stored messages read on a cache miss
+        # Messages older than the newest compress_after are kept compressed (None disables)
+        self.compress_after = compress_after
+        self.compress_min_length = compress_min_length
+        # Re-check cached histories against the backend on every load(); only needed when other processes write
+        self.validate_versions = validate_versions
+        self.clock = clock
+        self._conversations = OrderedDict()  # least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # cached histories found outdated by another process's writes
+        self.evictions = {"lru": 0, "ttl": 0, "bytes": 0}
+        if backend is not None:
+            backend.on_written = self._written
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self._conversations
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    async def load(self, user_id):
+        """Make sure user_id's history is cached and current, reading it from the backend if not.
+
+        With validate_versions every call compares the cached version with the
+        stored one, so history another process wrote meanwhile, e.g. the shard
+        worker that served this user while this one was out of the ring, is
+        read again instead of being continued from a stale cache. Otherwise
+        cache hits never touch the backend.
+        """
+        conversation = self._touch(user_id)
+        if conversation is not None and self.backend is not None and self.validate_versions:
+            version = await self.backend.version(user_id)
+            conversation = self._conversations.get(user_id)
+            if conversation is not None and conversation.version != version:
+                self._forget(user_id)
+                self.stale += 1
+                conversation = None
+        if conversation is not None:
+            self.hits += 1
+            return
+        self.misses += 1
+        version, rows = await self.backend.load(user_id, self.load_limit) if self.backend is not None else (None, [])
+        if user_id in self._conversations:
+            return  # loaded concurrently while we were reading
+        conversation = self._create(user_id)
+        conversation.version = version
+        for role, content in rows:
+            if role == PROFILE_ROLE:
+                self._set_profile(conversation, content)
+            else:
+                self._add(conversation, role, content)
+        self._evict()
+
+    def messages(self, user_id) -> list:
+        """Return the OpenAI messages list for user_id: system prompt, profile and history"""
+        conversation = self._touch(user_id)
+        if conversation is None:
+            return [self.system_prompt]
+        messages = [self.system_prompt]
+        if conversation.profile is not None:
+            messages.append(conversation.profile.to_dict())
+        messages.extend(message.to_dict() for message in conversation.entries)
+        return messages
+
+    def tokens(self, user_id) -> int:
+        """Prompt tokens of user_id's messages list, system prompt included"""
+        conversation = self._conversations.get(user_id)
+        return self.system_tokens + (conversation.tokens if conversation is not None else 0)
+
+    def history_tokens(self, user_id) -> int:
+        """Tokens of user_id's profile and history, without the system prompt"""
+        conversation = self._conversations.get(user_id)
+        return conversation.tokens if conversation is not None else 0
+
+    def profile(self, user_id):
+        """Content of user_id's profile message, or None"""
+        conversation = self._conversations.get(user_id)
+        if conversation is None or conversation.profile is None:
+            return None
+        return conversation.profile.content
+
+    def older_tokens(self, user_id, keep: int) -> int:
+        """Tokens of user_id's history messages except the newest keep"""
+        conversation = self._conversations.get(user_id)
+        if conversation is None:
+            return 0
+        return sum(message.tokens for message in conversation.entries[:max(0, len(conversation.entries) - keep)])
+
+    def older_messages(self, user_id, keep: int) -> list:
+        """History messages of user_id except the newest keep, oldest first"""
+        conversation = self._conversations.get(user_id)
+        if conversation is None or len(conversation.entries) <= keep:
+            return []
+        return [message.to_dict() for message in conversation.entries[:len(conversation.entries) - keep]]
+
+    def replace_with_profile(self, user_id, content: str, covered: list) -> bool:
+        """Replace the covered messages (from older_messages()) by a profile message.
+
+        Returns False without changing anything when none of them is still at
+        the start of the history, e.g. because the conversation was cleared,
+        evicted or trimmed while the profile was being written.
+        """
+        conversation = self._conversations.get(user_id)
+        if conversation is None:
+            return False
+        # Meanwhile history only grew at the end or was trimmed at the front,
+        # so what is left of covered is its tail, now at the start of entries
+        entries = conversation.entries
+        remaining = 0
+        for count in range(min(len(covered), len(entries)), 0, -1):
+            if all(entry.matches(message) for entry, message in zip(entries[:count], covered[-count:])):
+                remaining = count
+                break
+        if remaining == 0:
+            return False
+        for message in entries[:remaining]:
+            self._resize(conversation, -message.size(), -message.tokens)
+        del entries[:remaining]
+        self._set_profile(conversation, content)
+        if self.backend is not None:
+            self.backend.set_profile(user_id, content, keep_messages=len(conversation.entries))
+        self._evict()
+        return True
+
+    def append(self, user_id, role: str, content: str):
+        """Add a message to user_id's history, trimming and evicting as needed"""
+        conversation = self._touch(user_id)
+        if conversation is None and self.backend is None:
+            conversation = self._create(user_id)
+        # With a backend an uncached user stays uncached: the next load() reads
+        # the complete history instead of trusting a partial cache entry
+        if conversation is not None:
+            self._add(conversation, role, content)
+        if self.backend is not None:
+            self.backend.append(user_id, role, content)
+        self._evict()
+
+    def clear(self, user_id):
+        """Forget user_id's history"""
+        self._forget(user_id)
+        if self.backend is not None:
+            self.backend.clear(user_id)
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        stats = {
+            "users": len(self._conversations),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": dict(self.evictions),
+        }
+        if self.backend is not None:
+            stats["backend"] = self.backend.stats()
+        return stats
+
+    def _create(self, user_id) -> Conversation:
+        conversation = Conversation(self.clock())
+        self._conversations[user_id] = conversation
+        return conversation
+
+    def _add(self, conversation: Conversation, role: str, content: str):
+        # Tokens are counted once and kept with the message
+        message = StoredMessage(role, content, self.token_counter.count_message({"role": role, "content": content}))
+        conversation.entries.append(message)
+        self._resize(conversation, message.size(), message.tokens)
+
+        # Drop the oldest messages until history fits the token budget,
+        # always keeping the newest one (the profile stays)
+        entries = conversation.entries
+        trimmed = 0
+        while conversation.tokens > self.token_budget and len(entries) - trimmed > 1:
+            self._resize(conversation, -entries[trimmed].size(), -entries[trimmed].tokens)
+            trimmed += 1
+        del entries[:trimmed]
+
+        # The message that just became old enough is rarely read again: compress it
+        if self.compress_after is not None and len(entries) > self.compress_after:
+            old = entries[len(entries) - 1 - self.compress_after]
+            if not old.compressed and len(old.content) >= self.compress_min_length:
+                self._resize(conversation, -old.compress(), 0)
+
+    def _set_profile(self, conversation: Conversation, content: str):
+        if conversation.profile is not None:
+            self._resize(conversation, -conversation.profile.size(), -conversation.profile.tokens)
+        tokens = self.token_counter.count_message({"role": "system", "content": content})
+        conversation.profile = StoredMessage("system", content, tokens)
+        self._resize(conversation, conversation.profile.size(), tokens)
+
+    def _written(self, user_id, before: int, after: int):
+        """Follow our own flushed writes; a version we did not expect means someone else wrote too"""
+        conversation = self._conversations.get(user_id)
+        if conversation is not None:
+            conversation.version = after if conversation.version == before else None
+
+    def _forget(self, user_id):
+        """Drop user_id from the cache only"""
+        conversation = self._conversations.pop(user_id, None)
+        if conversation is not None:
+            self.total_bytes -= conversation.bytes
+
+    def _touch(self, user_id):
+        """Look up a live conversation and mark it most recently used"""
+        conversation = self._conversations.get(user_id)
+        now = self.clock()
+        if conversation is not None and now - conversation.last_access > self.idle_ttl:
+            self._drop(user_id, "ttl")
+            conversation = None
+        if conversation is None:
+            return None
+        conversation.last_access = now
+        self._conversations.move_to_end(user_id)
+        return conversation
+
+    def _resize(self, conversation: Conversation, delta_bytes: int, delta_tokens: int):
+        conversation.bytes += delta_bytes
+        conversation.tokens += delta_tokens
+        self.total_bytes += delta_bytes
+
+    def _evict(self):
+        """Drop idle and least recently used conversations until within limits"""
+        now = self.clock()
+        while self._conversations:
+            user_id, oldest = next(iter(self._conversations.items()))
+            if now - oldest.last_access > self.idle_ttl:
+                self._drop(user_id, "ttl")
+            elif len(self._conversations) > self.max_users:
+                self._drop(user_id, "lru")
+            elif self.total_bytes > self.max_bytes:
+                self._drop(user_id, "bytes")
+            else:
+                break
+
+    def _drop(self, user_id, reason: str):
+        # Eviction only frees RAM; a persistent backend still has the history
+        self._forget(user_id)
+        self.evictions[reason] += 1
+        logger.debug(f"Evicted conversation of user {user_id} ({reason})")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Rolling conversation summaries for the Financial Advisor Bot
+Condenses the older turns of long consultations into a client profile in the background
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationSummarizer:
+    """Keeps long histories short without forgetting who the client is.
+
+    After each answer, maybe_summarize() checks the user's history and, once
+    the messages older than the newest keep_messages exceed threshold_tokens,
+    starts a background task that awaits
+    summarize(user_id, previous_profile, older_messages) and stores the
+    result as the user's profile in place of all but the newest
+    keep_messages messages.
+    Replies never wait for it; at most one summary per user runs at a time.
+    """
+
+    def __init__(self, store, summarize, threshold_tokens: int, keep_messages: int = 6, on_result=None):
+        self.store = store  # ConversationStore
+        self.summarize = summarize  # async (user_id, profile or None, messages) -> new profile text
+        self.threshold_tokens = threshold_tokens
+        self.keep_messages = keep_messages
+        self.on_result = on_result  # called with "ok", "stale" or "error" after each attempt
+        self._tasks = {}  # user_id -> running summary task
+        self.summaries = 0
+        self.failures = 0
+        self.tokens_saved = 0
+
+    def __contains__(self, user_id) -> bool:
+        """Whether a summary of user_id's history is being written"""
+        return user_id in self._tasks
+
+    def maybe_summarize(self, user_id):
+        """Start summarizing user_id's older turns if the history has grown too long"""
+        # The kept messages are never summarized, so only the older ones count
+        if user_id in self._tasks or self.store.older_tokens(user_id, self.keep_messages) <= self.threshold_tokens:
+            return
+        covered = self.store.older_messages(user_id, self.keep_messages)
+        if covered:
+            self._tasks[user_id] = asyncio.ensure_future(self._summarize(user_id, covered))
+
+    async def join(self):
+        """Wait for summaries in progress"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    async def close(self):
+        """Abandon summaries in progress; the next long turn starts them again"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        return {
+            "pending": len(self._tasks),
+            "summaries": self.summaries,
+            "failures": self.failures,
+            "tokens_saved": self.tokens_saved,
+        }
+
+    async def _summarize(self, user_id, covered: list):
+        outcome = "error"
+        try:
+            profile = await self.summarize(user_id, self.store.profile(user_id), covered)
+            before = self.store.history_tokens(user_id)
+            if self.store.replace_with_profile(user_id, profile, covered):
+                outcome = "ok"
+                self.summaries += 1
+                self.tokens_saved += max(0, before - self.store.history_tokens(user_id))
+                logger.info(f"📝 Summarized {len(covered)} messages of user {user_id} into a client profile")
+            else:
+                outcome = "stale"
+        except asyncio.CancelledError:
+            outcome = None
+            raise
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Failed to summarize conversation of user {user_id}: {e}")
+        finally:
+            del self._tasks[user_id]
+            if outcome is not None and self.on_result is not None:
+                self.on_result(outcome)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the OpenAI and Telegram Bot APIs
+Let the bot run end to end offline, with configurable model latency, token rate and injected errors
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+from aiohttp import web
+
+ANSWER_WORDS = (
+    "Начните", "с", "финансовой", "защиты", "семьи:", "страхование", "жизни", "и", "дохода.",
+    "Затем", "переходите", "к", "накоплениям", "на", "пенсию", "и", "образование", "детей.",
+)
+
+
+class _FakeServer:
+    """aiohttp application listening on 127.0.0.1; port 0 picks a free port"""
+
+    def __init__(self, port: int = 0):
+        self.port = port
+        self.app = web.Application()
+        self._runner = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class FakeOpenAI(_FakeServer):
+    """OpenAI-compatible /v1/chat/completions endpoint, streaming and non-streaming.
+
+    Time to first token is drawn from a log-normal distribution with the given
+    median and sigma; the answer then arrives at token_rate tokens per second.
+    error_rate of requests fail with HTTP 500 and rate_limit_rate with 429.
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0.5, latency_sigma: float = 0.5, tokens: int = 100,
+                 token_rate: float = 50.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0, seed=None):
+        super().__init__(port)
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tokens = tokens
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._ids = itertools.count(1)
+        self.app.router.add_post("/v1/chat/completions", self.handle_chat_completion)
+
+    def first_token_delay(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        return self.rng.lognormvariate(math.log(self.latency), self.latency_sigma)
+
+    def answer_tokens(self, max_tokens=None) -> list:
+        count = min(self.tokens, max_tokens or self.tokens)
+        return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(count)]
+
+    async def handle_chat_completion(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            failure = self._injected_failure()
+            if failure is not None:
+                self.errors += 1
+                return failure
+            await asyncio.sleep(self.first_token_delay())
+            tokens = self.answer_tokens(body.get("max_tokens"))
+            completion_id = f"chatcmpl-fake{next(self._ids)}"
+            if body.get("stream"):
+                return await self._stream(request, completion_id, body["model"], tokens)
+            await asyncio.sleep(len(tokens) / self.token_rate)
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            })
+        finally:
+            self.in_flight -= 1
+
+    def _injected_failure(self):
+        roll = self.rng.random()
+        if roll < self.error_rate:
+            return web.json_response(
+                {"error": {"message": "Injected server error", "type": "server_error"}}, status=500)
+        if roll < self.error_rate + self.rate_limit_rate:
+            return web.json_response(
+                {"error": {"message": "Injected rate limit", "type": "requests"}}, status=429)
+        return None
+
+    async def _stream(self, request: web.Request, completion_id: str, model: str, tokens: list):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(delta: dict, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        await send({"role": "assistant"})
+        for token in tokens:
+            await send({"content": token})
+            await asyncio.sleep(1 / self.token_rate)
+        await send({}, finish_reason="stop")
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+class FakeTelegram(_FakeServer):
+    """Bot API stand-in for the methods the bot calls, served under /bot<token>/<method>.
+
+    Every call is passed to on_request(method, params) if given, so a driver
+    can see what users would see; latency delays each response.
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0.0, on_request=None):
+        super().__init__(port)
+        self.latency = latency
+        self.on_request = on_request
+        self.calls = {}  # method -> count
+        self._message_ids = itertools.count(1)
+        self.me = {"id": 1, "is_bot": True, "first_name": "Financial Advisor", "username": "fake_advisor_bot"}
+        self.app.router.add_route("*", "/bot{token}/{method}", self.handle_method)
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        if self.on_request is not None:
+            self.on_request(method, params)
+
+        if method == "getMe":
+            result = self.me
+        elif method == "sendMessage":
+            result = self._message(int(params["chat_id"]), next(self._message_ids), params.get("text", ""))
+        elif method == "editMessageText":
+            result = self._message(int(params["chat_id"]), int(params["message_id"]), params.get("text", ""))
+        else:
+            result = True  # sendChatAction, setWebhook, deleteWebhook, ...
+        return web.json_response({"ok": True, "result": result})
+
+    def _message(self, chat_id: int, message_id: int, text: str) -> dict:
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": self.me,
+            "text": text,
+        }
+
+
+def main():
+    """Serve the fake OpenAI endpoint in its own process, e.g. for load_test.py --openai-url"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.5, help="median time to first token, seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal sigma of the latency")
+    parser.add_argument("--tokens", type=int, default=100, help="tokens per answer")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="tokens per second once streaming")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests failing with 429")
+    args = parser.parse_args()
+
+    async def serve():
+        server = FakeOpenAI(args.port, args.latency, args.latency_sigma, args.tokens, args.token_rate,
+                            args.error_rate, args.rate_limit_rate)
+        await server.start()
+        print(f"🤖 Fake OpenAI listening on {server.url}/v1")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Follow-up suggestions for the Financial Advisor Bot
+Parses the [Button] suggestions the model ends its answers with and answers them ahead of time in the background
+"""
+
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+BUTTON = re.compile(r"\[([^\[\]\n]{1,64})\]")
+MAX_LABEL_LENGTH = 32  # characters; callback data only carries the button index, the label is read back
+
+
+def is_caption(line: str) -> bool:
+    """Whether line introduces the buttons, like "Выберите тему:" does"""
+    return line.endswith(":") and len(line) <= 60
+
+
+def extract_suggestions(text: str, limit: int = 3):
+    """Split trailing [Button] lines off an answer; return (text without them, button labels).
+
+    Only lines at the very end that consist of bracketed labels, optionally
+    after a short caption ending in ":" ("Выберите тему:"), count, so
+    brackets inside the answer itself are left alone.
+    """
+    lines = text.rstrip().split("\n")
+    labels = []
+    caption = ""
+    while lines:
+        line = lines[-1].strip()
+        found = BUTTON.findall(line)
+        rest = BUTTON.sub("", line).strip(" \t*_-—–•|,.")
+        if not found or (rest and not is_caption(rest)):
+            break
+        labels = [label.strip(" *_") for label in found] + labels
+        lines.pop()
+        if rest:
+            caption = rest
+            break  # the caption starts the button block
+    if labels and not caption and lines and is_caption(lines[-1].strip(" *_")):
+        lines.pop()  # caption on a line of its own
+    labels = [label for label in dict.fromkeys(labels) if label and len(label) <= MAX_LABEL_LENGTH]
+    if not labels:
+        return text, []
+    return "\n".join(lines).rstrip(), labels[:limit]
+
+
+class _Prefetch:
+    __slots__ = ("tasks", "created")
+
+    def __init__(self, created: float):
+        self.tasks = {}  # question -> task returning the answer or None
+        self.created = created
+
+
+class FollowUpPrefetcher:
+    """Background answers to the follow-ups a user is most likely to tap next.
+
+    prefetch() starts fetch(user_id, question) for the suggested questions,
+    at most max_in_flight at a time across users. The next turn of that
+    user calls take(): a matching answer is returned (waiting for it if it
+    is still being generated) and all other prefetches of the user are
+    cancelled, since they were computed for a history that has moved on.
+    fetch returns None when the budget does not allow the request.
+    on_outcome is called with "prefetched", "hit", "wasted", "skipped" or
+    "failed"; hit / prefetched is the prefetch hit rate.
+    """
+
+    def __init__(self, fetch, max_in_flight: int = 4, ttl: float = 600.0, max_users: int = 1000,
+                 on_outcome=None, clock=time.monotonic):
+        self.fetch = fetch
+        self.max_in_flight = max_in_flight
+        self.ttl = ttl
+        self.max_users = max_users
+        self.on_outcome = on_outcome
+        self.clock = clock
+        self._users = OrderedDict()  # user_id -> _Prefetch, oldest first
+        self.in_flight = 0
+        self.counts = {"prefetched": 0, "hit": 0, "wasted": 0, "skipped": 0, "failed": 0}
+
+    def prefetch(self, user_id, questions: list):
+        """Start answering questions for user_id in the background, replacing earlier prefetches"""
+        self.discard(user_id)
+        entry = None
+        for question in questions:
+            if self.in_flight >= self.max_in_flight:
+                self._count("skipped")
+                continue
+            if entry is None:
+                entry = self._users[user_id] = _Prefetch(self.clock())
+            self.in_flight += 1
+            task = entry.tasks[question] = asyncio.ensure_future(self._fetch(user_id, question))
+            task.add_done_callback(self._done)
+        while len(self._users) > self.max_users:
+            self.discard(next(iter(self._users)))
+
+    async def take(self, user_id, question: str):
+        """Prefetched answer to question for user_id's next turn, or None; forgets the user's other prefetches"""
+        entry = self._users.pop(user_id, None)
+        if entry is None:
+            return None
+        task = entry.tasks.pop(question, None)
+        self._cancel(entry)
+        if task is None:
+            return None
+        if self.clock() - entry.created > self.ttl:
+            self._cancel_task(task)
+            return None
+        try:
+            answer = await task
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise
+            answer = None
+        except Exception:
+            answer = None
+        if answer is None:
+            return None
+        self._count("hit")
+        return answer
+
+    def discard(self, user_id):
+        """Drop user_id's prefetches, e.g. because the conversation was cleared"""
+        entry = self._users.pop(user_id, None)
+        if entry is not None:
+            self._cancel(entry)
+
+    async def close(self):
+        tasks = [task for entry in self._users.values() for task in entry.tasks.values()]
+        for user_id in list(self._users):
+            self.discard(user_id)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        prefetched = self.counts["prefetched"]
+        return {
+            **self.counts,
+            "in_flight": self.in_flight,
+            "hit_rate": round(self.counts["hit"] / prefetched, 3) if prefetched else None,
+        }
+
+    async def _fetch(self, user_id, question: str):
+        try:
+            answer = await self.fetch(user_id, question)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._count("failed")
+            logger.warning(f"Prefetching a follow-up for user {user_id} failed: {e}")
+            return None
+        self._count("skipped" if answer is None else "prefetched")
+        return answer
+
+    def _done(self, task):
+        # A task cancelled before it started never runs _fetch, so the slot is freed here
+        self.in_flight -= 1
+
+    def _cancel(self, entry: _Prefetch):
+        for task in entry.tasks.values():
+            self._cancel_task(task)
+
+    def _cancel_task(self, task):
+        if not task.done():
+            task.cancel()
+            self._count("wasted")
+        elif not task.cancelled() and task.exception() is None and task.result() is not None:
+            self._count("wasted")
+
+    def _count(self, outcome: str):
+        self.counts[outcome] += 1
+        if self.on_outcome is not None:
+            self.on_outcome(outcome)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Async LLM client for the Financial Advisor Bot
+Non-blocking OpenAI chat completions (whole or streamed) with a global concurrency cap and per-call timeouts
+"""
+
+import asyncio
+import logging
+from contextlib import contextmanager
+import openai
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+logger = logging.getLogger(__name__)
+
+
+class LLMClient:
+    """Bounded async wrapper around the OpenAI chat completion endpoint.
+
+    After open(), requests share one keep-alive connection pool instead of
+    the openai module opening a new HTTP session (and TLS handshake) per call.
+    """
+
+    def __init__(self, model: str, max_concurrency: int = 50, timeout: float = 60.0,
+                 max_tokens: int = 1000, temperature: float = 0.7, backend=None, keepalive_timeout: float = 60.0):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        # Native async call by default; any coroutine function with the same signature works
+        self.backend = backend or openai.ChatCompletion.acreate
+        self.keepalive_timeout = keepalive_timeout
+        self.session = None  # pooled aiohttp session, created by open()
+        self._semaphore = None
+        self.in_flight = 0
+        self.warmed = 0
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Created lazily so it binds to the running event loop"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @property
+    def pooled(self) -> bool:
+        """Whether requests go through the shared connection pool"""
+        return self.session is not None and not self.session.closed
+
+    async def open(self, warm_connections: int = 0):
+        """Create the connection pool and pre-open up to warm_connections connections to the API.
+
+        Warming is best effort: any HTTP answer leaves a connection in the
+        pool, and a network failure only costs the first requests a handshake.
+        """
+        if not self.pooled:
+            # One connection per concurrency slot; idle ones stay open for keepalive_timeout seconds
+            connector = TCPConnector(limit=self.max_concurrency, keepalive_timeout=self.keepalive_timeout,
+                                     ttl_dns_cache=300)
+            self.session = ClientSession(connector=connector)
+        if warm_connections > 0:
+            await self.warm(min(warm_connections, self.max_concurrency))
+
+    async def warm(self, connections: int):
+        """Open connections to the API concurrently so the first users skip DNS, TCP and TLS setup"""
+        url = openai.api_base.rstrip("/") + "/models"
+        headers = {"Authorization": f"Bearer {openai.api_key}"} if openai.api_key else {}
+
+        async def touch():
+            async with self.session.get(url, headers=headers, timeout=ClientTimeout(total=10)) as response:
+                await response.read()
+
+        results = await asyncio.gather(*(touch() for _ in range(connections)), return_exceptions=True)
+        failures = [result for result in results if isinstance(result, Exception)]
+        self.warmed += connections - len(failures)
+        if failures:
+            logger.warning(f"Could not pre-open {len(failures)} of {connections} OpenAI connections: {failures[0]!r}")
+        else:
+            logger.info(f"🔥 Pre-opened {connections} connections to {url}")
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @contextmanager
+    def _pool(self):
+        """Route openai requests started inside the block through the shared session"""
+        if not self.pooled:
+            yield
+            return
+        token = openai.aiosession.set(self.session)
+        try:
+            yield
+        finally:
+            openai.aiosession.reset(token)
+
+    async def complete(self, messages: list, model: str = None, timeout: float = None, on_model=None) -> str:
+        """Return the assistant reply for messages.
+
+        Waits for a free slot under the concurrency cap, then runs the request
+        under a timeout. Raises asyncio.TimeoutError when the deadline passes;
+        cancelling the caller cancels the in-flight request. on_model is
+        called with the model that answered, as for HedgedLLM.
+        """
+        timeout = timeout or self.timeout
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                with self._pool():
+                    response = await asyncio.wait_for(
+                        self.backend(
+                            model=model or self.model,
+                            messages=messages,
+                            max_tokens=self.max_tokens,
+                            temperature=self.temperature,
+                            request_timeout=timeout,
+                        ),
+                        timeout=timeout,
+                    )
+            finally:
+                self.in_flight -= 1
+        if on_model is not None:
+            on_model(model or self.model)
+        return response.choices[0].message.content
+
+    async def stream(self, messages: list, model: str = None, timeout: float = None, on_model=None):
+        """Yield reply text fragments as the model produces them.
+
+        Holds a concurrency slot for the whole stream; the timeout covers the
+        complete generation, not each chunk. on_model is called with the
+        model once the request is accepted.
+        """
+        timeout = timeout or self.timeout
+        loop = asyncio.get_running_loop()
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                deadline = loop.time() + timeout
+                # The response keeps its connection until the stream ends; only the request needs the pool set
+                with self._pool():
+                    chunks = await asyncio.wait_for(
+                        self.backend(
+                            model=model or self.model,
+                            messages=messages,
+                            max_tokens=self.max_tokens,
+                            temperature=self.temperature,
+                            request_timeout=timeout,
+                            stream=True,
+                        ),
+                        timeout=timeout,
+                    )
+                if on_model is not None:
+                    on_model(model or self.model)
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), deadline - loop.time())
+                        except StopAsyncIteration:
+                            break
+                        delta = chunk.choices[0].delta.get("content")
+                        if delta:
+                            yield delta
+                finally:
+                    await chunks.aclose()
+            finally:
+                self.in_flight -= 1
+
+
+class HedgedLLM:
+    """SLO policy on top of LLMClient: hedge slow requests with a faster fallback model.
+
+    If the primary model has not answered (complete) or produced its first
+    token (stream) within the deadline, or has already failed, the same
+    request is sent to fallback_model; whichever succeeds first wins and
+    the other is cancelled. on_result(path, seconds) is called with
+    "primary" or "fallback" and the winner's latency so deadlines can be
+    tuned; a caller's own on_model is called with the model that won.
+    """
+
+    def __init__(self, client: LLMClient, fallback_model: str, hedge_after: float = 20.0,
+                 first_token_after: float = 8.0, on_result=None):
+        self.client = client
+        self.fallback_model = fallback_model
+        self.hedge_after = hedge_after
+        self.first_token_after = first_token_after
+        self.on_result = on_result
+        self.hedged = 0
+        self.wins = {"primary": 0, "fallback": 0}
+
+    async def complete(self, messages: list, on_model=None) -> str:
+        """Whole reply from whichever model answers first"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        attempts = {asyncio.ensure_future(self.client.complete(messages)): "primary"}
+        try:
+            path, task = await self._race(attempts, self.hedge_after, lambda: self.client.complete(
+                messages, model=self.fallback_model))
+            reply = task.result()
+            self._record(path, loop.time() - started, on_model)
+            return reply
+        finally:
+            await self._cancel(attempts)
+
+    async def stream(self, messages: list, on_model=None):
+        """Yield reply fragments from whichever model produces its first token first"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        streams = {"primary": self.client.stream(messages)}
+        attempts = {asyncio.ensure_future(streams["primary"].__anext__()): "primary"}
+
+        def start_fallback():
+            streams["fallback"] = self.client.stream(messages, model=self.fallback_model)
+            return streams["fallback"].__anext__()
+
+        try:
+            path, task = await self._race(attempts, self.first_token_after, start_fallback)
+            await self._cancel(attempts)
+            for name in [name for name in streams if name != path]:
+                await streams.pop(name).aclose()
+            try:
+                first_token = task.result()
+            except StopAsyncIteration:
+                first_token = None  # empty completion
+            self._record(path, loop.time() - started, on_model)
+            if first_token is None:
+                return
+            yield first_token
+            async for token in streams[path]:
+                yield token
+        finally:
+            await self._cancel(attempts)
+            for chunks in streams.values():
+                await chunks.aclose()
+
+    async def _race(self, attempts: dict, deadline: float, start_fallback):
+        """Wait for the primary attempt, hedging after deadline; return (path, winning task)"""
+        done, _ = await asyncio.wait(set(attempts), timeout=deadline)
+        primary = next(iter(attempts))
+        if done and self._succeeded(primary):
+            return "primary", primary
+        self.hedged += 1
+        attempts[asyncio.ensure_future(start_fallback())] = "fallback"
+        pending = {task for task in attempts if not task.done()}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if self._succeeded(task):
+                    return attempts[task], task
+        # Both failed: surface the primary model's error
+        return "primary", primary
+
+    @staticmethod
+    async def _cancel(attempts: dict):
+        """Cancel unfinished attempts and wait until they have unwound"""
+        for task in attempts:
+            task.cancel()
+        await asyncio.gather(*attempts, return_exceptions=True)
+
+    @staticmethod
+    def _succeeded(task) -> bool:
+        if task.cancelled():
+            return False
+        error = task.exception()
+        return error is None or isinstance(error, StopAsyncIteration)
+
+    def _record(self, path: str, seconds: float, on_model=None):
+        self.wins[path] += 1
+        if self.on_result is not None:
+            self.on_result(path, seconds)
+        if on_model is not None:
+            on_model(self.fallback_model if path == "fallback" else self.client.model)
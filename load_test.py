@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the Financial Advisor Bot
+Drives the real update pipeline with thousands of simulated users against local fake OpenAI and
+Telegram servers and reports throughput, latency percentiles and peak memory
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import random
+import resource
+import sys
+import time
+
+import openai
+from telegram import Update
+from telegram.ext import Application
+
+import bot as bot_module
+from bot import FinancialAdvisorBot
+from fake_servers import FakeOpenAI, FakeTelegram
+
+LOAD_TEST_TOKEN = "123456:LOAD-TEST"
+QUESTIONS = (
+    "С чего начать, если я думаю о будущем семьи?",
+    "Как правильно планировать пенсионные накопления в США?",
+    "Нужна ли мне страховка жизни, если у меня двое детей?",
+    "Как накопить на колледж для ребёнка?",
+    "Что такое 401(k) и стоит ли в него вкладывать?",
+    "Как сохранить капитал и передать его детям?",
+)
+# Status lines the bot shows before answer text; they do not count as the first visible text
+STATUS_PREFIXES = ("✍️", "⏳")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024  # bytes on macOS, KiB on Linux
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+class _Turn:
+    __slots__ = ("sent_at", "first_text", "done")
+
+    def __init__(self, sent_at: float, done):
+        self.sent_at = sent_at
+        self.first_text = None
+        self.done = done  # future resolved with the final reply text
+
+
+class SimulatedUsers:
+    """Users that each send messages and wait for the bot's formatted final reply.
+
+    Replies are observed on the fake Telegram server through on_request():
+    the first message or edit showing answer text gives the time to first
+    text, and the message sent or edited with a parse_mode that is not a
+    partial edit (those end in "…") completes the turn.
+    """
+
+    def __init__(self, application: Application, timeout: float = 120.0, seed=None):
+        self.application = application
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.latencies = []
+        self.first_text = []
+        self.failed = 0
+        self.timeouts = 0
+        self._turns = {}  # chat_id -> _Turn awaiting its reply
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def on_request(self, method: str, params: dict):
+        if method not in ("sendMessage", "editMessageText"):
+            return
+        turn = self._turns.get(int(params["chat_id"]))
+        if turn is None or turn.done.done():
+            return
+        text = params.get("text", "")
+        if turn.first_text is None and not text.split("\n\n", 1)[-1].startswith(STATUS_PREFIXES):
+            turn.first_text = time.perf_counter() - turn.sent_at
+        if params.get("parse_mode") and not text.endswith("…"):
+            turn.done.set_result(text)
+
+    async def session(self, user_id: int, messages: int, think_time: float, start_after: float):
+        """One user's conversation: send, wait for the whole answer, think, repeat"""
+        await asyncio.sleep(start_after)
+        loop = asyncio.get_running_loop()
+        for _ in range(messages):
+            turn = self._turns[user_id] = _Turn(time.perf_counter(), loop.create_future())
+            await self.application.update_queue.put(self._update(user_id, self.rng.choice(QUESTIONS)))
+            try:
+                reply = await asyncio.wait_for(turn.done, self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                continue
+            self.latencies.append(time.perf_counter() - turn.sent_at)
+            if turn.first_text is not None:
+                self.first_text.append(turn.first_text)
+            if "Извините" in reply:
+                self.failed += 1
+            if think_time > 0:
+                await asyncio.sleep(self.rng.expovariate(1 / think_time))
+        self._turns.pop(user_id, None)
+
+    def _update(self, user_id: int, text: str) -> Update:
+        data = {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+                "text": text,
+            },
+        }
+        return Update.de_json(data, self.application.bot)
+
+
+async def run_load_test(args) -> dict:
+    """Run one load test with the bot as configured in the bot module; return the summary"""
+    rss_baseline = peak_rss_mb()
+    fake_openai = None
+    api_base = args.openai_url
+    if api_base is None:
+        fake_openai = FakeOpenAI(
+            latency=args.latency, latency_sigma=args.latency_sigma, tokens=args.tokens,
+            token_rate=args.token_rate, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+            seed=args.seed,
+        )
+        await fake_openai.start()
+        api_base = fake_openai.url + "/v1"
+    telegram = FakeTelegram(latency=args.telegram_latency)
+    await telegram.start()
+    saved_openai = openai.api_base, openai.api_key
+    openai.api_base, openai.api_key = api_base, "sk-load-test"
+
+    try:
+        bot = FinancialAdvisorBot()
+        bot.openai_available = True
+        application = (
+            Application.builder()
+            .token(LOAD_TEST_TOKEN)
+            .base_url(telegram.url + "/bot")
+            .connection_pool_size(args.pool_size)
+            .concurrent_updates(bot_module.TELEGRAM_CONCURRENT_UPDATES)
+            .updater(None)
+            .build()
+        )
+        bot.add_handlers(application)
+        users = SimulatedUsers(application, timeout=args.timeout, seed=args.seed)
+        telegram.on_request = users.on_request
+
+        async with application:
+            await application.start()
+            await bot.post_init(application)
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                users.session(user_id, args.messages, args.think_time, args.ramp_up * user_id / args.users)
+                for user_id in range(1, args.users + 1)
+            ))
+            elapsed = time.perf_counter() - started
+            await application.stop()
+            await bot.post_stop(application)
+        await bot.post_shutdown(application)
+    finally:
+        openai.api_base, openai.api_key = saved_openai
+        await telegram.stop()
+        if fake_openai is not None:
+            await fake_openai.stop()
+
+    replies = len(users.latencies)
+    summary = {
+        "users": args.users,
+        "messages": args.users * args.messages,
+        "replies": replies,
+        "failed": users.failed,
+        "timeouts": users.timeouts,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(replies / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_s": {f"p{q}": round(percentile(users.latencies, q / 100), 3) for q in (50, 95, 99)},
+        "first_text_s": {f"p{q}": round(percentile(users.first_text, q / 100), 3) for q in (50, 95, 99)},
+        "telegram_calls": dict(telegram.calls),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "baseline_rss_mb": round(rss_baseline, 1),
+    }
+    if fake_openai is not None:
+        summary["openai"] = {
+            "requests": fake_openai.requests,
+            "errors": fake_openai.errors,
+            "max_in_flight": fake_openai.max_in_flight,
+        }
+    return summary
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000, help="simulated users")
+    parser.add_argument("--messages", type=int, default=3, help="messages sent by each user")
+    parser.add_argument("--think-time", type=float, default=2.0, help="mean pause between a reply and the next message, seconds")
+    parser.add_argument("--ramp-up", type=float, default=10.0, help="seconds over which users join")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for a reply before giving up")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for questions, think time and fake latencies")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's INFO logging")
+
+    fake = parser.add_argument_group("fake OpenAI")
+    fake.add_argument("--openai-url", default=None, help="use an already running fake, e.g. http://127.0.0.1:8001/v1")
+    fake.add_argument("--latency", type=float, default=0.5, help="median time to first token, seconds")
+    fake.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal sigma of the latency")
+    fake.add_argument("--tokens", type=int, default=100, help="tokens per answer")
+    fake.add_argument("--token-rate", type=float, default=50.0, help="tokens per second once streaming")
+    fake.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with HTTP 500")
+    fake.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests failing with 429")
+
+    telegram = parser.add_argument_group("fake Telegram")
+    telegram.add_argument("--telegram-latency", type=float, default=0.02, help="Bot API response time, seconds")
+    telegram.add_argument("--pool-size", type=int, default=256, help="bot's HTTP connection pool size")
+
+    config = parser.add_argument_group("bot settings (override the environment)")
+    config.add_argument("--no-stream", action="store_true", help="send whole answers instead of streaming")
+    config.add_argument("--coalesce-window", type=float, default=None, help="COALESCE_WINDOW, seconds")
+    config.add_argument("--no-cache", action="store_true", help="disable the first-turn response cache")
+    config.add_argument("--db", default="", help="CONVERSATION_DB; by default history stays in memory")
+    config.add_argument("--rpm", type=int, default=10**6, help="OPENAI_RPM; the fake has no rate limits")
+    config.add_argument("--tpm", type=int, default=10**9, help="OPENAI_TPM")
+    config.add_argument("--telegram-rate", type=float, default=None, help="TELEGRAM_GLOBAL_RATE, messages per second")
+    return parser
+
+
+def configure_bot(args):
+    """Apply the command-line bot settings to the bot module"""
+    bot_module.OPENAI_API_KEY = "sk-load-test"
+    bot_module.STREAM_REPLIES = not args.no_stream
+    if args.coalesce_window is not None:
+        bot_module.COALESCE_WINDOW = args.coalesce_window
+    if args.no_cache:
+        bot_module.RESPONSE_CACHE_SIZE = 0
+    bot_module.CONVERSATION_DB = args.db
+    bot_module.OPENAI_RPM = args.rpm
+    bot_module.OPENAI_TPM = args.tpm
+    if args.telegram_rate is not None:
+        bot_module.TELEGRAM_GLOBAL_RATE = args.telegram_rate
+
+
+def main():
+    """Run the load test and print a summary"""
+    args = build_parser().parse_args()
+    configure_bot(args)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    mode = "whole answers" if args.no_stream else "streaming"
+    if not args.json:
+        print(f"🚀 {args.users} users × {args.messages} messages ({mode}), "
+              f"fake OpenAI {args.openai_url or f'p50 {args.latency}s + {args.tokens} tokens at {args.token_rate}/s'}")
+    summary = asyncio.run(run_load_test(args))
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False))
+        return
+
+    latency, first_text = summary["latency_s"], summary["first_text_s"]
+    print(f"replies      {summary['replies']}/{summary['messages']} in {summary['elapsed_s']:.1f}s "
+          f"({summary['throughput_rps']:.1f}/s), {summary['failed']} failed, {summary['timeouts']} timed out")
+    print(f"latency      p50 {latency['p50']:.2f}s  p95 {latency['p95']:.2f}s  p99 {latency['p99']:.2f}s")
+    print(f"first text   p50 {first_text['p50']:.2f}s  p95 {first_text['p95']:.2f}s  p99 {first_text['p99']:.2f}s")
+    if "openai" in summary:
+        print(f"openai       {summary['openai']['requests']} requests, {summary['openai']['errors']} injected errors, "
+              f"peak {summary['openai']['max_in_flight']} concurrent")
+    print(f"telegram     {', '.join(f'{method} {count}' for method, count in sorted(summary['telegram_calls'].items()))}")
+    print(f"peak RSS     {summary['peak_rss_mb']:.1f} MB ({summary['baseline_rss_mb']:.1f} MB before the bot started)")
+
+
+if __name__ == "__main__":
+    main()
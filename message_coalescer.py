@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Per-user message coalescing for the Financial Advisor Bot
+Merges bursts of messages (and messages sent while a reply is pending) into a single user turn
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Burst:
+    __slots__ = ("texts", "payload", "first_at", "last_at")
+
+    def __init__(self, now: float):
+        self.texts = []
+        self.payload = None
+        self.first_at = now
+        self.last_at = now
+
+
+class MessageCoalescer:
+    """Debounces each user's messages and answers them one turn at a time.
+
+    submit() never blocks: the first message of a burst starts a per-user
+    worker that waits until no new message has arrived for window seconds
+    (at most max_delay after the first one), then awaits
+    handler(user_id, merged_text, payload) with the payload of the latest
+    message. Messages arriving while that reply is pending form the next
+    burst, so one user never has two completions in flight.
+    """
+
+    def __init__(self, handler, window: float = 1.0, max_delay: float = 3.0, on_coalesced=None):
+        self.handler = handler
+        self.window = window
+        self.max_delay = max_delay
+        self.on_coalesced = on_coalesced  # called once per message merged into another
+        self._bursts = {}  # user_id -> _Burst waiting to be answered
+        self._workers = {}  # user_id -> worker task
+        self.saved_calls = 0
+
+    def submit(self, user_id, text: str, payload=None):
+        """Add a message to user_id's pending turn"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        burst = self._bursts.get(user_id)
+        if burst is None:
+            burst = self._bursts[user_id] = _Burst(now)
+        else:
+            self.saved_calls += 1
+            if self.on_coalesced is not None:
+                self.on_coalesced()
+        burst.texts.append(text)
+        burst.payload = payload
+        burst.last_at = now
+        if user_id not in self._workers:
+            self._workers[user_id] = asyncio.ensure_future(self._work(user_id))
+
+    async def join(self):
+        """Wait until every pending turn has been answered"""
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
+
+    def __contains__(self, user_id) -> bool:
+        """Whether user_id has a turn waiting or being answered"""
+        return user_id in self._workers
+
+    def pending(self) -> int:
+        """Users with a turn waiting or being answered"""
+        return len(self._workers)
+
+    async def _work(self, user_id):
+        loop = asyncio.get_running_loop()
+        try:
+            while user_id in self._bursts:
+                burst = self._bursts[user_id]
+                deadline = min(burst.last_at + self.window, burst.first_at + self.max_delay)
+                delay = deadline - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue  # re-check: more messages may have extended the window
+                del self._bursts[user_id]
+                try:
+                    await self.handler(user_id, "\n".join(burst.texts), burst.payload)
+                except Exception as e:
+                    logger.error(f"Error answering user {user_id}: {e}", exc_info=e)
+        finally:
+            del self._workers[user_id]
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+In-process metrics for the Financial Advisor Bot
+Counters, gauges and histograms rendered in the Prometheus text exposition format
+"""
+
+import time
+from bisect import bisect_left
+
+# Seconds; OpenAI calls and full replies take up to tens of seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000)
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._series = {}  # label values -> series state
+        if not labelnames:
+            self.labels()  # unlabelled metrics are exported as zero from the start
+
+    def labels(self, *values):
+        """Child metric for one combination of label values"""
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = self._new_series()
+        return series
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, series in self._series.items():
+            lines.extend(self._render_series(_format_labels(self.labelnames, values), values, series))
+        return lines
+
+
+class _CounterSeries:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+    _new_series = _CounterSeries
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _render_series(self, labels, values, series):
+        return [f"{self.name}{labels} {_format_value(series.value)}"]
+
+
+class Gauge(Counter):
+    """Value that goes up and down, or is read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), callback=None):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def dec(self, amount: float = 1):
+        self.labels().inc(-amount)
+
+    def set(self, value: float):
+        self.labels().value = value
+
+    def render(self) -> list:
+        if self.callback is not None:
+            self.labels().value = self.callback()
+        return super().render()
+
+
+class _HistogramSeries:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        # Non-cumulative counts keep observe() to one bisect and three additions
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("series", "started")
+
+    def __init__(self, series):
+        self.series = series
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.series.observe(time.perf_counter() - self.started)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help_text, labelnames)
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        """Context manager observing the duration of its block"""
+        return self.labels().time()
+
+    def _render_series(self, labels, values, series):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _format_value(bound)
+            bucket_labels = _format_labels(self.labelnames, values, 'le="' + le + '"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{self.name}_sum{labels} {_format_value(series.sum)}")
+        lines.append(f"{self.name}_count{labels} {series.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames, callback))
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class BotMetrics(MetricsRegistry):
+    """Metrics of the update pipeline exported on /metrics"""
+
+    def __init__(self):
+        super().__init__()
+        self.openai_latency = self.histogram(
+            "bot_openai_request_seconds", "OpenAI chat completion latency", ("model", "outcome"))
+        self.hedge_wins = self.histogram(
+            "bot_openai_hedge_win_seconds", "Latency of the request that won, by path (primary or fallback model)",
+            ("path",))
+        self.message_latency = self.histogram(
+            "bot_handle_message_seconds", "End-to-end handle_message latency")
+        self.first_text_latency = self.histogram(
+            "bot_first_text_seconds", "Time until the first answer text is visible to the user")
+        self.telegram_send_latency = self.histogram(
+            "bot_telegram_send_seconds", "Telegram Bot API send and edit latency", ("method",))
+        self.outbound_queue = self.gauge(
+            "bot_outbound_queue_depth", "Telegram sends and edits waiting for rate-limit room")
+        self.outbound_delay = self.histogram(
+            "bot_outbound_delay_seconds", "Time Telegram sends and edits wait in the outbound queue", ("priority",))
+        self.messages_in_flight = self.gauge(
+            "bot_messages_in_flight", "Messages currently being handled")
+        self.openai_in_flight = self.gauge(
+            "bot_openai_requests_in_flight", "OpenAI requests currently holding a concurrency slot")
+        self.openai_circuit = self.gauge(
+            "bot_openai_circuit_state", "OpenAI circuit breaker state: 0 closed, 1 half-open, 2 open")
+        self.degraded_answers = self.counter(
+            "bot_degraded_answers_total", "Answers served without OpenAI while the circuit was open", ("kind",))
+        self.prefetches = self.counter(
+            "bot_prefetch_total", "Background answers to suggested follow-ups by outcome; hit/prefetched is the hit rate",
+            ("outcome",))
+        self.admission_queue = self.gauge(
+            "bot_admission_queue_depth", "OpenAI requests waiting for rate-limit budget")
+        self.admission_wait = self.histogram(
+            "bot_admission_wait_seconds", "Time spent waiting for rate-limit budget")
+        self.coalesced_messages = self.counter(
+            "bot_coalesced_messages_total", "Messages merged into another turn, i.e. OpenAI calls saved")
+        self.summaries = self.counter(
+            "bot_summaries_total", "Background conversation summaries by outcome (ok, stale, error)", ("outcome",))
+        self.errors = self.counter(
+            "bot_errors_total", "Errors by exception type", ("type",))
+        self.tokens = self.histogram(
+            "bot_tokens_per_request", "Tokens per OpenAI request", ("kind",), buckets=TOKEN_BUCKETS)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Response cache for the Financial Advisor Bot
+Reuses answers to first-turn questions keyed on normalized text, model and prompt version
+"""
+
+import hashlib
+import random
+import re
+import time
+from collections import OrderedDict
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Canonical form of a question: case, punctuation, ё and spacing ignored"""
+    text = text.lower().replace("ё", "е")
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def prompt_version(system_prompt: str) -> str:
+    """Short fingerprint of the system prompt so edits invalidate cached answers"""
+    return hashlib.sha1(system_prompt.encode("utf-8")).hexdigest()[:12]
+
+
+class ResponseCache:
+    """TTL + LRU cache of answers with a probabilistic regenerate policy.
+
+    Each key keeps up to max_variants answers; a lookup regenerates instead
+    of serving with probability regenerate_probability (always while fewer
+    than min_variants answers are known), so repeated questions still get
+    some variety.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 24 * 3600, regenerate_probability: float = 0.1,
+                 min_variants: int = 1, max_variants: int = 3, clock=time.monotonic, rng=random.random):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.regenerate_probability = regenerate_probability
+        self.min_variants = min_variants
+        self.max_variants = max_variants
+        self.clock = clock
+        self.rng = rng
+        self._entries = OrderedDict()  # key -> (created_at, [answers]), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.regenerations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text: str, model: str, version: str) -> tuple:
+        return (model, version, normalize(text))
+
+    def get(self, key: tuple):
+        """Return a cached answer for key, or None when the caller should ask the model"""
+        entry = self._entries.get(key)
+        if entry is not None and self.clock() - entry[0] > self.ttl:
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        answers = entry[1]
+        if len(answers) < self.min_variants or self.rng() < self.regenerate_probability:
+            self.regenerations += 1
+            return None
+        self.hits += 1
+        return answers[int(self.rng() * len(answers)) % len(answers)]
+
+    def put(self, key: tuple, answer: str):
+        """Remember answer for key, evicting the least recently used keys beyond max_entries"""
+        entry = self._entries.get(key)
+        if entry is None or self.clock() - entry[0] > self.ttl:
+            self._entries[key] = (self.clock(), [answer])
+        else:
+            answers = entry[1]
+            answers.append(answer)
+            if len(answers) > self.max_variants:
+                answers.pop(0)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        lookups = self.hits + self.misses + self.regenerations
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "regenerations": self.regenerations,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
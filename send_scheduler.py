@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Outbound Telegram message scheduling for the Financial Advisor Bot
+Splits long answers and queues sends and edits under Telegram's global and per-chat rate limits
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import deque
+from telegram.error import RetryAfter
+
+from admission import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Send priorities: lower goes first
+FIRST = 0  # first message of a new answer, placeholders, command replies
+CONTINUATION = 1  # later chunks and edits of an answer the user already sees
+PRIORITY_NAMES = {FIRST: "first", CONTINUATION: "continuation"}
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list:
+    """Split text into chunks of at most limit characters.
+
+    Cuts at the last paragraph break that keeps the chunk at least half
+    full, else at a line break, else at a space, else mid-word.
+    """
+    chunks = []
+    while len(text) > limit:
+        for separator in ("\n\n", "\n", " "):
+            cut = text.rfind(separator, 0, limit)
+            if cut >= limit // 2:
+                chunks.append(text[:cut])
+                text = text[cut + len(separator):]
+                break
+        else:
+            chunks.append(text[:limit])
+            text = text[limit:]
+    if text or not chunks:
+        chunks.append(text)
+    return chunks
+
+
+class _Job:
+    __slots__ = ("chat_id", "call", "priority", "seq", "future", "queued_at", "retry", "attempts")
+
+    def __init__(self, chat_id, call, priority: int, seq: int, future, queued_at: float, retry: bool):
+        self.chat_id = chat_id
+        self.call = call
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+        self.queued_at = queued_at
+        self.retry = retry
+        self.attempts = 0
+
+
+class SendScheduler:
+    """Queues Bot API calls so the bot stays under Telegram's flood limits.
+
+    Calls to one chat run one at a time in FIFO order, at most chat_rate per
+    second after a burst of chat_burst; across chats at most rate per second.
+    Among chats that may send, the one whose next call has the best priority
+    goes first, so new answers are not stuck behind continuation chunks of
+    long ones. A RetryAfter from Telegram pauses that chat for retry_after
+    seconds and, if retry is set, resends the call (up to max_retries times).
+    """
+
+    def __init__(self, rate: float = 30.0, chat_rate: float = 1.0, chat_burst: int = 3, max_retries: int = 3,
+                 on_delay=None):
+        self.rate = rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.on_delay = on_delay  # called with (priority, seconds queued) when a call starts
+        self._chats = {}  # chat_id -> deque of _Job, for chats with queued or running calls
+        self._busy = set()  # chats with a call in flight
+        self._buckets = {}  # chat_id -> TokenBucket
+        self._paused = {}  # chat_id -> loop time until which Telegram asked us to wait
+        self._ready = []  # heap of (priority, seq, chat_id) that may send now
+        self._delayed = []  # heap of (ready_at, chat_id)
+        self._global = None
+        self._wakeup = None
+        self._worker = None
+        self._seq = itertools.count()
+        self._pruned_at = 0.0
+        self.queued = 0
+        self.sent = 0
+        self.flood_waits = 0
+
+    async def send(self, chat_id, call, priority: int = FIRST, retry: bool = True):
+        """Run call() (a Bot API coroutine function) for chat_id when the limits allow; return its result"""
+        loop = asyncio.get_running_loop()
+        if self._global is None:
+            self._global = TokenBucket(self.rate * 60, loop.time(), capacity=max(1.0, self.rate))
+            self._wakeup = asyncio.Event()
+        job = _Job(chat_id, call, priority, next(self._seq), loop.create_future(), loop.time(), retry)
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            queue = self._chats[chat_id] = deque()
+        queue.append(job)
+        self.queued += 1
+        if len(queue) == 1 and chat_id not in self._busy:
+            self._schedule_chat(chat_id, loop.time())
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._run())
+        self._wakeup.set()
+        return await job.future
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        return {"queued": self.queued, "sent": self.sent, "flood_waits": self.flood_waits}
+
+    def _bucket(self, chat_id, now: float) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate * 60, now, capacity=self.chat_burst)
+        return bucket
+
+    def _schedule_chat(self, chat_id, now: float):
+        """Put a chat with queued calls on the ready or delayed heap"""
+        bucket = self._bucket(chat_id, now)
+        bucket.refill(now)
+        ready_at = max(self._paused.get(chat_id, 0.0), now + bucket.wait_time(1))
+        if ready_at <= now:
+            head = self._chats[chat_id][0]
+            heapq.heappush(self._ready, (head.priority, head.seq, chat_id))
+        else:
+            heapq.heappush(self._delayed, (ready_at, chat_id))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._chats:
+            self._wakeup.clear()
+            now = loop.time()
+            if now - self._pruned_at > 60:
+                self._prune(now)
+            while self._delayed and self._delayed[0][0] <= now:
+                _, chat_id = heapq.heappop(self._delayed)
+                self._paused.pop(chat_id, None)
+                head = self._chats[chat_id][0]
+                heapq.heappush(self._ready, (head.priority, head.seq, chat_id))
+            if not self._ready:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._global.refill(now)
+            if self._global.level < 1:
+                await asyncio.sleep(self._global.wait_time(1))
+                continue
+
+            _, _, chat_id = heapq.heappop(self._ready)
+            job = self._chats[chat_id].popleft()
+            if job.future.done():  # caller gave up while queued
+                self.queued -= 1
+                self._next(chat_id, now)
+                continue
+            self._global.level -= 1
+            self._buckets[chat_id].level -= 1
+            self._busy.add(chat_id)
+            asyncio.ensure_future(self._deliver(job))
+        self._prune(loop.time())
+
+    async def _deliver(self, job: _Job):
+        loop = asyncio.get_running_loop()
+        if job.attempts == 0 and self.on_delay is not None:
+            self.on_delay(job.priority, loop.time() - job.queued_at)
+        try:
+            result = await job.call()
+        except RetryAfter as e:
+            self.flood_waits += 1
+            self._paused[job.chat_id] = loop.time() + e.retry_after
+            if job.retry and job.attempts < self.max_retries and not job.future.done():
+                logger.warning(f"Flood control in chat {job.chat_id}, resending in {e.retry_after}s")
+                job.attempts += 1
+                self._chats[job.chat_id].appendleft(job)
+                self._finish(job.chat_id)
+                return
+            if not job.future.done():
+                job.future.set_exception(e)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        self.queued -= 1
+        self._finish(job.chat_id)
+
+    def _finish(self, chat_id):
+        self._busy.discard(chat_id)
+        self._next(chat_id, asyncio.get_running_loop().time())
+        self._wakeup.set()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._run())
+
+    def _next(self, chat_id, now: float):
+        if self._chats[chat_id]:
+            self._schedule_chat(chat_id, now)
+        elif chat_id not in self._busy:
+            del self._chats[chat_id]
+
+    def _prune(self, now: float):
+        """Forget rate state of idle chats that have their whole burst back"""
+        self._pruned_at = now
+        for chat_id in list(self._buckets):
+            bucket = self._buckets[chat_id]
+            bucket.refill(now)
+            if chat_id not in self._chats and bucket.level >= bucket.capacity:
+                del self._buckets[chat_id]
+        for chat_id in [chat_id for chat_id, until in self._paused.items() if until <= now]:
+            del self._paused[chat_id]
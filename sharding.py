@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Horizontal scaling for the Financial Advisor Bot
+A dispatcher that routes each Telegram update to a worker process by consistent hashing on the user id
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from bisect import bisect
+from collections import OrderedDict
+from aiohttp import ClientConnectorError, ClientError, ClientSession, ClientTimeout
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+from web_server import WebServer
+
+logger = logging.getLogger(__name__)
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes.
+
+    Adding or removing a node only moves the keys of that node, so users
+    keep their worker (and its cached history) when another worker fails.
+    """
+
+    def __init__(self, nodes=(), replicas: int = 64):
+        self.replicas = replicas
+        self._hashes = []  # sorted virtual node positions
+        self._owners = {}  # position -> node
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value) -> int:
+        return int.from_bytes(hashlib.md5(str(value).encode("utf-8")).digest()[:8], "big")
+
+    def __contains__(self, node) -> bool:
+        return self._hash(f"{node}#0") in self._owners
+
+    def __len__(self) -> int:
+        return len(self._hashes) // self.replicas
+
+    def add(self, node):
+        for replica in range(self.replicas):
+            position = self._hash(f"{node}#{replica}")
+            if position not in self._owners:
+                self._owners[position] = node
+                self._hashes.insert(bisect(self._hashes, position), position)
+
+    def remove(self, node):
+        for replica in range(self.replicas):
+            position = self._hash(f"{node}#{replica}")
+            if self._owners.get(position) == node:
+                del self._owners[position]
+                self._hashes.remove(position)
+
+    def node_for(self, key):
+        """Node owning key, or None when the ring is empty"""
+        if not self._hashes:
+            return None
+        index = bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._owners[self._hashes[index]]
+
+
+def update_user_id(update: Update):
+    """Key an update is routed by: its user, or its chat for updates without one"""
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return update.update_id
+
+
+class ShardDispatcher:
+    """Forwards Telegram updates to worker processes, each user always to the same worker.
+
+    Workers are bots started with BOT_MODE=worker, which accept updates on
+    path like a webhook. Every worker has one FIFO queue drained by a single
+    sender, so one user's updates arrive in order. A worker that fails a
+    forward or its /ready check leaves the ring: its queued and future
+    updates move to the next worker on the ring, which reads those users'
+    history from the shared conversation store. It rejoins once /ready
+    succeeds again (e.g. after a restart) and gets its users back.
+
+    Whenever a user changes workers, in either direction, their updates are
+    held until the previous worker reports (on /busy) that it has finished
+    the user's turns and flushed their history, or until handover_timeout
+    after the last update it was sent. Turns of one user therefore never
+    overlap on two workers, and the new worker reads complete history.
+    While no worker is in the ring, up to max_waiting updates wait for the
+    first one to rejoin. secret_token is required: workers only answer
+    /busy to callers presenting it.
+    """
+
+    def __init__(self, workers: list, port: int, path: str = "/telegram", secret_token: str = None,
+                 health_interval: float = 2.0, timeout: float = 5.0, handover_timeout: float = 60.0,
+                 handover_interval: float = 0.25, max_waiting: int = 10000):
+        if not secret_token:
+            raise ValueError("ShardDispatcher needs secret_token (WEBHOOK_SECRET) to authenticate to its workers")
+        self.workers = list(workers)  # base URLs, e.g. http://10.0.0.2:8081
+        self.path = path
+        self.secret_token = secret_token
+        self.health_interval = health_interval
+        self.timeout = timeout
+        self.handover_timeout = handover_timeout  # longest a worker may still be answering a user it was sent
+        self.handover_interval = handover_interval  # seconds between /busy polls of a previous worker
+        self.max_waiting = max_waiting  # updates kept while no worker is healthy; later ones are dropped
+        self.ring = HashRing(self.workers)
+        self.web_server = WebServer(port, stats=self.stats)
+        self.forwarded = {worker: 0 for worker in self.workers}
+        self.failures = {worker: 0 for worker in self.workers}
+        self.rebalances = 0
+        self.handovers = 0
+        self.dropped = 0
+        self._headers = {"X-Telegram-Bot-Api-Secret-Token": secret_token}
+        self._waiting = []  # (key, update) received while the ring was empty, in order
+        self._queues = {}  # worker -> asyncio.Queue of update dicts
+        self._last_sent = OrderedDict()  # key -> (worker, time) of its latest forward, oldest first
+        self._held = {}  # key -> updates waiting for the previous worker to finish, in order
+        self._handing_over = {}  # previous worker -> {key: deadline} of held keys
+        self._pollers = {}  # previous worker -> task polling its /busy
+        self._tasks = []
+        self._session = None
+
+    def add_handlers(self, application: Application):
+        """Forward every update instead of handling it here"""
+        application.add_handler(TypeHandler(Update, self.forward))
+
+    async def forward(self, update: Update, context=None):
+        """Queue update for the worker owning its user; never waits on the network"""
+        self.route(update_user_id(update), update.to_dict())
+
+    def route(self, key, data: dict):
+        held = self._held.get(key)
+        if held is not None:
+            held.append(data)  # behind the user's updates waiting for a handover
+            return
+        worker = self.ring.node_for(key)
+        if worker is None:
+            if len(self._waiting) >= self.max_waiting:
+                self.dropped += 1
+                logger.error(f"No healthy worker and {len(self._waiting)} updates waiting, "
+                             f"dropping update {data.get('update_id')}")
+                return
+            if not self._waiting:
+                logger.error("No healthy worker, holding updates until one is ready")
+            self._waiting.append((key, data))
+            return
+        self._queues[worker].put_nowait((key, data))
+
+    async def post_init(self, application: Application):
+        """Start forwarding and health checks, then report ready"""
+        await self.start()
+        self.web_server.ready = True
+
+    async def post_stop(self, application: Application):
+        """Forward updates still queued"""
+        await self.drain()
+
+    async def post_shutdown(self, application: Application):
+        await self.close()
+        await self.web_server.stop()
+
+    async def start(self):
+        self._session = ClientSession(timeout=ClientTimeout(total=self.timeout))
+        for worker in self.workers:
+            self._queues[worker] = asyncio.Queue()
+            self._tasks.append(asyncio.ensure_future(self._send_forever(worker)))
+        self._tasks.append(asyncio.ensure_future(self._check_health_forever()))
+
+    async def drain(self):
+        """Wait until queued and held updates have been forwarded; those waiting for a worker are lost"""
+        while True:
+            for queue in self._queues.values():
+                await queue.join()
+            if self._pollers:
+                await asyncio.gather(*list(self._pollers.values()), return_exceptions=True)
+            elif all(queue.empty() for queue in self._queues.values()):
+                if self._waiting:
+                    logger.warning(f"No healthy worker, {len(self._waiting)} updates were not forwarded")
+                return
+
+    async def close(self):
+        tasks = self._tasks + list(self._pollers.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def stats(self) -> dict:
+        """Ring membership and forwarding counters served on /stats"""
+        return {
+            "workers": {
+                worker: {
+                    "healthy": worker in self.ring,
+                    "queued": self._queues[worker].qsize() if worker in self._queues else 0,
+                    "forwarded": self.forwarded[worker],
+                    "failures": self.failures[worker],
+                }
+                for worker in self.workers
+            },
+            "rebalances": self.rebalances,
+            "handovers": self.handovers,
+            "held_users": len(self._held),
+            "waiting": len(self._waiting),
+            "dropped": self.dropped,
+        }
+
+    async def _send_forever(self, worker: str):
+        queue = self._queues[worker]
+        while True:
+            key, data = await queue.get()
+            try:
+                if worker not in self.ring or key in self._held:
+                    self.route(key, data)  # queued before the worker left the ring or the handover began
+                    continue
+                previous = self._previous_worker(key, worker)
+                if previous is not None:
+                    self._hold(key, data, previous)
+                    continue
+                async with self._session.post(worker + self.path, json=data, headers=self._headers) as response:
+                    if response.status != 200:
+                        raise ClientError(f"HTTP {response.status}")
+                self.forwarded[worker] += 1
+                self._sent(key, worker)
+            except (ClientError, asyncio.TimeoutError) as e:
+                self.failures[worker] += 1
+                logger.warning(f"Forwarding to {worker} failed ({e}), moving its users to other workers")
+                self._leave(worker, (key, data))
+            finally:
+                queue.task_done()
+
+    def _leave(self, worker: str, unsent=None):
+        if worker in self.ring:
+            self.ring.remove(worker)
+            self.rebalances += 1
+        # Hand the failed and queued updates to the new owners, keeping each user's order
+        if unsent is not None:
+            self.route(*unsent)
+        queue = self._queues[worker]
+        while not queue.empty():
+            self.route(*queue.get_nowait())
+            queue.task_done()
+
+    def _previous_worker(self, key, worker: str):
+        """Another worker that may still be answering key, or None"""
+        sent = self._last_sent.get(key)
+        if sent is None or sent[0] == worker or time.monotonic() - sent[1] > self.handover_timeout:
+            return None
+        return sent[0]
+
+    def _sent(self, key, worker: str):
+        now = time.monotonic()
+        self._last_sent[key] = (worker, now)
+        self._last_sent.move_to_end(key)
+        # Forwards older than handover_timeout are answered by now
+        while self._last_sent:
+            oldest_key, (_, sent_at) = next(iter(self._last_sent.items()))
+            if now - sent_at <= self.handover_timeout:
+                break
+            del self._last_sent[oldest_key]
+
+    def _hold(self, key, data: dict, previous: str):
+        """Keep key's updates back until previous has finished with key"""
+        self._held[key] = [data]
+        self.handovers += 1
+        self._handing_over.setdefault(previous, {})[key] = self._last_sent[key][1] + self.handover_timeout
+        if previous not in self._pollers:
+            self._pollers[previous] = asyncio.ensure_future(self._hand_over(previous))
+
+    async def _hand_over(self, previous: str):
+        keys = self._handing_over[previous]
+        try:
+            while True:
+                busy = await self._busy(previous, list(keys))
+                now = time.monotonic()
+                for key, deadline in list(keys.items()):
+                    if key not in busy or now >= deadline:
+                        del keys[key]
+                        self._release(key)
+                if not keys:
+                    return
+                await asyncio.sleep(self.handover_interval)
+        finally:
+            del self._handing_over[previous]
+            del self._pollers[previous]
+
+    async def _busy(self, worker: str, keys: list) -> set:
+        """Which of keys worker is still answering"""
+        try:
+            async with self._session.post(worker + "/busy", json={"users": keys}, headers=self._headers) as response:
+                if response.status != 200:
+                    raise ClientError(f"HTTP {response.status}")
+                return set((await response.json())["busy"])
+        except ClientConnectorError:
+            return set()  # the process is gone, and its turns with it
+        except (ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+            logger.warning(f"Handover check on {worker} failed ({e}), holding {len(keys)} users until it answers")
+            return set(keys)
+
+    def _release(self, key):
+        """Forward key's held updates to its current worker"""
+        self._last_sent.pop(key, None)
+        for data in self._held.pop(key):
+            self.route(key, data)
+
+    async def _check_health_forever(self):
+        while True:
+            await asyncio.gather(*(self._check_health(worker) for worker in self.workers))
+            await asyncio.sleep(self.health_interval)
+
+    async def _check_health(self, worker: str):
+        try:
+            async with self._session.get(worker + "/ready") as response:
+                healthy = response.status == 200
+        except (ClientError, asyncio.TimeoutError):
+            healthy = False
+        if healthy and worker not in self.ring:
+            self.ring.add(worker)
+            self.rebalances += 1
+            logger.info(f"🔀 Worker {worker} is ready, {len(self.ring)} of {len(self.workers)} workers in the ring")
+            waiting, self._waiting = self._waiting, []
+            for key, data in waiting:
+                self.route(key, data)
+        elif not healthy and worker in self.ring:
+            self.failures[worker] += 1
+            logger.warning(f"Worker {worker} is not ready, moving its users to other workers")
+            self._leave(worker)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Progressive Telegram replies for streamed AI answers
+Posts a placeholder message and edits it in throttled chunks as tokens arrive
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+from functools import partial
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter
+
+from send_scheduler import CONTINUATION, FIRST, TELEGRAM_MESSAGE_LIMIT, split_message
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingReply:
+    """Placeholder message that is edited as the answer grows"""
+
+    def __init__(self, message, header: str = "", placeholder: str = "…", edit_interval: float = 1.0,
+                 send_latency=None, scheduler=None, render=None):
+        self.message = message  # incoming user message we reply to
+        self.render = render  # optional Markdown -> Telegram HTML converter for partial and final text
+        self.send_latency = send_latency  # optional Histogram labelled by Bot API method
+        self.scheduler = scheduler  # optional SendScheduler all sends and edits are queued on
+        self.header = header  # plain-text prefix shown while streaming
+        self.placeholder = placeholder
+        self.edit_interval = edit_interval
+        self.sent = None
+        self.started = time.monotonic()
+        self.first_text_at = None
+        self.edits = 0
+        self._shown = ""
+        self._next_edit_at = 0.0
+        self._edit_task = None
+
+    @property
+    def time_to_first_text(self):
+        """Seconds from construction until model text first became visible"""
+        if self.first_text_at is None:
+            return None
+        return self.first_text_at - self.started
+
+    async def start(self):
+        """Post the placeholder message"""
+        self.sent = await self._request(
+            "sendMessage", partial(self.message.reply_text, self.header + self.placeholder), FIRST)
+
+    async def show_status(self, status: str):
+        """Replace the placeholder with a status line (not counted as answer text)"""
+        await self._request("editMessageText", partial(self.sent.edit_text, self.header + status), CONTINUATION)
+
+    async def update(self, text: str):
+        """Show the partial answer, at most once per edit_interval.
+
+        Never blocks on Telegram: the edit runs in the background and updates
+        arriving while it is in flight are folded into the next one.
+        """
+        if self._edit_task is not None and not self._edit_task.done():
+            return
+        if time.monotonic() < self._next_edit_at or not text.strip():
+            return
+        body = (self.header + text)[:TELEGRAM_MESSAGE_LIMIT - 1]
+        if self.render is not None:
+            body = self.render(body)
+        self._edit_task = asyncio.ensure_future(self._background_edit(body + "…"))
+
+    async def finish(self, body: str, parse_mode: str = None, reply_markup=None):
+        """Replace the placeholder with the complete, formatted message body.
+
+        Bodies over Telegram's length limit are split at paragraph breaks:
+        the placeholder shows the first part and the rest follow as new messages.
+        reply_markup (e.g. an inline keyboard) goes on the last message.
+        With a renderer the body is Markdown and each part is sent as HTML.
+        """
+        if self._edit_task is not None:
+            await asyncio.gather(self._edit_task, return_exceptions=True)
+        chunks = split_message(body)
+        if self.render is not None:
+            chunks = [self.render(chunk) for chunk in chunks]
+            parse_mode = ParseMode.HTML
+        await self._edit(chunks[0], parse_mode=parse_mode, final=True,
+                         reply_markup=reply_markup if len(chunks) == 1 else None)
+        for i, chunk in enumerate(chunks[1:], 2):
+            markup = reply_markup if i == len(chunks) else None
+            await self._request(
+                "sendMessage", partial(self.message.reply_text, chunk, parse_mode=parse_mode, reply_markup=markup),
+                CONTINUATION)
+
+    async def _background_edit(self, body: str):
+        try:
+            await self._edit(body, parse_mode=ParseMode.HTML if self.render is not None else None)
+        except Exception as e:
+            logger.warning(f"Partial reply edit failed: {e}")
+
+    async def _edit(self, body: str, parse_mode: str = None, final: bool = False, reply_markup=None):
+        if body == self._shown and reply_markup is None:
+            return
+        edit = partial(self.sent.edit_text, body, parse_mode=parse_mode, reply_markup=reply_markup)
+        try:
+            # Partial edits are not resent after flood control: a newer one will follow
+            await self._request("editMessageText", edit, CONTINUATION, retry=final)
+        except RetryAfter as e:
+            # Flood control: hold further edits back for as long as Telegram asks
+            self._next_edit_at = time.monotonic() + e.retry_after
+            if not final:
+                return
+            # The final text must arrive: wait it out once, then count the resend as shown
+            await asyncio.sleep(e.retry_after)
+            await self._request("editMessageText", edit, CONTINUATION)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+        if self.first_text_at is None:
+            self.first_text_at = time.monotonic()
+        self._shown = body
+        self.edits += 1
+        self._next_edit_at = time.monotonic() + self.edit_interval
+
+    async def _request(self, method: str, call, priority: int, retry: bool = True):
+        """Run a Bot API call, through the scheduler if there is one"""
+        async def timed_call():
+            with self._timed(method):
+                return await call()
+
+        if self.scheduler is None:
+            return await timed_call()
+        return await self.scheduler.send(self.message.chat_id, timed_call, priority, retry=retry)
+
+    def _timed(self, method: str):
+        if self.send_latency is None:
+            return contextlib.nullcontext()
+        return self.send_latency.labels(method).time()
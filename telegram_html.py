@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Markdown to Telegram HTML for the Financial Advisor Bot
+Turns the Markdown the model writes into HTML Telegram always accepts, in one pass over the text
+"""
+
+import re
+
+SPECIAL = re.compile(r"[`\[*_~&<>]")
+LINK = re.compile(r"\[([^\[\]\n]+)\]\((https?://[^\s()]+)\)")
+HEADING = re.compile(r"\s{0,3}#{1,6}\s+(.*?)[\s#]*$")
+BULLET = re.compile(r"(\s*)[-*+]\s+(?=\S)")
+ESCAPES = {"&": "&amp;", "<": "&lt;", ">": "&gt;"}
+TAGS = {"**": "b", "__": "b", "*": "i", "_": "i", "~~": "s"}
+
+
+def escape(text: str) -> str:
+    """Escape text for Telegram HTML"""
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def markdown_to_html(text: str) -> str:
+    """Telegram HTML for Markdown as chat models write it.
+
+    Supports **bold**, __bold__, *italic*, _italic_, ~~strike~~, `code`,
+    ``` fences, [links](https://...), # headings (bold) and -/*/+ bullets
+    (•). Everything else is escaped, and markers without a partner on the
+    same line stay as literal text, so the result is valid HTML for any
+    input, including a partial answer that is still streaming in.
+    """
+    lines = []
+    code = None  # lines of an open ``` block
+    for line in text.split("\n"):
+        if line.lstrip().startswith("```"):
+            if code is None:
+                code = []
+            else:
+                lines.append(f"<pre>{escape(chr(10).join(code))}</pre>")
+                code = None
+            continue
+        if code is not None:
+            code.append(line)
+            continue
+        heading = HEADING.match(line)
+        if heading:
+            title = heading.group(1).replace("**", "").replace("__", "")
+            lines.append(f"<b>{_inline(title)}</b>" if title else "")
+            continue
+        bullet = BULLET.match(line)
+        if bullet:
+            lines.append(f"{bullet.group(1)}• {_inline(line[bullet.end():])}")
+            continue
+        lines.append(_inline(line))
+    if code is not None:
+        lines.append(f"<pre>{escape(chr(10).join(code))}</pre>")  # unclosed, e.g. while streaming
+    return "\n".join(lines)
+
+
+def _inline(line: str) -> str:
+    """Render one line's inline markup; openers are emitted as literals and patched into tags when closed"""
+    pieces = []
+    stack = []  # (marker, index of its piece) of open emphasis, innermost last
+    pos = 0
+    while True:
+        match = SPECIAL.search(line, pos)
+        if match is None:
+            pieces.append(line[pos:])
+            break
+        i = match.start()
+        if i > pos:
+            pieces.append(line[pos:i])
+        char = line[i]
+        pos = i + 1
+        if char in ESCAPES:
+            pieces.append(ESCAPES[char])
+            continue
+        if char == "`":
+            end = line.find("`", pos)
+            if end > pos:
+                pieces.append(f"<code>{escape(line[pos:end])}</code>")
+                pos = end + 1
+            else:
+                pieces.append("`")
+            continue
+        if char == "[":
+            link = LINK.match(line, i)
+            if link:
+                url = escape(link.group(2)).replace('"', "&quot;")
+                pieces.append(f'<a href="{url}">{escape(link.group(1))}</a>')
+                pos = link.end()
+            else:
+                pieces.append("[")
+            continue
+
+        marker = line[i:i + 2] if line[i:i + 2] in ("**", "__", "~~") else char
+        if marker == "~":
+            pieces.append("~")
+            continue
+        pos = i + len(marker)
+        before = line[i - 1] if i else " "
+        after = line[pos] if pos < len(line) else " "
+        can_open = not after.isspace()
+        can_close = not before.isspace()
+        if char == "_":
+            # snake_case names and the like are not emphasis
+            can_open = can_open and not before.isalnum()
+            can_close = can_close and not after.isalnum()
+        opened = next((depth for depth in range(len(stack) - 1, -1, -1) if stack[depth][0] == marker), None)
+        if can_close and opened is not None and stack[opened][1] < len(pieces) - 1:
+            # Markers opened inside this span without a partner stay literal, so tags always nest
+            index = stack[opened][1]
+            del stack[opened:]
+            pieces[index] = f"<{TAGS[marker]}>"
+            pieces.append(f"</{TAGS[marker]}>")
+        elif can_open:
+            stack.append((marker, len(pieces)))
+            pieces.append(marker)
+        else:
+            pieces.append(marker)
+    return "".join(pieces)
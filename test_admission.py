@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test cases for RPM/TPM admission control
+"""
+
+import unittest
+import asyncio
+
+from admission import AdmissionController, QueueFullError
+
+
+class TestAdmissionController(unittest.TestCase):
+    """Test cases for AdmissionController"""
+
+    def test_requests_within_budget_pass_immediately(self):
+        """Test that nothing waits while both buckets have room"""
+        admission = AdmissionController(rpm=60, tpm=10000)
+
+        async def run():
+            for _ in range(5):
+                await asyncio.wait_for(admission.acquire(1, 100), 0.01)
+
+        asyncio.run(run())
+        self.assertEqual(admission.stats(), {"queued": 0, "admitted": 5, "rejected": 0})
+
+    def test_rpm_limit_queues_and_reports_position(self):
+        """Test that requests beyond RPM wait for refill and learn their position"""
+        admission = AdmissionController(rpm=600, tpm=10**6)  # refills 10 requests per second
+        positions = []
+
+        async def notify(position):
+            positions.append(position)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await asyncio.gather(*(admission.acquire(i, 1, on_queued=notify) for i in range(602)))
+            return loop.time() - started
+
+        elapsed = asyncio.run(run())
+        self.assertEqual(positions, [1, 2])
+        self.assertGreater(elapsed, 0.15)
+        self.assertEqual(admission.queued, 0)
+
+    def test_tpm_limit(self):
+        """Test that a request needing more tokens than are left waits"""
+        admission = AdmissionController(rpm=1000, tpm=6000)  # 100 tokens per second
+        order = []
+
+        async def request(user_id, tokens):
+            await admission.acquire(user_id, tokens)
+            order.append(user_id)
+
+        async def run():
+            await request(1, 5990)
+            await asyncio.wait_for(request(2, 20), 1)
+
+        asyncio.run(run())
+        self.assertEqual(order, [1, 2])
+
+    def test_round_robin_across_users(self):
+        """Test that a user with many queued requests does not starve others"""
+        admission = AdmissionController(rpm=600, tpm=10**6)
+        order = []
+
+        async def request(user_id):
+            await admission.acquire(user_id, 1)
+            order.append(user_id)
+
+        async def run():
+            await asyncio.gather(*(request(0) for _ in range(600)))  # drain the bucket
+            order.clear()
+            tasks = [asyncio.ensure_future(request(1)) for _ in range(3)]
+            await asyncio.sleep(0)
+            tasks.append(asyncio.ensure_future(request(2)))
+            await asyncio.gather(*tasks)
+
+        asyncio.run(run())
+        self.assertEqual(order, [1, 2, 1, 1])
+
+    def test_queue_bound_sheds_load(self):
+        """Test that requests beyond max_queue are rejected"""
+        admission = AdmissionController(rpm=1, tpm=10**6, max_queue=2)
+
+        async def run():
+            await admission.acquire(0, 1)
+            waiting = [asyncio.ensure_future(admission.acquire(i, 1)) for i in (1, 2)]
+            await asyncio.sleep(0)
+            with self.assertRaises(QueueFullError):
+                await admission.acquire(3, 1)
+            for task in waiting:
+                task.cancel()
+            await asyncio.gather(*waiting, return_exceptions=True)
+
+        asyncio.run(run())
+        self.assertEqual(admission.rejected, 1)
+        self.assertEqual(admission.queued, 0)
+
+
+    def test_try_acquire_keeps_reserve_and_never_queues(self):
+        """Test that low-priority requests only take spare budget and give way to waiting users"""
+        admission = AdmissionController(rpm=4, tpm=10**6)
+
+        async def run():
+            spare = [admission.try_acquire(1, reserve=0.5) for _ in range(3)]
+            await admission.acquire(0, 1)
+            await admission.acquire(0, 1)
+            waiting = asyncio.ensure_future(admission.acquire(1, 1))
+            await asyncio.sleep(0)
+            behind_user = admission.try_acquire(1)
+            waiting.cancel()
+            await asyncio.gather(waiting, return_exceptions=True)
+            return spare, behind_user
+
+        self.assertEqual(asyncio.run(run()), ([True, True, False], False))
+        self.assertEqual(admission.queued, 0)
+
+if __name__ == "__main__":
+    unittest.main()
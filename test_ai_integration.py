@@ -34,9 +34,9 @@ async def test_ai_integration():
         openai.api_key = api_key
         
         # Import the bot class to test the AI response method
-        from bot import USAAdaptationBot
+        from bot import FinancialAdvisorBot
         
-        bot = USAAdaptationBot()
+        bot = FinancialAdvisorBot()
         
         # Test AI response
         print("\n🤖 Getting AI response...")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test cases for the batch evaluation CLI
+"""
+
+import unittest
+from unittest.mock import patch
+import asyncio
+import json
+import os
+import tempfile
+
+import openai
+
+import bot as bot_module
+from batch_eval import build_parser, completed_ids, configure_bot, read_items, run_batch, turn_usage
+from fake_servers import FakeOpenAI
+from tracing import Tracer
+
+ITEMS = [
+    {"id": "retirement", "turns": ["Как копить на пенсию?", "А если мне 50 лет?"], "tags": ["pension"]},
+    {"id": "insurance", "question": "Нужна ли страховка жизни?"},
+    {"question": "Что такое 529?"},
+]
+
+
+@patch.multiple(bot_module, OPENAI_API_KEY="sk-test", CONVERSATION_DB="", RESPONSE_CACHE_SIZE=0, SUMMARY_MODEL="",
+                OPENAI_FALLBACK_MODEL="", OPENAI_RPM=10**6, OPENAI_TPM=10**9, OPENAI_WARM_CONNECTIONS=0)
+class TestBatchEval(unittest.TestCase):
+    """Test cases for run_batch against a fake OpenAI server"""
+
+    def setUp(self):
+        """Write the question set and pick an output path"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.directory.name, "questions.jsonl")
+        self.output = os.path.join(self.directory.name, "answers.jsonl")
+        with open(self.input, "w", encoding="utf-8") as f:
+            for item in ITEMS:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        self.saved_openai = openai.api_base, openai.api_key
+
+    def tearDown(self):
+        openai.api_base, openai.api_key = self.saved_openai
+        self.directory.cleanup()
+
+    def run_batch(self, server: FakeOpenAI, *options):
+        args = build_parser().parse_args([self.input, self.output, "--concurrency", "2", *options])
+
+        async def run():
+            await server.start()
+            openai.api_base = server.url + "/v1"
+            try:
+                return await run_batch(args)
+            finally:
+                await server.stop()
+
+        return asyncio.run(run())
+
+    def records(self) -> list:
+        with open(self.output, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_read_items(self):
+        """Test single questions become one-turn conversations and missing ids use line numbers"""
+        items = read_items(self.input)
+        self.assertEqual([item["id"] for item, _ in items], ["retirement", "insurance", "3"])
+        self.assertEqual(items[0][1], ["Как копить на пенсию?", "А если мне 50 лет?"])
+        self.assertEqual(items[1][1], ["Нужна ли страховка жизни?"])
+
+    def test_answers_with_usage(self):
+        """Test every conversation is answered turn by turn with latency and token counts"""
+        server = FakeOpenAI(latency=0, tokens=5, token_rate=1000)
+        summary = self.run_batch(server)
+
+        self.assertEqual((summary["ok"], summary["failed"], summary["skipped"]), (3, 0, 0))
+        self.assertEqual(server.requests, 4)
+        records = {record["id"]: record for record in self.records()}
+        retirement = records["retirement"]
+        self.assertEqual(retirement["tags"], ["pension"])
+        self.assertEqual([turn["question"] for turn in retirement["turns"]], ITEMS[0]["turns"])
+        first, second = retirement["turns"]
+        self.assertGreater(second["completion_tokens"], 0)
+        # The follow-up carries the first exchange in its prompt
+        self.assertGreater(second["prompt_tokens"], first["prompt_tokens"] + first["completion_tokens"])
+        self.assertEqual(retirement["completion_tokens"], first["completion_tokens"] + second["completion_tokens"])
+        self.assertEqual(summary["completion_tokens"], sum(record["completion_tokens"] for record in records.values()))
+
+    def test_hedging_is_opt_in(self):
+        """Test that answers come from the evaluated model alone unless --hedge is given"""
+        with patch.multiple(bot_module, OPENAI_FALLBACK_MODEL="gpt-3.5-turbo", STREAM_REPLIES=True):
+            configure_bot(build_parser().parse_args([self.input, self.output, "--hedge"]))
+            self.assertEqual(bot_module.OPENAI_FALLBACK_MODEL, "gpt-3.5-turbo")
+            configure_bot(build_parser().parse_args([self.input, self.output]))
+            self.assertEqual(bot_module.OPENAI_FALLBACK_MODEL, "")
+
+    def test_turn_records_answering_model(self):
+        """Test that a turn won by the hedge is recorded with the fallback model"""
+        tracer = Tracer(sample_rate=0.0)
+        results = []
+        with patch.multiple(bot_module, OPENAI_FALLBACK_MODEL="gpt-3.5-turbo"):
+            for model in ("gpt-4", "gpt-3.5-turbo"):
+                trace = tracer.start("batch")
+                trace.add_span("openai", 0.0, 1.0, model=model, prompt_tokens=10, completion_tokens=5)
+                results.append(turn_usage(trace, "?", "!", 1.0))
+        self.assertEqual([result["model"] for result in results], ["gpt-4", "gpt-3.5-turbo"])
+
+    def test_resume_skips_completed_items(self):
+        """Test a second run only retries items that failed, after a torn last line"""
+        self.run_batch(FakeOpenAI(latency=0, error_rate=1.0))
+        self.assertEqual({record["status"] for record in self.records()}, {"error"})
+        with open(self.output, "a", encoding="utf-8") as f:
+            f.write('{"id": "insurance", "sta')  # crash while writing
+
+        summary = self.run_batch(FakeOpenAI(latency=0, tokens=3, token_rate=1000))
+        self.assertEqual((summary["ok"], summary["skipped"]), (3, 0))
+        self.assertEqual(completed_ids(self.output), {"retirement", "insurance", "3"})
+
+        server = FakeOpenAI(latency=0, tokens=3, token_rate=1000)
+        summary = self.run_batch(server)
+        self.assertEqual((summary["ok"], summary["skipped"]), (0, 3))
+        self.assertEqual(server.requests, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,13 +13,16 @@ from telegram.ext import ContextTypes
 
 # Import the bot class
 from bot import FinancialAdvisorBot
+from conversation_store import ConversationStore
 
 class TestFinancialAdvisorBot(unittest.TestCase):
     """Test cases for the Financial Advisor Bot"""
     
     def setUp(self):
         """Set up test fixtures"""
-        self.bot = FinancialAdvisorBot()
+        # Keep history in memory instead of a conversations.db shared between runs
+        with patch('bot.CONVERSATION_DB', ""):
+            self.bot = FinancialAdvisorBot()
         
         # Mock user data
         self.mock_user = Mock(spec=User)
@@ -46,12 +49,13 @@ class TestFinancialAdvisorBot(unittest.TestCase):
     def test_bot_initialization(self):
         """Test that the bot initializes correctly"""
         self.assertIsInstance(self.bot, FinancialAdvisorBot)
-        self.assertEqual(self.bot.user_conversations, {})
+        self.assertIsInstance(self.bot.user_conversations, ConversationStore)
+        self.assertEqual(len(self.bot.user_conversations), 0)
     
     def test_start_command_clears_conversation(self):
         """Test that /start command clears previous user conversation"""
         # Set up initial conversation
-        self.bot.user_conversations[12345] = [{"role": "user", "content": "old message"}]
+        self.bot.user_conversations.append(12345, "user", "old message")
         
         # Run start command
         asyncio.run(self.bot.start_command(self.mock_update, self.mock_context))
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Test cases for the OpenAI circuit breaker and degraded answers
+"""
+
+import unittest
+from unittest.mock import AsyncMock, patch
+import asyncio
+
+import openai
+
+import bot as bot_module
+from bot import DEGRADED_FALLBACK, DEGRADED_NOTICE, FinancialAdvisorBot
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test cases for CircuitBreaker"""
+
+    def setUp(self):
+        """Set up a breaker that opens on half of 4 calls failing"""
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_ratio=0.5, min_calls=4, window=10, slow_after=5, open_for=30,
+                                      clock=self.clock)
+
+    def calls(self, *outcomes):
+        for ok in outcomes:
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(ok)
+
+    def test_opens_on_failure_ratio(self):
+        """Test that the breaker opens once enough recent calls failed"""
+        self.calls(True, False, True)
+        self.assertEqual(self.breaker.state, CLOSED)  # too few calls to judge
+        self.calls(False)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.rejected, 1)
+
+    def test_slow_calls_count_as_failures(self):
+        """Test that successes slower than slow_after trip the breaker too"""
+        for _ in range(4):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(True, seconds=6)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_old_outcomes_expire(self):
+        """Test that failures outside the window are forgotten"""
+        self.calls(False, False, False)
+        self.clock.now = 11
+        self.calls(True, True, True, False)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_half_open_probe_closes_or_reopens(self):
+        """Test that after open_for one trial call is let through and decides the state"""
+        self.calls(False, False, False, False)
+        self.clock.now = 31
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow())  # only one probe at a time
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, OPEN)
+
+        self.clock.now = 62
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(True, seconds=1)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.opened, 2)
+
+    def test_released_probe_frees_its_slot(self):
+        """Test that a cancelled probe lets the next call try"""
+        self.calls(False, False, False, False)
+        self.clock.now = 31
+        self.assertTrue(self.breaker.allow())
+        self.breaker.release()
+        self.assertTrue(self.breaker.allow())
+
+
+@patch.multiple(bot_module, CONVERSATION_DB="", RESPONSE_CACHE_SIZE=0, SUMMARY_MODEL="", OPENAI_FALLBACK_MODEL="",
+                OPENAI_BREAKER_MIN_CALLS=2, OPENAI_BREAKER_FAILURE_RATIO=1.0)
+class TestDegradedAnswers(unittest.TestCase):
+    """Test cases for get_ai_response while OpenAI is failing"""
+
+    def make_bot(self, backend):
+        bot = FinancialAdvisorBot()
+        bot.openai_available = True
+        bot.llm.backend = backend
+        return bot
+
+    def test_open_circuit_answers_without_openai(self):
+        """Test that after repeated failures answers come at once, from the matching pillar"""
+        backend = AsyncMock(side_effect=openai.error.ServiceUnavailableError("down"))
+        bot = self.make_bot(backend)
+
+        async def run():
+            for _ in range(2):
+                await bot.get_ai_response("Привет", 1)
+            return (
+                await bot.get_ai_response("Нужна ли страховка жизни для семьи?", 1),
+                await bot.get_ai_response("Как копить на пенсию через 401(k)?", 1),
+                await bot.get_ai_response("Привет", 1),
+            )
+
+        protection, savings, other = asyncio.run(run())
+
+        self.assertEqual(backend.await_count, 2)
+        self.assertEqual(bot.breaker.state, OPEN)
+        self.assertTrue(protection.startswith(DEGRADED_NOTICE))
+        self.assertIn("Финансовая защита", protection)
+        self.assertIn("Накопления", savings)
+        self.assertEqual(other, DEGRADED_FALLBACK)
+        self.assertEqual(bot.user_conversations.messages(1)[1:], [])  # degraded answers are not history
+        self.assertIn('bot_openai_circuit_state 2', bot.metrics.render())
+        self.assertIn('bot_degraded_answers_total{kind="topic"} 2', bot.metrics.render())
+
+    def test_invalid_request_does_not_trip(self):
+        """Test that errors caused by the request itself leave the circuit closed"""
+        bot = self.make_bot(AsyncMock(side_effect=openai.error.InvalidRequestError("too long", "messages")))
+
+        async def run():
+            for _ in range(3):
+                await bot.get_ai_response("Привет", 1)
+
+        asyncio.run(run())
+        self.assertEqual(bot.breaker.state, CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
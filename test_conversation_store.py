@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Test cases for the bounded conversation store
+"""
+
+import unittest
+import asyncio
+import os
+import tempfile
+
+from conversation_backend import SQLiteBackend, WriteBehindBackend
+from conversation_store import ConversationStore
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CharCounter:
+    """One token per character, no per-message overhead"""
+
+    def count_message(self, message):
+        return len(message["content"])
+
+
+class TestConversationStore(unittest.TestCase):
+    """Test cases for ConversationStore"""
+
+    def setUp(self):
+        """Set up a small store with a controllable clock"""
+        self.clock = FakeClock()
+        self.store = ConversationStore("SYSTEM", CharCounter(), token_budget=4, max_users=3,
+                                       idle_ttl=100, clock=self.clock)
+
+    def test_messages_start_with_system_prompt(self):
+        """Test that history is returned after the shared system prompt"""
+        self.store.append(1, "user", "hi")
+        self.store.append(1, "assistant", "yo")
+        self.assertEqual(self.store.messages(1), [
+            {"role": "system", "content": "SYSTEM"},
+            {"role": "user", "content": "hi"},
+            {"role": "assistant", "content": "yo"},
+        ])
+        self.assertEqual(self.store.messages(2), [{"role": "system", "content": "SYSTEM"}])
+
+    def test_load_counts_hits_and_misses(self):
+        """Test that load() records cache hits and misses"""
+        self.store.append(1, "user", "hi")
+        asyncio.run(self.store.load(1))
+        asyncio.run(self.store.load(2))
+        self.assertEqual((self.store.hits, self.store.misses), (1, 1))
+        self.assertIn(2, self.store)
+
+    def test_history_is_trimmed_to_token_budget(self):
+        """Test that the oldest messages are dropped once history exceeds the budget"""
+        for i in range(10):
+            self.store.append(1, "user", str(i))
+        contents = [m["content"] for m in self.store.messages(1)[1:]]
+        self.assertEqual(contents, ["6", "7", "8", "9"])
+        self.assertEqual(self.store.tokens(1), len("SYSTEM") + 4)
+
+        self.store.append(1, "assistant", "abc")
+        contents = [m["content"] for m in self.store.messages(1)[1:]]
+        self.assertEqual(contents, ["9", "abc"])
+
+    def test_newest_message_always_kept(self):
+        """Test that a message larger than the budget is still stored"""
+        self.store.append(1, "user", "a very long question")
+        self.assertEqual(len(self.store.messages(1)), 2)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used user is evicted past max_users"""
+        for user_id in (1, 2, 3):
+            self.store.append(user_id, "user", "hi")
+        self.store.messages(1)
+        self.store.append(4, "user", "hi")
+        self.assertNotIn(2, self.store)
+        self.assertIn(1, self.store)
+        self.assertEqual(self.store.evictions["lru"], 1)
+
+    def test_idle_ttl_eviction(self):
+        """Test that idle conversations expire"""
+        self.store.append(1, "user", "hi")
+        self.clock.now = 50
+        self.store.append(2, "user", "hi")
+        self.clock.now = 120
+        self.store.append(3, "user", "hi")
+        self.assertNotIn(1, self.store)
+        self.assertIn(2, self.store)
+        self.assertEqual(self.store.evictions["ttl"], 1)
+
+    def test_byte_cap(self):
+        """Test that total bytes stay under max_bytes"""
+        store = ConversationStore("SYSTEM", CharCounter(), token_budget=1000, max_bytes=2000)
+        for user_id in range(20):
+            store.append(user_id, "user", "x" * 500)
+        self.assertLessEqual(store.total_bytes, 2000)
+        self.assertGreater(store.evictions["bytes"], 0)
+
+    def test_clear_releases_bytes(self):
+        """Test that clearing a user returns its bytes"""
+        self.store.append(1, "user", "hi")
+        self.store.clear(1)
+        self.assertNotIn(1, self.store)
+        self.assertEqual(self.store.total_bytes, 0)
+
+    def test_messages_are_built_per_request(self):
+        """Test that callers get fresh dicts and cannot change stored history"""
+        self.store.append(1, "user", "hi")
+        messages = self.store.messages(1)
+        messages[1]["content"] = "changed"
+        messages.append({"role": "user", "content": "extra"})
+        self.assertEqual(self.store.messages(1)[1:], [{"role": "user", "content": "hi"}])
+        self.assertIs(self.store.messages(1)[0], self.store.messages(2)[0])  # one shared system prompt
+
+    def test_older_messages_are_compressed(self):
+        """Test that messages past compress_after are compressed, read back intact and counted smaller"""
+        answer = "Страхование жизни защищает семью. " * 40
+        plain = ConversationStore("SYSTEM", CharCounter(), token_budget=10**6)
+        compact = ConversationStore("SYSTEM", CharCounter(), token_budget=10**6, compress_after=2)
+        for store in (plain, compact):
+            for turn in range(3):
+                store.append(1, "user", f"вопрос {turn}")
+                store.append(1, "assistant", f"{turn}: {answer}")
+
+        self.assertEqual(compact.messages(1), plain.messages(1))
+        self.assertEqual(compact.tokens(1), plain.tokens(1))
+        self.assertLess(compact.total_bytes, plain.total_bytes / 2)
+        entries = compact._conversations[1].entries
+        self.assertEqual([entry.compressed for entry in entries], [False, True, False, True, False, False])
+
+        compact.clear(1)
+        self.assertEqual(compact.total_bytes, 0)
+
+
+class TestPersistentConversationStore(unittest.TestCase):
+    """Test cases for ConversationStore with a write-behind SQLite backend"""
+
+    def setUp(self):
+        """Create a throwaway database file"""
+        handle, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+
+    def tearDown(self):
+        """Remove the database and its WAL files"""
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def make_store(self, validate_versions=False):
+        backend = WriteBehindBackend(SQLiteBackend(self.path), flush_interval=0.01)
+        return ConversationStore("SYSTEM", CharCounter(), token_budget=100, backend=backend,
+                                 validate_versions=validate_versions)
+
+    def test_history_survives_restart(self):
+        """Test that a new store lazily loads history written by the previous one"""
+        async def first_process():
+            store = self.make_store()
+            await store.load(1)
+            store.append(1, "user", "hi")
+            store.append(1, "assistant", "hello")
+            self.assertEqual(store.backend.stats()["pending"], 2)
+            await store.backend.close()
+
+        async def second_process():
+            store = self.make_store()
+            self.assertNotIn(1, store)
+            await store.load(1)
+            messages = store.messages(1)
+            await store.backend.close()
+            return messages
+
+        asyncio.run(first_process())
+        self.assertEqual(asyncio.run(second_process())[1:], [
+            {"role": "user", "content": "hi"},
+            {"role": "assistant", "content": "hello"},
+        ])
+
+    def test_writes_are_batched(self):
+        """Test that queued appends are committed together by the background flusher"""
+        async def run():
+            store = self.make_store()
+            for i in range(20):
+                store.append(i, "user", "hi")
+            await asyncio.sleep(0.05)
+            stats = store.backend.stats()
+            await store.backend.close()
+            return stats
+
+        stats = asyncio.run(run())
+        self.assertEqual(stats, {"pending": 0, "written": 20, "batches": 1})
+
+    def test_clear_is_persisted_before_reload(self):
+        """Test that /start clearing wins over older stored messages"""
+        async def run():
+            store = self.make_store()
+            store.append(1, "user", "hi")
+            await store.backend.flush()
+            store.clear(1)
+            await store.load(1)
+            messages = store.messages(1)
+            await store.backend.close()
+            return messages
+
+        self.assertEqual(asyncio.run(run()), [{"role": "system", "content": "SYSTEM"}])
+
+    def test_profile_replaces_stored_messages(self):
+        """Test a profile survives restart in place of the messages it covers"""
+        async def first_process():
+            store = self.make_store()
+            await store.load(1)
+            for content in ("a", "b", "c"):
+                store.append(1, "user", content)
+            self.assertTrue(store.replace_with_profile(1, "profile", store.older_messages(1, keep=1)))
+            await store.backend.close()
+
+        async def second_process():
+            store = self.make_store()
+            await store.load(1)
+            messages = store.messages(1)
+            await store.backend.close()
+            return messages
+
+        asyncio.run(first_process())
+        self.assertEqual(asyncio.run(second_process())[1:], [
+            {"role": "system", "content": "profile"},
+            {"role": "user", "content": "c"},
+        ])
+
+    def test_evicted_user_is_reloaded(self):
+        """Test that eviction frees RAM without losing persisted history"""
+        async def run():
+            store = self.make_store()
+            store.max_users = 1
+            for user_id in (1, 2):
+                await store.load(user_id)
+                store.append(user_id, "user", f"from {user_id}")
+            self.assertNotIn(1, store)
+            await store.load(1)
+            messages = store.messages(1)
+            await store.backend.close()
+            return messages
+
+        self.assertEqual(asyncio.run(run())[1:], [{"role": "user", "content": "from 1"}])
+
+    def test_history_written_elsewhere_is_reloaded(self):
+        """Test that a cached history is read again once another process wrote to it, and only then"""
+        async def run():
+            first, second = self.make_store(validate_versions=True), self.make_store(validate_versions=True)
+            await first.load(1)
+            first.append(1, "user", "a")
+            await first.load(1)
+            await second.load(1)
+            second.append(1, "user", "b")
+            await second.backend.flush()
+            await first.load(1)
+            messages = first.messages(1)
+            for store in (first, second):
+                await store.backend.close()
+            return messages, first.stats()
+
+        messages, stats = asyncio.run(run())
+        self.assertEqual(messages[1:], [{"role": "user", "content": "a"}, {"role": "user", "content": "b"}])
+        self.assertEqual((stats["hits"], stats["misses"], stats["stale"]), (1, 2, 1))
+
+    def test_cache_hits_skip_the_backend(self):
+        """Test that without version checks a cached history is served without reading the database"""
+        async def run():
+            store = self.make_store()
+            await store.load(1)
+            store.append(1, "user", "hi")
+            store.backend.backend = None  # any database access would fail
+            for _ in range(3):
+                await store.load(1)
+            store.backend.backend = SQLiteBackend(self.path)
+            await store.backend.close()
+            return store.stats()
+
+        stats = asyncio.run(run())
+        self.assertEqual((stats["hits"], stats["misses"]), (3, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
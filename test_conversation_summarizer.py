@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test cases for background conversation summaries
+"""
+
+import unittest
+import asyncio
+
+from conversation_store import ConversationStore
+from conversation_summarizer import ConversationSummarizer
+from test_conversation_store import CharCounter
+
+
+class TestConversationSummarizer(unittest.TestCase):
+    """Test cases for ConversationSummarizer"""
+
+    def setUp(self):
+        """Set up a store and a summarizer with a recording fake model"""
+        self.store = ConversationStore("SYSTEM", CharCounter(), token_budget=1000)
+        self.calls = []
+        self.outcomes = []
+
+        async def summarize(user_id, profile, messages):
+            self.calls.append((user_id, profile, [message["content"] for message in messages]))
+            await asyncio.sleep(0)
+            return "P" + str(len(self.calls))
+
+        self.summarizer = ConversationSummarizer(self.store, summarize, threshold_tokens=5, keep_messages=2,
+                                                 on_result=self.outcomes.append)
+
+    def add(self, *contents):
+        for content in contents:
+            self.store.append(1, "user", content)
+
+    def test_short_history_is_left_alone(self):
+        """Test nothing happens below the threshold"""
+        async def run():
+            self.add("aaa", "bbb")
+            self.summarizer.maybe_summarize(1)
+            await self.summarizer.join()
+
+        asyncio.run(run())
+        self.assertEqual(self.calls, [])
+
+    def test_long_kept_messages_are_left_alone(self):
+        """Test that kept messages above the threshold do not trigger a summary of the few older ones"""
+        async def run():
+            self.add("a", "b" * 20, "c" * 20)
+            self.summarizer.maybe_summarize(1)
+            await self.summarizer.join()
+
+        asyncio.run(run())
+        self.assertEqual(self.calls, [])
+        self.assertEqual(len(self.store.messages(1)), 4)
+
+    def test_older_turns_become_profile(self):
+        """Test older messages are replaced by a profile right after the system prompt"""
+        async def run():
+            self.add("aaaa", "bbbb", "cccc", "dddd")
+            self.summarizer.maybe_summarize(1)
+            self.summarizer.maybe_summarize(1)  # one summary per user at a time
+            await self.summarizer.join()
+
+        asyncio.run(run())
+
+        self.assertEqual(self.calls, [(1, None, ["aaaa", "bbbb"])])
+        self.assertEqual([message["content"] for message in self.store.messages(1)], ["SYSTEM", "P1", "cccc", "dddd"])
+        self.assertEqual(self.store.messages(1)[1]["role"], "system")
+        self.assertEqual(self.store.history_tokens(1), 2 + 4 + 4)
+        self.assertEqual(self.summarizer.stats()["tokens_saved"], 6)
+        self.assertEqual(self.outcomes, ["ok"])
+
+    def test_previous_profile_is_folded_in(self):
+        """Test the next summary receives the current profile"""
+        async def run():
+            self.add("aaaa", "bbbb", "cccc", "dddd")
+            self.summarizer.maybe_summarize(1)
+            await self.summarizer.join()
+            self.add("eeee", "ffff")
+            self.summarizer.maybe_summarize(1)
+            await self.summarizer.join()
+
+        asyncio.run(run())
+
+        self.assertEqual(self.calls[1], (1, "P1", ["cccc", "dddd"]))
+        self.assertEqual([message["content"] for message in self.store.messages(1)], ["SYSTEM", "P2", "eeee", "ffff"])
+
+    def test_cleared_conversation_is_not_overwritten(self):
+        """Test a summary finishing after /start is dropped"""
+        async def run():
+            self.add("aaaa", "bbbb", "cccc", "dddd")
+            self.summarizer.maybe_summarize(1)
+            self.store.clear(1)
+            self.add("new")
+            await self.summarizer.join()
+
+        asyncio.run(run())
+
+        self.assertEqual([message["content"] for message in self.store.messages(1)], ["SYSTEM", "new"])
+        self.assertEqual(self.outcomes, ["stale"])
+
+    def test_failure_keeps_history(self):
+        """Test a failed summary leaves the history as it was"""
+        async def failing(user_id, profile, messages):
+            raise RuntimeError("model unavailable")
+
+        self.summarizer.summarize = failing
+
+        async def run():
+            self.add("aaaa", "bbbb", "cccc", "dddd")
+            self.summarizer.maybe_summarize(1)
+            await self.summarizer.join()
+
+        asyncio.run(run())
+
+        self.assertEqual(len(self.store.messages(1)), 5)
+        self.assertEqual(self.summarizer.failures, 1)
+        self.assertEqual(self.outcomes, ["error"])
+
+
+if __name__ == '__main__':
+    unittest.main()
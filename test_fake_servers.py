@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test cases for the fake OpenAI and Telegram servers and the offline load test
+"""
+
+import unittest
+from unittest.mock import patch
+import asyncio
+
+import openai
+from telegram import Bot
+
+import bot as bot_module
+from fake_servers import FakeOpenAI, FakeTelegram
+from load_test import build_parser, percentile, run_load_test
+
+MESSAGES = [{"role": "user", "content": "Привет"}]
+
+
+class TestFakeOpenAI(unittest.TestCase):
+    """Test cases for FakeOpenAI through the openai client"""
+
+    def complete(self, server: FakeOpenAI, **kwargs):
+        async def run():
+            await server.start()
+            try:
+                return await openai.ChatCompletion.acreate(
+                    model="gpt-4", messages=MESSAGES, api_base=server.url + "/v1", api_key="sk-test", **kwargs)
+            finally:
+                await server.stop()
+        return asyncio.run(run())
+
+    def test_complete(self):
+        """Test a non-streaming completion returns the configured number of tokens"""
+        server = FakeOpenAI(latency=0.01, tokens=5, token_rate=1000)
+        response = self.complete(server)
+
+        self.assertEqual(len(response.choices[0].message.content.split()), 5)
+        self.assertEqual(server.requests, 1)
+
+    def test_max_tokens_limits_answer(self):
+        """Test the answer is cut to the request's max_tokens"""
+        response = self.complete(FakeOpenAI(latency=0, tokens=50, token_rate=1000), max_tokens=3)
+
+        self.assertEqual(len(response.choices[0].message.content.split()), 3)
+
+    def test_stream(self):
+        """Test streamed chunks carry one token each"""
+        server = FakeOpenAI(latency=0, tokens=4, token_rate=1000)
+
+        async def run():
+            await server.start()
+            try:
+                chunks = await openai.ChatCompletion.acreate(
+                    model="gpt-4", messages=MESSAGES, stream=True,
+                    api_base=server.url + "/v1", api_key="sk-test")
+                return [chunk.choices[0].delta.get("content") async for chunk in chunks]
+            finally:
+                await server.stop()
+
+        tokens = [token for token in asyncio.run(run()) if token]
+        self.assertEqual(len(tokens), 4)
+
+    def test_error_injection(self):
+        """Test injected errors surface as OpenAI API errors"""
+        server = FakeOpenAI(latency=0, error_rate=1.0)
+        with self.assertRaises(openai.error.APIError):
+            self.complete(server)
+        self.assertEqual(server.errors, 1)
+
+        with self.assertRaises(openai.error.RateLimitError):
+            self.complete(FakeOpenAI(latency=0, rate_limit_rate=1.0))
+
+
+class TestFakeTelegram(unittest.TestCase):
+    """Test cases for FakeTelegram through python-telegram-bot"""
+
+    def test_send_and_edit_message(self):
+        """Test sent and edited messages are echoed back and reported"""
+        seen = []
+        server = FakeTelegram(on_request=lambda method, params: seen.append((method, params.get("text"))))
+
+        async def run():
+            await server.start()
+            try:
+                async with Bot("123:TEST", base_url=server.url + "/bot") as bot:
+                    sent = await bot.send_message(chat_id=42, text="Привет")
+                    edited = await bot.edit_message_text("Пока", chat_id=42, message_id=sent.message_id)
+                    return sent, edited
+            finally:
+                await server.stop()
+
+        sent, edited = asyncio.run(run())
+
+        self.assertEqual(sent.chat.id, 42)
+        self.assertEqual(edited.message_id, sent.message_id)
+        self.assertEqual(edited.text, "Пока")
+        self.assertIn(("sendMessage", "Привет"), seen)
+        self.assertEqual(server.calls["getMe"], 1)
+
+
+class TestLoadTest(unittest.TestCase):
+    """Smoke test of the load test driving the real bot"""
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([3.0], 0.95), 3.0)
+
+    @patch.multiple(bot_module, CONVERSATION_DB="", COALESCE_WINDOW=0.05, STREAM_EDIT_INTERVAL=0.01,
+                    OPENAI_RPM=10**6, OPENAI_TPM=10**9, TELEGRAM_CHAT_RATE=1000, TELEGRAM_CHAT_BURST=100)
+    def test_every_user_gets_answers(self):
+        """Test a small run answers every message and reports percentiles"""
+        args = build_parser().parse_args([
+            "--users", "5", "--messages", "2", "--think-time", "0", "--ramp-up", "0",
+            "--latency", "0.01", "--tokens", "5", "--token-rate", "500", "--telegram-latency", "0",
+            "--timeout", "10", "--seed", "1",
+        ])
+
+        summary = asyncio.run(run_load_test(args))
+
+        self.assertEqual(summary["replies"], 10)
+        self.assertEqual(summary["failed"], 0)
+        self.assertEqual(summary["timeouts"], 0)
+        self.assertLessEqual(summary["latency_s"]["p50"], summary["latency_s"]["p99"])
+        self.assertGreater(summary["peak_rss_mb"], 0)
+        self.assertGreater(summary["telegram_calls"]["sendMessage"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Test cases for follow-up buttons and their background prefetching
+"""
+
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+import asyncio
+
+from telegram import InlineKeyboardMarkup
+
+import bot as bot_module
+from bot import FOLLOW_UP_PREFIX, FinancialAdvisorBot
+from follow_ups import FollowUpPrefetcher, extract_suggestions
+
+ANSWER = (
+    "Начните с защиты семьи: страховка жизни и дохода.\n\n"
+    "Выберите, что обсудить дальше:\n"
+    "[Финансовая защита] [Накопления] [Сохранение капитала]"
+)
+
+
+class TestExtractSuggestions(unittest.TestCase):
+    """Test cases for extract_suggestions"""
+
+    def test_trailing_buttons_with_caption(self):
+        """Test that the button line and its caption are split off"""
+        text, labels = extract_suggestions(ANSWER)
+        self.assertEqual(text, "Начните с защиты семьи: страховка жизни и дохода.")
+        self.assertEqual(labels, ["Финансовая защита", "Накопления", "Сохранение капитала"])
+
+    def test_buttons_one_per_line(self):
+        """Test bulleted, bold buttons on separate lines and the button limit"""
+        text, labels = extract_suggestions("Ответ.\n- **[Пенсия]**\n- [Колледж]\n- [Наследство]\n- [IRA]", limit=3)
+        self.assertEqual(text, "Ответ.")
+        self.assertEqual(labels, ["Пенсия", "Колледж", "Наследство"])
+
+    def test_brackets_inside_text_are_kept(self):
+        """Test that answers without a trailing button block are left alone"""
+        answer = "Сравните [Roth IRA] и Traditional IRA по налогам на пенсии."
+        self.assertEqual(extract_suggestions(answer), (answer, []))
+
+
+class TestFollowUpPrefetcher(unittest.TestCase):
+    """Test cases for FollowUpPrefetcher"""
+
+    def test_hit_cancels_the_other_prefetches(self):
+        """Test that a taken answer is a hit and the unused ones are wasted"""
+        outcomes = []
+
+        async def fetch(user_id, question):
+            await asyncio.sleep(0.01 if question == "A" else 10)
+            return f"answer to {question}"
+
+        prefetcher = FollowUpPrefetcher(fetch, on_outcome=outcomes.append)
+
+        async def run():
+            prefetcher.prefetch(1, ["A", "B"])
+            return await prefetcher.take(1, "A"), await prefetcher.take(1, "A")
+
+        self.assertEqual(asyncio.run(run()), ("answer to A", None))
+        self.assertEqual(sorted(outcomes), ["hit", "prefetched", "wasted"])
+        self.assertEqual(prefetcher.in_flight, 0)
+        self.assertEqual(prefetcher.stats()["hit_rate"], 1.0)
+
+    def test_budget_limits(self):
+        """Test that max_in_flight and a refusing fetch skip prefetches, and stale answers are not used"""
+        clock = Mock(return_value=0.0)
+
+        async def fetch(user_id, question):
+            return None if question == "refused" else question
+
+        prefetcher = FollowUpPrefetcher(fetch, max_in_flight=2, ttl=60, clock=clock)
+
+        async def run():
+            prefetcher.prefetch(1, ["refused", "A", "B"])
+            refused = await prefetcher.take(1, "refused")
+            prefetcher.prefetch(2, ["A"])
+            await asyncio.sleep(0)
+            clock.return_value = 61.0
+            return refused, await prefetcher.take(2, "A")
+
+        self.assertEqual(asyncio.run(run()), (None, None))
+        self.assertEqual(prefetcher.counts["skipped"], 2)  # "B" over max_in_flight, "refused" by fetch
+        self.assertEqual(prefetcher.counts["hit"], 0)
+        self.assertEqual(prefetcher.counts["wasted"], 2)  # "A" of user 1 untaken, "A" of user 2 stale
+
+
+@patch.multiple(bot_module, CONVERSATION_DB="", RESPONSE_CACHE_SIZE=0, SUMMARY_MODEL="", OPENAI_FALLBACK_MODEL="",
+                STREAM_REPLIES=False, COALESCE_WINDOW=0)
+class TestFollowUpButtons(unittest.TestCase):
+    """Test cases for follow-up buttons in the bot"""
+
+    def make_bot(self):
+        def complete(messages, **kwargs):
+            question = messages[-1]["content"]
+            answer = ANSWER if question == "С чего начать?" else f"Ответ: {question}"
+            return Mock(choices=[Mock(message=Mock(content=answer))])
+
+        bot = FinancialAdvisorBot()
+        bot.openai_available = True
+        bot.llm.backend = AsyncMock(side_effect=complete)
+        return bot
+
+    def make_update(self):
+        update = Mock()
+        update.effective_user.id = 1
+        update.effective_chat.id = 1
+        update.message.text = "С чего начать?"
+        update.message.reply_text = AsyncMock()
+        update.callback_query = None
+        return update
+
+    def make_context(self):
+        context = Mock()
+        context.bot.send_chat_action = AsyncMock()
+        return context
+
+    def tap(self, sent, index):
+        """Update for a tap on button index of the message sent with reply_text call sent"""
+        update = Mock()
+        update.effective_user.id = 1
+        update.effective_chat.id = 1
+        update.message = None
+        update.effective_message.reply_text = AsyncMock()
+        update.callback_query.data = f"{FOLLOW_UP_PREFIX}{index}"
+        update.callback_query.answer = AsyncMock()
+        update.callback_query.message.reply_markup = sent.kwargs["reply_markup"]
+        return update
+
+    def test_buttons_replace_suggestions(self):
+        """Test that suggestions are sent as an inline keyboard and a tap asks its label"""
+        bot = self.make_bot()
+        update = self.make_update()
+
+        async def run():
+            await bot.handle_message(update, self.make_context())
+            tap = self.tap(update.message.reply_text.call_args, 1)
+            await bot.handle_follow_up(tap, self.make_context())
+            return tap
+
+        tap = asyncio.run(run())
+        sent = update.message.reply_text.call_args
+        self.assertNotIn("[Накопления]", sent.args[0])
+        self.assertIsInstance(sent.kwargs["reply_markup"], InlineKeyboardMarkup)
+        labels = [row[0].text for row in sent.kwargs["reply_markup"].inline_keyboard]
+        self.assertEqual(labels, ["Финансовая защита", "Накопления", "Сохранение капитала"])
+        tap.callback_query.answer.assert_awaited_once()
+        self.assertIn("Ответ: Накопления", tap.effective_message.reply_text.call_args.args[0])
+        self.assertEqual(bot.user_conversations.messages(1)[-2]["content"], "Накопления")
+
+    @patch.multiple(bot_module, PREFETCH_FOLLOW_UPS=True)
+    def test_prefetched_answer_on_tap(self):
+        """Test that a tapped follow-up is answered from the prefetch without another completion"""
+        bot = self.make_bot()
+        update = self.make_update()
+
+        async def run():
+            await bot.handle_message(update, self.make_context())
+            await asyncio.sleep(0.05)  # background prefetches finish
+            calls = bot.llm.backend.await_count
+            await bot.handle_follow_up(self.tap(update.message.reply_text.call_args, 2), self.make_context())
+            return calls
+
+        calls = asyncio.run(run())
+        self.assertEqual(calls, 4)  # the answer and its three follow-ups
+        self.assertEqual(bot.llm.backend.await_count, 4)
+        self.assertEqual(bot.user_conversations.messages(1)[-1]["content"], "Ответ: Сохранение капитала")
+        self.assertEqual(bot.prefetcher.counts["hit"], 1)
+        self.assertEqual(bot.prefetcher.counts["wasted"], 2)
+        self.assertIn('bot_prefetch_total{outcome="hit"} 1', bot.metrics.render())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Test cases for the async LLM client
+"""
+
+import unittest
+from unittest.mock import patch
+import asyncio
+from types import SimpleNamespace
+
+import openai
+
+import bot as bot_module
+from bot import FinancialAdvisorBot
+from fake_servers import FakeOpenAI
+from llm_client import HedgedLLM, LLMClient
+
+
+def make_response(text):
+    """Build an object shaped like an OpenAI chat completion"""
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+async def make_stream(tokens, delay=0.0):
+    """Async generator shaped like a streamed OpenAI chat completion"""
+    for token in tokens:
+        await asyncio.sleep(delay)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta={"content": token})])
+
+
+class TestLLMClient(unittest.TestCase):
+    """Test cases for LLMClient"""
+
+    def test_complete_returns_content(self):
+        """Test that the reply text is extracted from the completion"""
+        async def backend(**kwargs):
+            return make_response(f"echo {kwargs['messages'][-1]['content']}")
+
+        client = LLMClient(model="gpt-4", backend=backend)
+        reply = asyncio.run(client.complete([{"role": "user", "content": "hi"}]))
+        self.assertEqual(reply, "echo hi")
+
+    def test_concurrency_cap(self):
+        """Test that no more than max_concurrency requests run at once"""
+        peak = 0
+
+        async def backend(**kwargs):
+            nonlocal peak
+            peak = max(peak, client.in_flight)
+            await asyncio.sleep(0.01)
+            return make_response("ok")
+
+        client = LLMClient(model="gpt-4", max_concurrency=3, backend=backend)
+
+        async def run():
+            await asyncio.gather(*(client.complete([]) for _ in range(10)))
+
+        asyncio.run(run())
+        self.assertEqual(peak, 3)
+        self.assertEqual(client.in_flight, 0)
+
+    def test_calls_overlap(self):
+        """Test that concurrent calls wait on the backend in parallel"""
+        async def backend(**kwargs):
+            await asyncio.sleep(0.1)
+            return make_response("ok")
+
+        client = LLMClient(model="gpt-4", backend=backend)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await asyncio.gather(*(client.complete([]) for _ in range(20)))
+            return loop.time() - started
+
+        self.assertLess(asyncio.run(run()), 0.5)
+
+    def test_timeout_cancels_request(self):
+        """Test that a slow request times out and is cancelled"""
+        cancelled = False
+
+        async def backend(**kwargs):
+            nonlocal cancelled
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+        client = LLMClient(model="gpt-4", timeout=0.05, backend=backend)
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(client.complete([]))
+        self.assertTrue(cancelled)
+        self.assertEqual(client.in_flight, 0)
+
+    def test_stream_yields_tokens(self):
+        """Test that streamed deltas are yielded in order"""
+        async def backend(**kwargs):
+            self.assertTrue(kwargs["stream"])
+            return make_stream(["При", "вет", "!"])
+
+        client = LLMClient(model="gpt-4", backend=backend)
+
+        async def run():
+            return [token async for token in client.stream([])]
+
+        self.assertEqual(asyncio.run(run()), ["При", "вет", "!"])
+        self.assertEqual(client.in_flight, 0)
+
+    def test_stream_timeout_covers_whole_generation(self):
+        """Test that a stream slower than the timeout is cut off"""
+        async def backend(**kwargs):
+            return make_stream(["a"] * 10, delay=0.02)
+
+        client = LLMClient(model="gpt-4", timeout=0.05, backend=backend)
+
+        async def run():
+            return [token async for token in client.stream([])]
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(run())
+        self.assertEqual(client.in_flight, 0)
+
+    def test_requests_use_pooled_session(self):
+        """Test that after open() every request, streamed or not, goes through the shared session"""
+        sessions = []
+
+        async def backend(**kwargs):
+            sessions.append(openai.aiosession.get())
+            return make_stream(["a"]) if kwargs.get("stream") else make_response("ok")
+
+        client = LLMClient(model="gpt-4", backend=backend)
+
+        async def run():
+            await client.complete([])
+            await client.open()
+            pool = client.session
+            await client.complete([])
+            tokens = [token async for token in client.stream([])]
+            outside = openai.aiosession.get()
+            await client.close()
+            return pool, tokens, outside
+
+        pool, tokens, outside = asyncio.run(run())
+        self.assertEqual(sessions, [None, pool, pool])
+        self.assertEqual(tokens, ["a"])
+        self.assertIsNone(outside)
+        self.assertFalse(client.pooled)
+
+    def test_warm_pool_against_api(self):
+        """Test that warming opens connections and completions reuse the pool"""
+        server = FakeOpenAI(latency=0, tokens=3, token_rate=1000)
+        client = LLMClient(model="gpt-4", max_concurrency=4)
+        saved = openai.api_base, openai.api_key
+
+        async def run():
+            await server.start()
+            openai.api_base, openai.api_key = server.url + "/v1", "sk-test"
+            try:
+                await client.open(warm_connections=2)
+                reply = await client.complete([{"role": "user", "content": "hi"}])
+                return reply
+            finally:
+                await client.close()
+                await server.stop()
+                openai.api_base, openai.api_key = saved
+
+        reply = asyncio.run(run())
+        self.assertEqual(len(reply.split()), 3)
+        self.assertEqual(client.warmed, 2)
+        self.assertEqual(server.requests, 1)
+
+
+class TestHedgedLLM(unittest.TestCase):
+    """Test cases for the hedging policy"""
+
+    def make_hedged(self, latencies, fail=()):
+        """HedgedLLM over a fake backend with per-model latency; records cancellations"""
+        self.cancelled = []
+        self.results = []
+
+        async def backend(model, stream=False, **kwargs):
+            async def delayed():
+                try:
+                    await asyncio.sleep(latencies[model])
+                except asyncio.CancelledError:
+                    self.cancelled.append(model)
+                    raise
+                if model in fail:
+                    raise RuntimeError(f"{model} failed")
+
+            if stream:
+                async def chunks():
+                    await delayed()
+                    for token in (model, "!"):
+                        yield SimpleNamespace(choices=[SimpleNamespace(delta={"content": token})])
+                return chunks()
+            await delayed()
+            return make_response(model)
+
+        client = LLMClient(model="gpt-4", backend=backend)
+        return HedgedLLM(client, "gpt-3.5-turbo", hedge_after=0.05, first_token_after=0.05,
+                         on_result=lambda path, seconds: self.results.append(path))
+
+    def test_fast_primary_is_not_hedged(self):
+        """Test that a primary answering before the deadline wins alone"""
+        hedged = self.make_hedged({"gpt-4": 0.01, "gpt-3.5-turbo": 0.01})
+        self.assertEqual(asyncio.run(hedged.complete([])), "gpt-4")
+        self.assertEqual((hedged.hedged, self.results), (0, ["primary"]))
+
+    def test_slow_primary_is_hedged_and_cancelled(self):
+        """Test that the fallback wins when the primary is slow and the primary is cancelled"""
+        hedged = self.make_hedged({"gpt-4": 1.0, "gpt-3.5-turbo": 0.01})
+        self.assertEqual(asyncio.run(hedged.complete([])), "gpt-3.5-turbo")
+        self.assertEqual(self.results, ["fallback"])
+        self.assertEqual(self.cancelled, ["gpt-4"])
+        self.assertEqual(hedged.client.in_flight, 0)
+
+    def test_caller_learns_winning_model(self):
+        """Test that on_model names the model whose answer is returned, whole or streamed"""
+        hedged = self.make_hedged({"gpt-4": 1.0, "gpt-3.5-turbo": 0.01})
+        models = []
+
+        async def run():
+            await hedged.complete([], on_model=models.append)
+            return [token async for token in hedged.stream([], on_model=models.append)]
+
+        self.assertEqual(asyncio.run(run()), ["gpt-3.5-turbo", "!"])
+        self.assertEqual(models, ["gpt-3.5-turbo", "gpt-3.5-turbo"])
+
+    def test_primary_can_still_win_after_hedge(self):
+        """Test that whichever finishes first wins once both are running"""
+        hedged = self.make_hedged({"gpt-4": 0.07, "gpt-3.5-turbo": 1.0})
+        self.assertEqual(asyncio.run(hedged.complete([])), "gpt-4")
+        self.assertEqual((hedged.hedged, self.results), (1, ["primary"]))
+        self.assertEqual(self.cancelled, ["gpt-3.5-turbo"])
+
+    def test_failed_primary_downgrades(self):
+        """Test that a failing primary falls back immediately"""
+        hedged = self.make_hedged({"gpt-4": 0.0, "gpt-3.5-turbo": 0.0}, fail=("gpt-4",))
+        self.assertEqual(asyncio.run(hedged.complete([])), "gpt-3.5-turbo")
+
+    def test_both_failed_raises(self):
+        """Test that the primary's error surfaces when both models fail"""
+        hedged = self.make_hedged({"gpt-4": 0.0, "gpt-3.5-turbo": 0.0}, fail=("gpt-4", "gpt-3.5-turbo"))
+        with self.assertRaises(RuntimeError):
+            asyncio.run(hedged.complete([]))
+        self.assertEqual(self.results, [])
+
+    def test_stream_hedges_on_first_token(self):
+        """Test that streaming switches to the model whose first token arrives first"""
+        hedged = self.make_hedged({"gpt-4": 1.0, "gpt-3.5-turbo": 0.01})
+
+        async def run():
+            return [token async for token in hedged.stream([])]
+
+        self.assertEqual(asyncio.run(run()), ["gpt-3.5-turbo", "!"])
+        self.assertEqual(self.results, ["fallback"])
+        self.assertEqual(self.cancelled, ["gpt-4"])
+        self.assertEqual(hedged.client.in_flight, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test cases for per-user message coalescing
+"""
+
+import unittest
+import asyncio
+
+from message_coalescer import MessageCoalescer
+
+
+class TestMessageCoalescer(unittest.TestCase):
+    """Test cases for MessageCoalescer"""
+
+    def setUp(self):
+        """Record every handled turn"""
+        self.turns = []
+
+        async def handler(user_id, text, payload):
+            self.turns.append((user_id, text, payload))
+            await asyncio.sleep(0.05)
+
+        self.coalescer = MessageCoalescer(handler, window=0.02, max_delay=0.2)
+
+    def test_burst_is_merged(self):
+        """Test that quick consecutive messages become one turn answered with the latest payload"""
+        async def run():
+            for i, text in enumerate(["Привет", "у меня вопрос", "про пенсию"]):
+                self.coalescer.submit(1, text, payload=i)
+                await asyncio.sleep(0.005)
+            await self.coalescer.join()
+
+        asyncio.run(run())
+        self.assertEqual(self.turns, [(1, "Привет\nу меня вопрос\nпро пенсию", 2)])
+        self.assertEqual(self.coalescer.saved_calls, 2)
+        self.assertEqual(self.coalescer.pending(), 0)
+
+    def test_messages_during_reply_form_next_turn(self):
+        """Test that messages sent while a reply is pending are answered together afterwards"""
+        async def run():
+            self.coalescer.submit(1, "first")
+            await asyncio.sleep(0.03)  # window over, reply in progress
+            self.coalescer.submit(1, "second")
+            await asyncio.sleep(0.03)
+            self.coalescer.submit(1, "third")
+            await self.coalescer.join()
+
+        asyncio.run(run())
+        self.assertEqual([text for _, text, _ in self.turns], ["first", "second\nthird"])
+
+    def test_users_are_independent(self):
+        """Test that different users get separate turns"""
+        async def run():
+            self.coalescer.submit(1, "a")
+            self.coalescer.submit(2, "b")
+            await self.coalescer.join()
+
+        asyncio.run(run())
+        self.assertEqual(sorted(text for _, text, _ in self.turns), ["a", "b"])
+        self.assertEqual(self.coalescer.saved_calls, 0)
+
+    def test_max_delay_caps_waiting(self):
+        """Test that a never-ending burst is still answered after max_delay"""
+        coalescer = MessageCoalescer(self.coalescer.handler, window=0.05, max_delay=0.1)
+
+        async def run():
+            for _ in range(10):
+                coalescer.submit(1, "x")
+                await asyncio.sleep(0.03)
+            await coalescer.join()
+
+        asyncio.run(run())
+        self.assertGreater(len(self.turns), 1)
+        self.assertEqual(sum(text.count("x") for _, text, _ in self.turns), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
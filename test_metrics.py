@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test cases for in-process Prometheus metrics
+"""
+
+import unittest
+
+from metrics import BotMetrics, MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+    """Test cases for metrics"""
+
+    def setUp(self):
+        """Set up an empty registry"""
+        self.registry = MetricsRegistry()
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that bucket counts are rendered cumulatively with sum and count"""
+        histogram = self.registry.histogram("latency_seconds", "Latency", ("model",), buckets=(1, 5))
+        for value in (0.5, 1, 3, 10):
+            histogram.labels("gpt-4").observe(value)
+        text = self.registry.render()
+        self.assertIn('latency_seconds_bucket{model="gpt-4",le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{model="gpt-4",le="5"} 3', text)
+        self.assertIn('latency_seconds_bucket{model="gpt-4",le="+Inf"} 4', text)
+        self.assertIn('latency_seconds_sum{model="gpt-4"} 14.5', text)
+        self.assertIn('latency_seconds_count{model="gpt-4"} 4', text)
+
+    def test_timer_observes_duration(self):
+        """Test that time() records one observation"""
+        histogram = self.registry.histogram("block_seconds", "Block")
+        with histogram.time():
+            pass
+        self.assertIn("block_seconds_count 1", self.registry.render())
+
+    def test_counter_and_gauges(self):
+        """Test counters by label, settable gauges and callback gauges"""
+        errors = self.registry.counter("errors_total", "Errors", ("type",))
+        errors.labels("TimeoutError").inc()
+        errors.labels("TimeoutError").inc()
+        in_flight = self.registry.gauge("in_flight", "In flight")
+        in_flight.inc()
+        in_flight.inc()
+        in_flight.dec()
+        self.registry.gauge("queue_depth", "Queue", callback=lambda: 7)
+        text = self.registry.render()
+        self.assertIn('errors_total{type="TimeoutError"} 2', text)
+        self.assertIn("in_flight 1", text)
+        self.assertIn("queue_depth 7", text)
+        self.assertIn("# TYPE errors_total counter", text)
+
+    def test_bot_metrics_render(self):
+        """Test that the pipeline metrics are all exported"""
+        text = BotMetrics().render()
+        for name in ("bot_openai_request_seconds", "bot_handle_message_seconds", "bot_first_text_seconds",
+                     "bot_telegram_send_seconds", "bot_messages_in_flight", "bot_errors_total",
+                     "bot_tokens_per_request"):
+            self.assertIn(f"# TYPE {name}", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
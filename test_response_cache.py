@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test cases for the first-turn response cache
+"""
+
+import unittest
+
+from response_cache import ResponseCache, normalize, prompt_version
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test cases for ResponseCache"""
+
+    def setUp(self):
+        """Set up a cache that never regenerates"""
+        self.clock = FakeClock()
+        self.cache = ResponseCache(max_entries=2, ttl=100, regenerate_probability=0.0,
+                                   clock=self.clock, rng=lambda: 0.5)
+        self.key = ResponseCache.key("С чего начать?", "gpt-4", "v1")
+
+    def test_normalize(self):
+        """Test that case, punctuation, ё and spacing are ignored"""
+        self.assertEqual(normalize("  С чего   НАЧАТЬ?! "), "с чего начать")
+        self.assertEqual(normalize("Всё"), normalize("все"))
+        self.assertEqual(ResponseCache.key("с чего начать", "gpt-4", "v1"), self.key)
+
+    def test_key_depends_on_model_and_prompt(self):
+        """Test that different models or prompts do not share answers"""
+        self.assertNotEqual(ResponseCache.key("С чего начать?", "gpt-3.5-turbo", "v1"), self.key)
+        self.assertNotEqual(prompt_version("a"), prompt_version("b"))
+
+    def test_hit_after_put(self):
+        """Test that a stored answer is served and counted"""
+        self.assertIsNone(self.cache.get(self.key))
+        self.cache.put(self.key, "Начните с защиты")
+        self.assertEqual(self.cache.get(self.key), "Начните с защиты")
+        self.assertEqual(self.cache.stats()["hit_rate"], 0.5)
+
+    def test_ttl_expiry(self):
+        """Test that answers expire after ttl"""
+        self.cache.put(self.key, "answer")
+        self.clock.now = 101
+        self.assertIsNone(self.cache.get(self.key))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_size_bound(self):
+        """Test that the least recently used key is evicted"""
+        other = ResponseCache.key("пенсия", "gpt-4", "v1")
+        third = ResponseCache.key("страховка", "gpt-4", "v1")
+        self.cache.put(self.key, "a")
+        self.cache.put(other, "b")
+        self.cache.get(self.key)
+        self.cache.put(third, "c")
+        self.assertIsNone(self.cache.get(other))
+        self.assertEqual(self.cache.get(self.key), "a")
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_regenerate_policy_collects_variants(self):
+        """Test that regenerated answers are added as variants up to max_variants"""
+        cache = ResponseCache(regenerate_probability=1.0, max_variants=2, rng=lambda: 0.0)
+        for answer in ("a", "b", "c"):
+            self.assertIsNone(cache.get(self.key))
+            cache.put(self.key, answer)
+        self.assertEqual(cache.regenerations, 2)
+        cache.regenerate_probability = 0.0
+        self.assertEqual(cache.get(self.key), "b")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Test cases for outbound message splitting and scheduling
+"""
+
+import unittest
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from send_scheduler import CONTINUATION, FIRST, SendScheduler, split_message
+
+
+class TestSplitMessage(unittest.TestCase):
+    """Test cases for split_message"""
+
+    def test_short_text_is_one_chunk(self):
+        """Test text within the limit is left alone"""
+        self.assertEqual(split_message("hello", limit=10), ["hello"])
+        self.assertEqual(split_message("", limit=10), [""])
+
+    def test_splits_at_paragraphs(self):
+        """Test long text is cut at the last paragraph break"""
+        text = "a" * 6 + "\n\n" + "b" * 6 + "\n\n" + "c" * 6
+        self.assertEqual(split_message(text, limit=16), ["a" * 6 + "\n\n" + "b" * 6, "c" * 6])
+
+    def test_falls_back_to_words_and_hard_cuts(self):
+        """Test text without paragraphs is cut at spaces, then mid-word"""
+        self.assertEqual(split_message("aaaa bbbb cccc", limit=10), ["aaaa bbbb", "cccc"])
+        self.assertEqual(split_message("x" * 25, limit=10), ["x" * 10, "x" * 10, "x" * 5])
+
+    def test_chunks_fit_the_limit(self):
+        """Test every chunk of a long answer fits Telegram's limit"""
+        text = "\n\n".join(f"Абзац {i}: " + "слово " * 100 for i in range(40))
+        chunks = split_message(text)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= 4096 for chunk in chunks))
+        self.assertEqual("\n\n".join(chunks), text)
+
+
+class TestSendScheduler(unittest.TestCase):
+    """Test cases for SendScheduler"""
+
+    def setUp(self):
+        """Record the order calls actually run in"""
+        self.calls = []
+
+    def call(self, name, result=None):
+        async def run():
+            self.calls.append(name)
+            return result
+        return run
+
+    def test_returns_result(self):
+        """Test send() returns what the call returned"""
+        scheduler = SendScheduler()
+        result = asyncio.run(scheduler.send(1, self.call("a", result=42)))
+        self.assertEqual(result, 42)
+        self.assertEqual(scheduler.stats(), {"queued": 0, "sent": 1, "flood_waits": 0})
+
+    def test_chat_rate_limit(self):
+        """Test one chat gets its burst at once, then chat_rate calls per second, in order"""
+        scheduler = SendScheduler(rate=1000, chat_rate=20, chat_burst=2)
+
+        async def run():
+            started = time.monotonic()
+            await asyncio.gather(*(scheduler.send(1, self.call(i)) for i in range(4)))
+            return time.monotonic() - started
+
+        elapsed = asyncio.run(run())
+        self.assertEqual(self.calls, [0, 1, 2, 3])
+        self.assertGreaterEqual(elapsed, 0.09)
+
+    def test_other_chats_are_not_held_up(self):
+        """Test a rate-limited chat does not delay other chats"""
+        scheduler = SendScheduler(rate=1000, chat_rate=1, chat_burst=1)
+
+        async def run():
+            await scheduler.send(1, self.call("1a"))
+            waiting = asyncio.ensure_future(scheduler.send(1, self.call("1b")))  # chat 1 must wait a second
+            await scheduler.send(2, self.call("2a"))
+            waiting.cancel()
+
+        asyncio.run(run())
+        self.assertEqual(self.calls, ["1a", "2a"])
+
+    def test_first_chunks_go_before_continuations(self):
+        """Test a new answer overtakes continuation chunks when the global limit is hit"""
+        scheduler = SendScheduler(rate=20, chat_rate=1000, chat_burst=10)
+
+        async def run():
+            await scheduler.send(0, self.call("warm-up"))  # uses the only global token
+            scheduler._global.level = 0
+            await asyncio.gather(
+                scheduler.send(1, self.call("continuation"), CONTINUATION),
+                scheduler.send(2, self.call("first"), FIRST),
+            )
+
+        asyncio.run(run())
+        self.assertEqual(self.calls, ["warm-up", "first", "continuation"])
+
+    def test_retry_after_is_honoured(self):
+        """Test flood control pauses the chat and resends the call"""
+        scheduler = SendScheduler()
+        attempts = []
+
+        async def flaky():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise RetryAfter(0)
+            return "ok"
+
+        self.assertEqual(asyncio.run(scheduler.send(1, flaky)), "ok")
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(scheduler.flood_waits, 1)
+
+    def test_retry_after_without_retry_raises(self):
+        """Test calls not worth resending surface RetryAfter"""
+        scheduler = SendScheduler()
+
+        async def flooded():
+            raise RetryAfter(0)
+
+        with self.assertRaises(RetryAfter):
+            asyncio.run(scheduler.send(1, flooded, CONTINUATION, retry=False))
+        self.assertEqual(scheduler.queued, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Test cases for sharding updates across worker processes
+"""
+
+import unittest
+from unittest.mock import Mock, patch
+import asyncio
+import contextlib
+import os
+import tempfile
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from telegram import Update
+from telegram.ext import Application
+
+import bot as bot_module
+from bot import FinancialAdvisorBot
+from fake_servers import FakeTelegram
+from sharding import HashRing, ShardDispatcher
+
+SECRET = "s3cret"
+
+
+def make_update(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            "text": f"message {update_id}",
+        },
+    }
+
+
+class FakeWorker:
+    """Worker endpoint recording forwarded updates; ready and accepting can be switched off"""
+
+    def __init__(self):
+        self.received = []
+        self.ready = True
+        self.accepting = True
+        self.busy = set()  # users reported as still being answered
+        app = web.Application()
+        app.router.add_post("/telegram", self.handle_update)
+        app.router.add_get("/ready", self.handle_ready)
+        app.router.add_post("/busy", self.handle_busy)
+        self.server = TestServer(app)
+        self.url = None
+
+    async def start(self):
+        await self.server.start_server()
+        self.url = str(self.server.make_url("")).rstrip("/")
+
+    async def handle_update(self, request):
+        if not self.accepting:
+            return web.Response(status=503)
+        self.received.append(await request.json())
+        return web.Response()
+
+    async def handle_ready(self, request):
+        return web.Response(status=200 if self.ready else 503)
+
+    async def handle_busy(self, request):
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != SECRET:
+            return web.Response(status=403)
+        users = (await request.json())["users"]
+        return web.json_response({"busy": [user_id for user_id in users if user_id in self.busy]})
+
+
+class TestHashRing(unittest.TestCase):
+    """Test cases for HashRing"""
+
+    def test_keys_spread_over_nodes(self):
+        """Test every node owns a fair share of users"""
+        ring = HashRing(["a", "b", "c"])
+        owners = [ring.node_for(user_id) for user_id in range(3000)]
+        for node in ("a", "b", "c"):
+            self.assertGreater(owners.count(node), 600)
+
+    def test_removing_a_node_only_moves_its_keys(self):
+        """Test users of other nodes keep their node when one leaves and comes back"""
+        ring = HashRing(["a", "b", "c"])
+        before = {user_id: ring.node_for(user_id) for user_id in range(1000)}
+        ring.remove("b")
+        self.assertNotIn("b", ring)
+        for user_id, node in before.items():
+            if node != "b":
+                self.assertEqual(ring.node_for(user_id), node)
+            else:
+                self.assertIn(ring.node_for(user_id), ("a", "c"))
+        ring.add("b")
+        self.assertEqual({user_id: ring.node_for(user_id) for user_id in range(1000)}, before)
+
+    def test_empty_ring(self):
+        """Test an empty ring owns nothing"""
+        self.assertIsNone(HashRing().node_for(1))
+
+
+class TestShardDispatcher(unittest.TestCase):
+    """Test cases for ShardDispatcher against two fake workers"""
+
+    def run_with_workers(self, scenario):
+        async def run():
+            workers = [FakeWorker(), FakeWorker()]
+            for worker in workers:
+                await worker.start()
+            dispatcher = ShardDispatcher([worker.url for worker in workers], port=0, secret_token=SECRET,
+                                         health_interval=0.05)
+            await dispatcher.start()
+            try:
+                await scenario(dispatcher, workers)
+            finally:
+                await dispatcher.close()
+                for worker in workers:
+                    await worker.server.close()
+            return dispatcher, workers
+        return asyncio.run(run())
+
+    def test_each_user_goes_to_one_worker_in_order(self):
+        """Test updates are routed by user and keep their order"""
+        async def scenario(dispatcher, workers):
+            for update_id in range(40):
+                await dispatcher.forward(Update.de_json(make_update(update_id, update_id % 8), None))
+            await dispatcher.drain()
+
+        dispatcher, workers = self.run_with_workers(scenario)
+
+        self.assertEqual(sum(len(worker.received) for worker in workers), 40)
+        for worker in workers:
+            self.assertGreater(len(worker.received), 0)
+            by_user = {}
+            for update in worker.received:
+                by_user.setdefault(update["message"]["from"]["id"], []).append(update["update_id"])
+            for user_id, update_ids in by_user.items():
+                self.assertEqual(update_ids, sorted(update_ids))
+                self.assertEqual(dispatcher.ring.node_for(user_id), worker.url)
+
+    def test_failed_worker_hands_users_over_and_rejoins(self):
+        """Test a failing worker's users move to the other worker until it is ready again"""
+        async def scenario(dispatcher, workers):
+            workers[0].accepting = workers[0].ready = False
+            for update_id in range(20):
+                dispatcher.route(update_id % 8, make_update(update_id, update_id % 8))
+            await dispatcher.drain()
+            self.assertNotIn(workers[0].url, dispatcher.ring)
+
+            workers[0].accepting = workers[0].ready = True
+            await asyncio.sleep(0.2)
+            self.assertIn(workers[0].url, dispatcher.ring)
+
+        dispatcher, workers = self.run_with_workers(scenario)
+
+        self.assertEqual(len(workers[0].received), 0)
+        self.assertEqual(len(workers[1].received), 20)
+        self.assertEqual(dispatcher.dropped, 0)
+        self.assertEqual(dispatcher.stats()["rebalances"], 2)
+
+    def test_moved_user_waits_for_previous_worker(self):
+        """Test a user's updates reach the new worker only once the old one has finished their turn"""
+        async def scenario(dispatcher, workers):
+            user_id = next(user_id for user_id in range(100) if dispatcher.ring.node_for(user_id) == workers[0].url)
+            dispatcher.route(user_id, make_update(1, user_id))
+            await dispatcher.drain()
+            workers[0].busy.add(user_id)
+            workers[0].ready = False
+            while workers[0].url in dispatcher.ring:
+                await asyncio.sleep(0.01)
+
+            for update_id in (2, 3):
+                dispatcher.route(user_id, make_update(update_id, user_id))
+            await asyncio.sleep(0.2)
+            self.assertEqual(workers[1].received, [])
+            self.assertEqual(dispatcher.stats()["held_users"], 1)
+
+            workers[0].busy.clear()
+            await dispatcher.drain()
+
+        dispatcher, workers = self.run_with_workers(scenario)
+
+        self.assertEqual([update["update_id"] for update in workers[1].received], [2, 3])
+        self.assertEqual(dispatcher.stats()["handovers"], 1)
+        self.assertEqual(dispatcher.stats()["held_users"], 0)
+
+    def test_updates_wait_while_no_worker_is_ready(self):
+        """Test updates arriving while every worker is out of the ring are forwarded once one is back"""
+        async def scenario(dispatcher, workers):
+            for worker in workers:
+                worker.ready = False
+            while len(dispatcher.ring):
+                await asyncio.sleep(0.01)
+            for update_id in range(6):
+                dispatcher.route(update_id % 3, make_update(update_id, update_id % 3))
+            self.assertEqual(dispatcher.stats()["waiting"], 6)
+
+            workers[1].ready = True
+            while workers[1].url not in dispatcher.ring:
+                await asyncio.sleep(0.01)
+            await dispatcher.drain()
+
+        dispatcher, workers = self.run_with_workers(scenario)
+
+        self.assertEqual([update["update_id"] for update in workers[1].received], list(range(6)))
+        self.assertEqual((dispatcher.dropped, dispatcher.stats()["waiting"]), (0, 0))
+
+    def test_secret_is_required(self):
+        """Test a dispatcher cannot be created without the secret its workers check on /busy"""
+        with self.assertRaises(ValueError):
+            ShardDispatcher(["http://127.0.0.1:8081"], port=0)
+
+
+@patch.multiple(bot_module, RESPONSE_CACHE_SIZE=0, SUMMARY_MODEL="", OPENAI_FALLBACK_MODEL="", STREAM_REPLIES=False,
+                COALESCE_WINDOW=0, TELEGRAM_GLOBAL_RATE=10000, TELEGRAM_CHAT_RATE=10000, TELEGRAM_CHAT_BURST=100,
+                OPENAI_RPM=10**6, OPENAI_TPM=10**9, OPENAI_WARM_CONNECTIONS=0, CONVERSATION_FLUSH_INTERVAL=0.05,
+                BOT_MODE="worker")
+class TestShardedBots(unittest.TestCase):
+    """Failover between two real bot workers sharing one conversation database"""
+
+    def setUp(self):
+        """Create the shared database file"""
+        handle, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+
+    def tearDown(self):
+        """Remove the database and its WAL files"""
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_user_moves_away_and_back_without_losing_turns(self):
+        """Test every turn sees the full history when a busy worker leaves the ring and rejoins"""
+        answers = []
+        slow = {"seconds": 0.0}
+
+        async def complete(messages, **kwargs):
+            await asyncio.sleep(slow["seconds"])
+            # The answer records how much history the completion saw
+            return Mock(choices=[Mock(message=Mock(content=f"{messages[-1]['content']} after {len(messages) - 1}"))])
+
+        def on_request(method, params):
+            if method == "sendMessage":
+                answers.append(params["text"])
+
+        async def answered(count):
+            while len(answers) < count:
+                await asyncio.sleep(0.01)
+
+        async def start_worker(stack, telegram):
+            bot = FinancialAdvisorBot()
+            bot.openai_available = True
+            bot.llm.backend = complete
+            application = (
+                Application.builder().token("123:TEST").base_url(telegram.url + "/bot")
+                .concurrent_updates(bot_module.TELEGRAM_CONCURRENT_UPDATES).updater(None).build()
+            )
+            bot.add_handlers(application)
+            bot.web_server.add_webhook("/telegram", application, secret_token=SECRET)
+            server = TestServer(bot.web_server.app)
+            await server.start_server()
+            stack.push_async_callback(server.close)
+            stack.push_async_callback(bot.post_shutdown, application)
+            await stack.enter_async_context(application)
+            await application.start()
+            stack.push_async_callback(application.stop)
+            await bot.post_init(application)
+            return bot, str(server.make_url("")).rstrip("/")
+
+        async def run():
+            telegram = FakeTelegram(on_request=on_request)
+            await telegram.start()
+            try:
+                async with contextlib.AsyncExitStack() as stack:
+                    (first, first_url), (second, second_url) = [await start_worker(stack, telegram) for _ in range(2)]
+                    dispatcher = ShardDispatcher([first_url, second_url], port=0, secret_token=SECRET,
+                                                 health_interval=0.02, handover_interval=0.02)
+                    await dispatcher.start()
+                    stack.push_async_callback(dispatcher.close)
+                    user_id = next(user_id for user_id in range(100) if dispatcher.ring.node_for(user_id) == first_url)
+
+                    # The first worker is still answering when it stops being ready
+                    slow["seconds"] = 0.3
+                    dispatcher.route(user_id, make_update(1, user_id))
+                    await dispatcher.drain()
+                    while user_id not in first.user_locks:
+                        await asyncio.sleep(0.01)
+                    first.web_server.ready = False
+                    while first_url in dispatcher.ring:
+                        await asyncio.sleep(0.01)
+                    slow["seconds"] = 0.0
+                    dispatcher.route(user_id, make_update(2, user_id))
+                    await dispatcher.drain()
+                    await answered(2)
+
+                    # Back in the ring, it must not continue from its cached history
+                    first.web_server.ready = True
+                    while first_url not in dispatcher.ring:
+                        await asyncio.sleep(0.01)
+                    dispatcher.route(user_id, make_update(3, user_id))
+                    await dispatcher.drain()
+                    await answered(3)
+                    return first.user_conversations.stats()["stale"], dispatcher.stats()["handovers"]
+            finally:
+                await telegram.stop()
+
+        with patch.multiple(bot_module, CONVERSATION_DB=self.path):
+            stale, handovers = asyncio.run(run())
+
+        self.assertEqual([answer.split("\n")[-1] for answer in answers],
+                         ["message 1 after 1", "message 2 after 3", "message 3 after 5"])
+        self.assertEqual(stale, 1)
+        self.assertEqual(handovers, 2)
+
+    def test_worker_takes_its_share_of_account_limits(self):
+        """Test each of SHARD_WORKER_COUNT workers admits only its part of the OpenAI and Telegram budgets"""
+        with patch.multiple(bot_module, CONVERSATION_DB="", OPENAI_RPM=500, OPENAI_TPM=30000,
+                            TELEGRAM_GLOBAL_RATE=30, SHARD_WORKER_COUNT=3):
+            bot = FinancialAdvisorBot()
+        self.assertEqual((bot.admission.rpm, bot.admission.tpm, bot.outbound.rate), (166, 10000, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test cases for progressive streamed replies
+"""
+
+import unittest
+from unittest.mock import AsyncMock, Mock
+import asyncio
+
+from telegram.error import RetryAfter
+
+from send_scheduler import SendScheduler
+from streaming_reply import StreamingReply
+from telegram_html import markdown_to_html
+
+
+class TestStreamingReply(unittest.TestCase):
+    """Test cases for StreamingReply"""
+
+    def setUp(self):
+        """Set up a fake incoming message whose reply can be edited"""
+        self.sent = Mock()
+        self.sent.edit_text = AsyncMock()
+        self.message = Mock()
+        self.message.reply_text = AsyncMock(return_value=self.sent)
+
+    def test_edits_are_throttled(self):
+        """Test that a burst of tokens produces a single partial edit"""
+        reply = StreamingReply(self.message, header="AI: ", edit_interval=10)
+
+        async def run():
+            await reply.start()
+            text = ""
+            for token in ["a", "b", "c", "d"]:
+                text += token
+                await reply.update(text)
+                await asyncio.sleep(0)
+            await reply.finish("AI: **abcd**", parse_mode="Markdown")
+
+        asyncio.run(run())
+        self.message.reply_text.assert_called_once()
+        bodies = [call.args[0] for call in self.sent.edit_text.call_args_list]
+        self.assertEqual(bodies, ["AI: a…", "AI: **abcd**"])
+        self.assertEqual(self.sent.edit_text.call_args.kwargs["parse_mode"], "Markdown")
+        self.assertIsNotNone(reply.time_to_first_text)
+
+    def test_rendered_edits(self):
+        """Test that partial and final text are rendered to HTML, unfinished markup staying literal"""
+        reply = StreamingReply(self.message, header="AI: ", edit_interval=0, render=markdown_to_html)
+
+        async def run():
+            await reply.start()
+            await reply.update("**Защита** & *нак")
+            await asyncio.sleep(0)
+            await reply.finish("AI: **Защита** & *накопления*")
+
+        asyncio.run(run())
+        edits = [(call.args[0], call.kwargs["parse_mode"]) for call in self.sent.edit_text.call_args_list]
+        self.assertEqual(edits, [
+            ("AI: <b>Защита</b> &amp; *нак…", "HTML"),
+            ("AI: <b>Защита</b> &amp; <i>накопления</i>", "HTML"),
+        ])
+
+    def test_retry_after_delays_next_edit(self):
+        """Test that flood control pushes back further partial edits"""
+        self.sent.edit_text = AsyncMock(side_effect=[RetryAfter(30), None])
+        reply = StreamingReply(self.message, edit_interval=0)
+
+        async def run():
+            await reply.start()
+            await reply.update("a")
+            await asyncio.sleep(0)
+            await reply.update("ab")
+            await reply.finish("ab")
+
+        asyncio.run(run())
+        self.assertEqual(self.sent.edit_text.call_count, 2)
+        self.assertEqual(reply.edits, 1)
+
+    def test_flood_limited_final_edit_counts_as_shown(self):
+        """Test that a final edit resent after flood control records the first text"""
+        self.sent.edit_text = AsyncMock(side_effect=[RetryAfter(30), RetryAfter(0), None])
+        reply = StreamingReply(self.message, edit_interval=0)
+
+        async def run():
+            await reply.start()
+            await reply.update("a")
+            await asyncio.sleep(0)
+            await reply.finish("ab")
+
+        asyncio.run(run())
+        self.assertEqual(self.sent.edit_text.call_count, 3)
+        self.assertEqual(reply.edits, 1)
+        self.assertIsNotNone(reply.time_to_first_text)
+
+    def test_long_answer_is_split(self):
+        """Test an answer over Telegram's limit continues in new messages, through the scheduler"""
+        scheduler = SendScheduler(chat_rate=1000, chat_burst=10)
+        reply = StreamingReply(self.message, scheduler=scheduler)
+        body = "\n\n".join(["a" * 3000, "b" * 3000, "c" * 100])
+
+        async def run():
+            await reply.start()
+            await reply.finish(body, parse_mode="Markdown")
+
+        asyncio.run(run())
+        self.assertEqual(self.sent.edit_text.call_args.args[0], "a" * 3000)
+        continuations = [call.args[0] for call in self.message.reply_text.call_args_list[1:]]
+        self.assertEqual(continuations, ["b" * 3000 + "\n\n" + "c" * 100])
+        self.assertEqual(scheduler.sent, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test cases for the Markdown to Telegram HTML renderer
+"""
+
+import unittest
+import random
+from html.parser import HTMLParser
+
+from telegram_html import markdown_to_html
+
+TELEGRAM_TAGS = {"b", "i", "s", "code", "pre", "a"}
+
+
+class TagChecker(HTMLParser):
+    """Collects problems Telegram would reject: unknown or unbalanced tags"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.open = []
+        self.errors = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in TELEGRAM_TAGS:
+            self.errors.append(f"unknown <{tag}>")
+        self.open.append(tag)
+
+    def handle_endtag(self, tag):
+        if not self.open or self.open.pop() != tag:
+            self.errors.append(f"unbalanced </{tag}>")
+
+    def handle_data(self, data):
+        if "<" in data or ">" in data:
+            self.errors.append(f"unescaped markup in {data!r}")
+
+
+def problems(html: str) -> list:
+    checker = TagChecker()
+    checker.feed(html)
+    checker.close()
+    return checker.errors + [f"unclosed <{tag}>" for tag in checker.open]
+
+
+class TestMarkdownToHtml(unittest.TestCase):
+    """Test cases for markdown_to_html"""
+
+    def test_model_answer(self):
+        """Test the constructs the model uses in answers"""
+        answer = (
+            "### Шаг 1: **Защита семьи**\n"
+            "- **Страховка жизни** (term) — на срок, пока дети <18 лет\n"
+            "* Доход & *нетрудоспособность*\n"
+            "1. Откройте `Roth IRA` — подробнее на [irs.gov](https://www.irs.gov/retirement-plans)"
+        )
+        self.assertEqual(markdown_to_html(answer), (
+            "<b>Шаг 1: Защита семьи</b>\n"
+            "• <b>Страховка жизни</b> (term) — на срок, пока дети &lt;18 лет\n"
+            "• Доход &amp; <i>нетрудоспособность</i>\n"
+            '1. Откройте <code>Roth IRA</code> — подробнее на <a href="https://www.irs.gov/retirement-plans">irs.gov</a>'
+        ))
+
+    def test_unbalanced_markers_stay_literal(self):
+        """Test that markers without a partner are text, not broken tags"""
+        self.assertEqual(markdown_to_html("**незакрытый *курсив"), "**незакрытый *курсив")
+        self.assertEqual(markdown_to_html("*a **b* c**"), "<i>a **b</i> c**")
+        self.assertEqual(markdown_to_html("2 * 3 * 4, 401_k_plan, [Накопления]"), "2 * 3 * 4, 401_k_plan, [Накопления]")
+
+    def test_code_blocks(self):
+        """Test that fenced code is escaped verbatim, also while the fence is still open"""
+        self.assertEqual(markdown_to_html("```\n**x** < 1\n```\nok"), "<pre>**x** &lt; 1</pre>\nok")
+        self.assertEqual(markdown_to_html("Пример:\n```\na & b"), "Пример:\n<pre>a &amp; b</pre>")
+
+    def test_any_input_is_valid(self):
+        """Test that random mixes of markup, and every prefix of them, render to balanced Telegram HTML"""
+        rng = random.Random(3)
+        alphabet = ["*", "**", "_", "__", "~~", "`", "```", "[", "](https://x.y/_a)", "]", "<", ">", "&", "#", "- ",
+                    " ", "\n", "слово", "a_b", "Roth IRA"]
+        for _ in range(300):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 40)))
+            for end in range(0, len(text) + 1, 7):
+                html = markdown_to_html(text[:end])
+                self.assertEqual(problems(html), [], f"{text[:end]!r} -> {html!r}")
+
+
+if __name__ == "__main__":
+    unittest.main()
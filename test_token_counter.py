@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Test cases for token counting and history budgets
+"""
+
+import unittest
+
+from token_counter import TokenCounter, context_window, history_token_budget
+
+
+class TestTokenCounter(unittest.TestCase):
+    """Test cases for token_counter"""
+
+    def test_context_window_prefix_match(self):
+        """Test that the longest matching model prefix wins"""
+        self.assertEqual(context_window("gpt-4"), 8192)
+        self.assertEqual(context_window("gpt-4-0613"), 8192)
+        self.assertEqual(context_window("gpt-4-turbo-preview"), 128000)
+        self.assertEqual(context_window("gpt-3.5-turbo-16k"), 16385)
+        self.assertEqual(context_window("unknown-model"), 4096)
+
+    def test_history_budget_fits_context(self):
+        """Test that the budget never exceeds what fits next to prompt and reply"""
+        self.assertEqual(history_token_budget("gpt-4", 1500, 1000), 3000)
+        self.assertEqual(history_token_budget("gpt-4", 1500, 1000, configured=20000), 8192 - 1500 - 1000 - 1000)
+        self.assertEqual(history_token_budget("gpt-4o", 1500, 1000, configured=500), 500)
+
+    def test_count_message_includes_overhead(self):
+        """Test that a message costs more than its content"""
+        counter = TokenCounter("gpt-4")
+        text = "Как планировать пенсию в США?"
+        self.assertGreater(counter.count(text), 0)
+        self.assertGreater(counter.count_message({"role": "user", "content": text}), counter.count(text))
+
+
+if __name__ == "__main__":
+    unittest.main()
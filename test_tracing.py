@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Test cases for per-update tracing and the sampling profiler
+"""
+
+import unittest
+import asyncio
+import json
+import time
+
+from sampling_profiler import SamplingProfiler
+from tracing import Tracer, annotate, span
+
+
+class TestTracer(unittest.TestCase):
+    """Test cases for Tracer and spans"""
+
+    def run_traced(self, tracer, body, update_id=None):
+        """Run body inside a trace and return the logged JSON record"""
+        trace = tracer.start("message", update_id=update_id, user_id=42)
+        with self.assertLogs("tracing", level="INFO") as logs:
+            with tracer.activate(trace):
+                body()
+        self.assertEqual(len(logs.records), 1)
+        return json.loads(logs.records[0].getMessage())
+
+    def test_spans_are_logged_as_json(self):
+        """Test that spans, their attributes and trace attributes end up in one JSON record"""
+        def body():
+            with span("openai", prompt_tokens=120) as attributes:
+                time.sleep(0.01)
+                attributes["completion_tokens"] = 30
+            annotate(cache_hit=False)
+
+        record = self.run_traced(Tracer(), body)
+
+        self.assertEqual(record["user_id"], 42)
+        self.assertFalse(record["cache_hit"])
+        openai_span, = record["spans"]
+        self.assertEqual(openai_span["name"], "openai")
+        self.assertEqual((openai_span["prompt_tokens"], openai_span["completion_tokens"]), (120, 30))
+        self.assertGreaterEqual(openai_span["duration_ms"], 10)
+        self.assertGreaterEqual(record["duration_ms"], openai_span["duration_ms"])
+
+    def test_queue_span_from_arrival(self):
+        """Test that time between arrival and the handler is reported as a queue span"""
+        tracer = Tracer()
+        tracer.received(7)
+        time.sleep(0.01)
+
+        record = self.run_traced(tracer, lambda: None, update_id=7)
+
+        self.assertEqual(record["update_id"], 7)
+        self.assertEqual(record["spans"][0]["name"], "queue")
+        self.assertGreaterEqual(record["spans"][0]["duration_ms"], 10)
+
+    def test_errors_are_recorded(self):
+        """Test that an exception marks the span and the trace"""
+        tracer = Tracer()
+        trace = tracer.start("message")
+        with self.assertLogs("tracing", level="INFO") as logs, self.assertRaises(ValueError):
+            with tracer.activate(trace):
+                with span("reply_text"):
+                    raise ValueError("boom")
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["error"], "ValueError")
+        self.assertEqual(record["spans"][0]["error"], "ValueError")
+
+    def test_span_outside_trace_is_noop(self):
+        """Test that spans and annotations without a current trace do nothing"""
+        with span("openai") as attributes:
+            attributes["completion_tokens"] = 1
+        annotate(cache_hit=True)
+
+    def test_traces_are_isolated_per_task(self):
+        """Test that concurrent updates record spans into their own trace"""
+        tracer = Tracer()
+
+        async def handle(user_id):
+            trace = tracer.start("message", user_id=user_id)
+            with tracer.activate(trace):
+                with span(f"work-{user_id}"):
+                    await asyncio.sleep(0.01)
+            return trace
+
+        async def run():
+            return await asyncio.gather(handle(1), handle(2))
+
+        with self.assertLogs("tracing", level="INFO"):
+            first, second = asyncio.run(run())
+        self.assertEqual([name for name, *_ in first.spans], ["work-1"])
+        self.assertEqual([name for name, *_ in second.spans], ["work-2"])
+
+    def test_sampling_keeps_slow_traces(self):
+        """Test that unsampled traces are dropped unless slow"""
+        tracer = Tracer(sample_rate=0.0, slow_after=0.005)
+        with tracer.activate(tracer.start("fast")):
+            pass
+        self.assertEqual(tracer.exported, 0)
+
+        self.run_traced(tracer, lambda: time.sleep(0.01))
+        self.assertEqual(tracer.exported, 1)
+
+
+def busy_work(seconds):
+    """CPU-bound function the profiler should catch"""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(100))
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    """Test cases for SamplingProfiler"""
+
+    def test_profile_shows_blocking_code(self):
+        """Test that code hogging the event loop dominates the collapsed stacks"""
+        profiler = SamplingProfiler(interval=0.001)
+
+        async def run():
+            profile = asyncio.ensure_future(profiler.profile(0.2))
+            await asyncio.sleep(0.01)
+            busy_work(0.15)
+            return await profile
+
+        stacks = asyncio.run(run())
+        lines = stacks.splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertIn(";busy_work (test_tracing.py:", stack)
+        self.assertGreater(int(count), 10)
+        self.assertFalse(profiler.running)
+
+    def test_one_profile_at_a_time(self):
+        """Test that a second concurrent profile is refused"""
+        profiler = SamplingProfiler()
+
+        async def run():
+            first = asyncio.ensure_future(profiler.profile(0.05))
+            await asyncio.sleep(0)
+            with self.assertRaises(RuntimeError):
+                await profiler.profile(0.05)
+            await first
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Test cases for per-user serialization under concurrent update processing
+"""
+
+import unittest
+from unittest.mock import Mock, patch
+import asyncio
+import random
+
+from telegram import Update
+from telegram.ext import Application
+
+import bot as bot_module
+from bot import FinancialAdvisorBot
+from fake_servers import FakeTelegram
+from user_locks import UserLocks
+
+
+class TestUserLocks(unittest.TestCase):
+    """Test cases for UserLocks"""
+
+    def test_same_user_in_order_others_in_parallel(self):
+        """Test that one user's turns run one at a time in arrival order while other users overlap"""
+        locks = UserLocks()
+        events = []
+
+        async def turn(user_id, n):
+            async with locks.hold(user_id):
+                events.append(("start", user_id, n))
+                await asyncio.sleep(0.01)
+                events.append(("end", user_id, n))
+
+        async def run():
+            await asyncio.gather(turn(1, 0), turn(1, 1), turn(2, 0), turn(1, 2))
+
+        asyncio.run(run())
+        self.assertEqual([n for kind, user_id, n in events if user_id == 1 and kind == "start"], [0, 1, 2])
+        self.assertEqual(events[:2], [("start", 1, 0), ("start", 2, 0)])
+        self.assertEqual(len(locks), 0)
+        self.assertEqual(locks.stats()["contended"], 2)
+
+    def test_cancelled_waiter_is_evicted(self):
+        """Test that a turn cancelled while waiting leaves no lock behind"""
+        locks = UserLocks()
+
+        async def run():
+            async with locks.hold(1):
+                waiter = asyncio.ensure_future(locks.hold(1).__aenter__())
+                await asyncio.sleep(0)
+                self.assertEqual(locks.stats()["waiting"], 1)
+                waiter.cancel()
+                await asyncio.gather(waiter, return_exceptions=True)
+
+        asyncio.run(run())
+        self.assertEqual(len(locks), 0)
+
+
+@patch.multiple(bot_module, CONVERSATION_DB="", RESPONSE_CACHE_SIZE=0, SUMMARY_MODEL="", OPENAI_FALLBACK_MODEL="",
+                STREAM_REPLIES=False, COALESCE_WINDOW=0, TELEGRAM_GLOBAL_RATE=10000, TELEGRAM_CHAT_RATE=10000,
+                TELEGRAM_CHAT_BURST=100, OPENAI_RPM=10**6, OPENAI_TPM=10**9)
+class TestConcurrentUpdates(unittest.TestCase):
+    """Stress test: interleaved messages of many users through a concurrent Application"""
+
+    USERS = 20
+    MESSAGES = 5
+
+    def test_interleaved_messages_keep_histories_consistent(self):
+        """Test that users are answered in parallel and every history is in order with nothing lost"""
+        rng = random.Random(7)
+        running = {}  # user_id -> completions in flight
+        peak = {"all": 0, "user": 0}
+
+        async def complete(messages, **kwargs):
+            user_id, question = messages[-1]["content"].split(":")
+            running[user_id] = running.get(user_id, 0) + 1
+            peak["user"] = max(peak["user"], running[user_id])
+            peak["all"] = max(peak["all"], sum(running.values()))
+            await asyncio.sleep(rng.uniform(0.001, 0.02))
+            running[user_id] -= 1
+            # The answer records how much history the completion saw
+            return Mock(choices=[Mock(message=Mock(content=f"{question} after {len(messages) - 1}"))])
+
+        bot = FinancialAdvisorBot()
+        bot.openai_available = True
+        bot.llm.backend = complete
+        telegram = FakeTelegram()
+
+        def update(update_id, user_id, n, application):
+            return Update.de_json({
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id, "date": 0, "text": f"{user_id}:q{n}",
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+                },
+            }, application.bot)
+
+        async def run():
+            await telegram.start()
+            application = (
+                Application.builder().token("123:TEST").base_url(telegram.url + "/bot")
+                .concurrent_updates(bot_module.TELEGRAM_CONCURRENT_UPDATES).updater(None).build()
+            )
+            bot.add_handlers(application)
+            try:
+                async with application:
+                    await application.start()
+                    update_id = 0
+                    for n in range(self.MESSAGES):
+                        for user_id in range(1, self.USERS + 1):
+                            update_id += 1
+                            await application.update_queue.put(update(update_id, user_id, n, application))
+                    for _ in range(500):
+                        await asyncio.sleep(0.01)
+                        if telegram.calls.get("sendMessage", 0) == self.USERS * self.MESSAGES:
+                            break
+                    await application.stop()
+            finally:
+                await telegram.stop()
+
+        asyncio.run(run())
+        self.assertEqual(telegram.calls.get("sendMessage"), self.USERS * self.MESSAGES)
+        self.assertEqual(peak["user"], 1)
+        self.assertGreater(peak["all"], 1)
+        for user_id in range(1, self.USERS + 1):
+            history = [message["content"] for message in bot.user_conversations.messages(user_id)[1:]]
+            expected = []
+            for n in range(self.MESSAGES):
+                expected += [f"{user_id}:q{n}", f"q{n} after {2 * n + 1}"]
+            self.assertEqual(history, expected)
+        self.assertEqual(len(bot.user_locks), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
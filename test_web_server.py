@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Test cases for the async web server and webhook endpoint
+"""
+
+import unittest
+from unittest.mock import AsyncMock, Mock
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from web_server import WebServer
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 7,
+        "date": 0,
+        "chat": {"id": 67890, "type": "private"},
+        "from": {"id": 12345, "is_bot": False, "first_name": "Test"},
+        "text": "Hello bot!",
+    },
+}
+
+
+class TestWebServer(unittest.TestCase):
+    """Test cases for WebServer"""
+
+    def setUp(self):
+        """Set up a server with a fake Telegram application"""
+        self.server = WebServer(port=0, stats=lambda: {"conversations": {"users": 3}},
+                                metrics=lambda: "bot_messages_in_flight 0\n")
+        self.application = Mock()
+        self.application.bot = None
+        self.application.update_queue = asyncio.Queue()
+
+    def request(self, method, path, **kwargs):
+        """Run one request against the server and return (status, body)"""
+        return self.requests([(method, path, kwargs)])[0]
+
+    def requests(self, calls):
+        """Run (method, path, kwargs) requests in order; callables in calls run in between"""
+        async def run():
+            results = []
+            async with TestClient(TestServer(self.server.app)) as client:
+                for call in calls:
+                    if callable(call):
+                        call()
+                        continue
+                    method, path, kwargs = call
+                    response = await client.request(method, path, **kwargs)
+                    results.append((response.status, await response.text()))
+            return results
+        return asyncio.run(run())
+
+    def test_health_and_index(self):
+        """Test that liveness endpoints answer immediately"""
+        health, index = self.requests([("GET", "/health", {}), ("GET", "/", {})])
+        self.assertEqual(health, (200, "Bot is running!"))
+        self.assertEqual(index[0], 200)
+
+    def test_health_reports_dependencies(self):
+        """Test that /health stays up and reports dependency states when given"""
+        self.server.health = lambda: {"openai_circuit": "open"}
+        status, body = self.request("GET", "/health")
+        self.assertEqual(status, 200)
+        self.assertIn('"openai_circuit": "open"', body)
+
+    def test_readiness_follows_flag(self):
+        """Test that /ready fails until the bot marks itself ready"""
+        def mark_ready():
+            self.server.ready = True
+
+        starting, ready = self.requests([("GET", "/ready", {}), mark_ready, ("GET", "/ready", {})])
+        self.assertEqual(starting[0], 503)
+        self.assertEqual(ready[0], 200)
+
+    def test_readiness_waits_for_every_check(self):
+        """Test that /ready reports each component and fails until all are initialized"""
+        components = {"openai_pool": True, "handlers": True, "telegram": False}
+        self.server.checks = lambda: dict(components)
+        self.server.ready = True
+
+        def connect_telegram():
+            components["telegram"] = True
+
+        waiting, ready = self.requests([("GET", "/ready", {}), connect_telegram, ("GET", "/ready", {})])
+        self.assertEqual(waiting[0], 503)
+        self.assertIn('"telegram": false', waiting[1])
+        self.assertEqual(ready[0], 200)
+
+    def test_stats(self):
+        """Test that stats are served as JSON"""
+        status, body = self.request("GET", "/stats")
+        self.assertEqual(status, 200)
+        self.assertIn('"users": 3', body)
+
+    def test_metrics(self):
+        """Test that metrics are served as Prometheus text"""
+        self.assertEqual(self.request("GET", "/metrics"), (200, "bot_messages_in_flight 0\n"))
+
+    def test_webhook_queues_update(self):
+        """Test that a posted update lands on the application's update queue"""
+        self.server.add_webhook("/telegram", self.application, secret_token="s3cret")
+        headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+        self.assertEqual(self.request("POST", "/telegram", json=UPDATE, headers=headers)[0], 200)
+        update = self.application.update_queue.get_nowait()
+        self.assertEqual(update.message.text, "Hello bot!")
+        self.assertEqual(update.effective_user.id, 12345)
+
+    def test_webhook_rejects_wrong_secret(self):
+        """Test that updates without the shared secret are refused"""
+        self.server.add_webhook("/telegram", self.application, secret_token="s3cret")
+        self.assertEqual(self.request("POST", "/telegram", json=UPDATE)[0], 403)
+        self.assertTrue(self.application.update_queue.empty())
+
+    def test_webhook_reports_arrival(self):
+        """Test that on_update sees each update id before it is queued"""
+        arrived = []
+        self.server.on_update = arrived.append
+        self.server.add_webhook("/telegram", self.application)
+        self.request("POST", "/telegram", json=UPDATE)
+        self.assertEqual(arrived, [1])
+
+    def test_busy_lists_users_with_work_in_progress(self):
+        """Test that /busy answers the dispatcher's handover poll behind the webhook secret"""
+        self.server.busy = lambda user_id: user_id % 2 == 0
+        self.server.add_webhook("/telegram", self.application, secret_token="s3cret")
+        headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+        self.assertEqual(self.requests([
+            ("POST", "/busy", {"json": {"users": [1, 2, 4]}, "headers": headers}),
+            ("POST", "/busy", {"json": {"users": [2]}}),
+            ("POST", "/busy", {"json": [2], "headers": headers}),
+        ]), [(200, '{"busy": [2, 4]}'), (403, ""), (400, "")])
+
+    def test_busy_needs_a_secret(self):
+        """Test that /busy is not served at all when no webhook secret is configured"""
+        self.server.busy = lambda user_id: True
+        self.server.add_webhook("/telegram", self.application)
+        self.assertEqual(self.request("POST", "/busy", json={"users": [1]})[0], 404)
+
+    def test_profile_is_admin_only(self):
+        """Test that /debug/profile needs the admin token and returns collapsed stacks"""
+        profiler = Mock()
+        profiler.profile = AsyncMock(return_value="main;run 3\n")
+        self.server.profiler = profiler
+        admin = {"Authorization": "Bearer t0ken"}
+
+        def set_admin_token():
+            self.server.admin_token = "t0ken"
+
+        disabled, denied, too_long, profiled = self.requests([
+            ("GET", "/debug/profile", {"headers": admin}),
+            set_admin_token,
+            ("GET", "/debug/profile", {"headers": {"Authorization": "Bearer guess"}}),
+            ("GET", "/debug/profile", {"params": {"seconds": "600"}, "headers": admin}),
+            ("GET", "/debug/profile", {"params": {"seconds": "2"}, "headers": admin}),
+        ])
+        self.assertEqual(disabled[0], 404)
+        self.assertEqual(denied[0], 403)
+        self.assertEqual(too_long[0], 400)
+        self.assertEqual(profiled, (200, "main;run 3\n"))
+        profiler.profile.assert_awaited_once_with(2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Token counting for the Financial Advisor Bot
+Exact counts with tiktoken when installed, a conservative byte-based estimate otherwise
+"""
+
+import logging
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Context window per model family (longest matching prefix wins)
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4o": 128000,
+}
+
+# Default token budget for stored history per model family: bigger prompts
+# cost more and slow down generation, so this is far below the context window
+MODEL_HISTORY_BUDGETS = {
+    "gpt-3.5-turbo": 3000,
+    "gpt-4": 3000,
+    "gpt-4-32k": 6000,
+    "gpt-4-turbo": 6000,
+    "gpt-4-1106": 6000,
+    "gpt-4-0125": 6000,
+    "gpt-4o": 6000,
+}
+
+TOKENS_PER_MESSAGE = 4  # role and separators added by the chat format
+
+
+def _lookup(table: dict, model: str, default: int) -> int:
+    matches = [prefix for prefix in table if model.startswith(prefix)]
+    return table[max(matches, key=len)] if matches else default
+
+
+def context_window(model: str) -> int:
+    """Context window of model in tokens"""
+    return _lookup(MODEL_CONTEXT_WINDOWS, model, 4096)
+
+
+def history_token_budget(model: str, system_tokens: int, reply_tokens: int, configured: int = 0) -> int:
+    """Tokens available for stored history on model.
+
+    Uses configured when set, the per-model default otherwise, and never more
+    than what fits next to the system prompt, a new user message and the reply.
+    """
+    budget = configured or _lookup(MODEL_HISTORY_BUDGETS, model, 2000)
+    user_message_reserve = 1000
+    fits = context_window(model) - system_tokens - reply_tokens - user_message_reserve
+    return max(0, min(budget, fits))
+
+
+class TokenCounter:
+    """Counts chat tokens for one model"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        else:
+            logger.info("tiktoken not installed, estimating token counts")
+
+    def count(self, text: str) -> int:
+        """Tokens in text"""
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        # Cyrillic averages 2-3 UTF-8 bytes per token, Latin ~4: err on the high side
+        return len(text.encode("utf-8")) // 3 + 1
+
+    def count_message(self, message: dict) -> int:
+        """Tokens one chat message adds to a request"""
+        return self.count(message["content"]) + TOKENS_PER_MESSAGE
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Per-update tracing for the Financial Advisor Bot
+Records how long each stage of answering a message took and logs every trace as one JSON line
+"""
+
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("trace", default=None)
+
+
+class Trace:
+    """Spans of one update, timed with time.perf_counter() and reported relative to started"""
+
+    __slots__ = ("trace_id", "name", "attributes", "started", "handled", "spans")
+
+    def __init__(self, trace_id: str, name: str, started: float, handled: float, attributes: dict):
+        self.trace_id = trace_id
+        self.name = name
+        self.attributes = attributes
+        self.started = started  # when the update reached the process, if known, else handled
+        self.handled = handled  # when the handler started
+        self.spans = []
+
+    def add_span(self, name: str, start: float, end: float, **attributes):
+        self.spans.append((name, start, end, attributes))
+
+    def to_dict(self, finished: float) -> dict:
+        record = {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            **self.attributes,
+            "duration_ms": round((finished - self.started) * 1000, 1),
+            "spans": [],
+        }
+        for name, start, end, attributes in self.spans:
+            record["spans"].append({
+                "name": name,
+                "start_ms": round((start - self.started) * 1000, 1),
+                "duration_ms": round((end - start) * 1000, 1),
+                **attributes,
+            })
+        return record
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time the block as a span of the current trace; a no-op outside a trace.
+
+    Yields the span's attribute dict so the block can add results such as
+    token counts. An exception escaping the block is recorded as its error.
+    """
+    trace = _current.get()
+    if trace is None:
+        yield attributes
+        return
+    started = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        trace.add_span(name, started, time.perf_counter(), **attributes)
+
+
+def annotate(**attributes):
+    """Add attributes to the current trace, if any"""
+    trace = _current.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+class Tracer:
+    """Creates a trace per update and logs it as JSON when the update is done.
+
+    received(update_id) stamps updates as they arrive (e.g. on the webhook),
+    so the time they wait in the application's queue shows up as a "queue"
+    span. A sample_rate share of traces is logged; traces slower than
+    slow_after seconds are always logged.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, slow_after: float = None, max_received: int = 10000):
+        self.sample_rate = sample_rate
+        self.slow_after = slow_after
+        self.max_received = max_received
+        self._received = OrderedDict()  # update_id -> perf_counter() on arrival
+        self._ids = itertools.count(1)
+        self._prefix = f"{os.getpid():x}-{int(time.time()):x}"
+        self.exported = 0
+
+    def received(self, update_id):
+        self._received[update_id] = time.perf_counter()
+        while len(self._received) > self.max_received:
+            self._received.popitem(last=False)
+
+    def start(self, name: str, update_id=None, **attributes) -> Trace:
+        """New trace for an update whose handler starts now"""
+        now = time.perf_counter()
+        received = self._received.pop(update_id, None) if update_id is not None else None
+        trace = Trace(f"{self._prefix}-{next(self._ids)}", name, received or now, now, attributes)
+        if update_id is not None:
+            trace.attributes["update_id"] = update_id
+        if received is not None:
+            trace.add_span("queue", received, now)
+        return trace
+
+    @contextmanager
+    def activate(self, trace: Trace):
+        """Make trace current for the block, then finish it"""
+        token = _current.set(trace)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.attributes.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            _current.reset(token)
+            self.finish(trace)
+
+    def finish(self, trace: Trace):
+        finished = time.perf_counter()
+        slow = self.slow_after is not None and finished - trace.started >= self.slow_after
+        if not slow and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            return
+        self.exported += 1
+        logger.info(json.dumps(trace.to_dict(finished), ensure_ascii=False, default=str))
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Per-user serialization for the Financial Advisor Bot
+Lets updates of different users run concurrently while each user's turns run one at a time, in arrival order
+"""
+
+import asyncio
+import contextlib
+
+
+class _Entry:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0  # holder plus waiters
+
+
+class UserLocks:
+    """One asyncio.Lock per user, created on demand and dropped once nobody holds or waits for it.
+
+    asyncio.Lock wakes waiters first-come first-served, so turns of one
+    user run in the order they reached hold(). Memory is bounded by the
+    users with a turn in progress, not by everyone who ever wrote.
+    """
+
+    def __init__(self):
+        self._entries = {}  # user_id -> _Entry
+        self.contended = 0  # turns that had to wait for an earlier turn of the same user
+
+    @contextlib.asynccontextmanager
+    async def hold(self, user_id):
+        """Run the body while no other turn of user_id runs"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._entries[user_id] = _Entry()
+        else:
+            self.contended += 1
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if not entry.users:
+                del self._entries[user_id]
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        return {
+            "active_users": len(self._entries),
+            "waiting": sum(entry.users - 1 for entry in self._entries.values()),
+            "contended": self.contended,
+        }
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Async HTTP server for the Financial Advisor Bot
+Serves health, readiness, stats, metrics and admin profiling endpoints and receives Telegram webhook updates on the
+bot's event loop
+"""
+
+import hmac
+import json
+import logging
+from aiohttp import web
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+
+class WebServer:
+    """Single aiohttp server on PORT shared by webhook and monitoring endpoints"""
+
+    def __init__(self, port: int, stats=None, metrics=None, checks=None, health=None, profiler=None,
+                 admin_token: str = None, max_profile_seconds: float = 60.0, busy=None):
+        self.port = port
+        self.stats = stats  # callable returning a JSON-serializable dict
+        self.metrics = metrics  # callable returning Prometheus exposition text
+        self.checks = checks  # callable returning {component: initialized?} for /ready
+        self.health = health  # callable returning dependency states reported (not enforced) on /health
+        self.profiler = profiler  # SamplingProfiler behind /debug/profile
+        self.admin_token = admin_token  # bearer token for /debug endpoints; unset disables them
+        self.max_profile_seconds = max_profile_seconds
+        self.busy = busy  # callable telling whether a user still has work in progress, for /busy
+        self.ready = False  # flipped by the bot once it can process updates
+        self.application = None
+        self.secret_token = None
+        self.on_update = None  # called with each webhook update_id as it arrives
+        self.app = web.Application()
+        self.app.router.add_get("/", self.handle_index)
+        self.app.router.add_get("/health", self.handle_health)
+        self.app.router.add_get("/ready", self.handle_ready)
+        self.app.router.add_get("/stats", self.handle_stats)
+        self.app.router.add_get("/metrics", self.handle_metrics)
+        self.app.router.add_get("/debug/profile", self.handle_profile)
+        self.app.router.add_post("/busy", self.handle_busy)
+        self._runner = None
+
+    def add_webhook(self, path: str, application, secret_token: str = None):
+        """Accept Telegram updates POSTed to path and queue them on application"""
+        self.application = application
+        self.secret_token = secret_token
+        self.app.router.add_post(path, self.handle_webhook)
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "0.0.0.0", self.port).start()
+        logger.info(f"Web server started on port {self.port}")
+
+    async def stop(self):
+        self.ready = False
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle_index(self, request: web.Request) -> web.Response:
+        return web.Response(text="<h1>Financial Advisor Bot is Running!</h1>", content_type="text/html")
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """Liveness: the process and its event loop respond"""
+        if self.health is None:
+            return web.Response(text="Bot is running!")
+        return web.json_response({"status": "running", **self.health()})
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        """Readiness: only route traffic here once updates can be processed"""
+        if self.checks is None:
+            if not self.ready:
+                return web.Response(status=503, text="Starting")
+            return web.Response(text="Ready")
+        checks = dict(self.checks(), started=self.ready)
+        return web.json_response(checks, status=200 if all(checks.values()) else 503)
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats() if self.stats is not None else {})
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        body = self.metrics() if self.metrics is not None else ""
+        return web.Response(
+            body=body.encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def handle_profile(self, request: web.Request) -> web.Response:
+        """Admin only: profile the event loop for ?seconds=N and return collapsed stacks"""
+        if self.profiler is None or not self.admin_token:
+            return web.Response(status=404)
+        received = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(received, f"Bearer {self.admin_token}"):
+            return web.Response(status=403)
+        try:
+            seconds = float(request.query.get("seconds", 10))
+        except ValueError:
+            return web.Response(status=400, text="seconds must be a number")
+        if not 0 < seconds <= self.max_profile_seconds:
+            return web.Response(status=400, text=f"seconds must be in (0, {self.max_profile_seconds:g}]")
+        try:
+            stacks = await self.profiler.profile(seconds)
+        except RuntimeError as e:
+            return web.Response(status=409, text=str(e))
+        logger.info(f"🔥 Served a {seconds:g}s event loop profile")
+        return web.Response(text=stacks)
+
+    async def handle_busy(self, request: web.Request) -> web.Response:
+        """Shard handover: which of the POSTed {"users": [...]} still have turns or writes in progress here"""
+        if self.busy is None or self.secret_token is None:
+            return web.Response(status=404)  # never unauthenticated: needs the webhook secret
+        received = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(received, self.secret_token):
+            return web.Response(status=403)
+        try:
+            users = (await request.json())["users"]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            return web.Response(status=400)
+        return web.json_response({"busy": [user_id for user_id in users if self.busy(user_id)]})
+
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        """Queue one Telegram update and acknowledge immediately"""
+        if self.secret_token is not None:
+            received = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not hmac.compare_digest(received, self.secret_token):
+                return web.Response(status=403)
+        try:
+            data = await request.json()
+        except json.JSONDecodeError:
+            return web.Response(status=400)
+        if self.on_update is not None:
+            self.on_update(data.get("update_id"))
+        await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+        return web.Response()